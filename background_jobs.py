@@ -0,0 +1,111 @@
+"""
+Фоновые периодические задачи бота (JobQueue не используется).
+Каждая задача выполняется в отдельном потоке со своим подключением к БД,
+чтобы тяжелые запросы не блокировали обработку обновлений
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+import pytz
+from backup import create_backup
+from config import (
+    LEDGER_SNAPSHOT_INTERVAL, ARCHIVE_AFTER_MONTHS, ARCHIVE_INTERVAL, BACKUP_INTERVAL,
+    MAINTENANCE_CHECK_INTERVAL, OPENING_TIME, CLOSING_TIME
+)
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+def month_start_ago(months: int) -> str:
+    """Начало месяца, отстоящего на months месяцев от текущего (ГГГГ-ММ-01, по Москве)"""
+    now = datetime.now(pytz.timezone('Europe/Moscow'))
+    month_index = now.year * 12 + now.month - 1 - months
+    return f"{month_index // 12}-{month_index % 12 + 1:02d}-01"
+
+
+def ledger_snapshot_job(db: Database):
+    """Сворачивает завершенные месяцы бонусного леджера"""
+    months = db.build_ledger_snapshot()
+    if months:
+        logger.info(f"📒 Леджер: свернуто месяцев - {months}")
+
+
+def archive_job(db: Database):
+    """Переносит старые закрытые данные в архивную БД, чтобы основная оставалась маленькой"""
+    if not ARCHIVE_AFTER_MONTHS:
+        return
+
+    moved = db.archive_old_data(month_start_ago(ARCHIVE_AFTER_MONTHS))
+    moved = {table: count for table, count in moved.items() if count}
+    if moved:
+        logger.info(f"📦 Перенесено в архив: {moved}")
+
+
+def backup_job(db: Database):
+    """Сжатая резервная копия основной и архивной БД"""
+    create_backup(db.conn)
+
+
+def is_off_hours(now) -> bool:
+    """Заведение закрыто (учитывает график через полночь)"""
+    opening = datetime.strptime(OPENING_TIME, '%H:%M').time()
+    closing = datetime.strptime(CLOSING_TIME, '%H:%M').time()
+    if opening < closing:
+        return not opening <= now < closing
+    return closing <= now < opening
+
+
+def maintenance_job(db: Database):
+    """Обслуживание БД раз в сутки в нерабочее время"""
+    now = datetime.now(pytz.timezone('Europe/Moscow'))
+    if not is_off_hours(now.time()):
+        return
+
+    last_run = db.get_last_maintenance_at()
+    if last_run and last_run > (now - timedelta(hours=20)).strftime('%Y-%m-%d %H:%M:%S'):
+        return
+
+    stats = db.run_maintenance()
+    logger.info(
+        f"🧹 Обслуживание БД ({stats['actions']}) за {stats['duration']} сек.: "
+        f"файл {stats['file_size'] / 1024 / 1024:.1f} МБ, страниц {stats['page_count']}, "
+        f"свободных {stats['freelist_count']}, освобождено {stats['freed_pages']}"
+    )
+
+
+class BackgroundJobs:
+    def __init__(self):
+        self._jobs = []
+        self._tasks = []
+
+    def register(self, name: str, interval: float, func):
+        """func(db) вызывается раз в interval секунд, первый раз - сразу после запуска"""
+        self._jobs.append((name, interval, func))
+
+    def start(self):
+        for name, interval, func in self._jobs:
+            self._tasks.append(asyncio.create_task(self._run_periodic(name, interval, func)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run_periodic(self, name: str, interval: float, func):
+        db = Database()
+        while True:
+            try:
+                await asyncio.to_thread(func, db)
+            except Exception as e:
+                logger.error(f"❌ Ошибка фоновой задачи {name}: {e}")
+            await asyncio.sleep(interval)
+
+
+# Глобальный набор фоновых задач
+background_jobs = BackgroundJobs()
+background_jobs.register("ledger_snapshot", LEDGER_SNAPSHOT_INTERVAL, ledger_snapshot_job)
+background_jobs.register("archive", ARCHIVE_INTERVAL, archive_job)
+background_jobs.register("backup", BACKUP_INTERVAL, backup_job)
+background_jobs.register("maintenance", MAINTENANCE_CHECK_INTERVAL, maintenance_job)
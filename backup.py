@@ -0,0 +1,140 @@
+"""
+Резервное копирование БД через sqlite3 backup API (безопасно при работающем боте)
+
+Восстановление (бот должен быть остановлен):
+    python backup.py restore                    - из последней копии
+    python backup.py restore 20250101_030000    - из копии с указанной меткой времени
+Ручное создание копии:
+    python backup.py
+"""
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from config import DB_NAME, ARCHIVE_DB_NAME, BACKUP_DIR, BACKUP_KEEP, BACKUP_WARN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Схема подключения -> файл БД, копия которого создается
+BACKUP_SOURCES = {'main': DB_NAME, 'archive': ARCHIVE_DB_NAME}
+
+
+def _backup_prefix(db_path: str) -> str:
+    return Path(db_path).stem + '_'
+
+
+def _backup_path(db_path: str, stamp: str) -> Path:
+    return Path(BACKUP_DIR) / f"{_backup_prefix(db_path)}{stamp}.db.gz"
+
+
+def _list_backups(db_path: str):
+    """Копии файла БД от новых к старым"""
+    prefix = _backup_prefix(db_path)
+    backups = [path for path in Path(BACKUP_DIR).glob(f"{prefix}*.db.gz")
+               if path.name[len(prefix):-len('.db.gz')].replace('_', '').isdigit()]
+    return sorted(backups, reverse=True)
+
+
+def _compress(source: Path, target: Path):
+    partial = target.with_name(target.name + '.part')
+    with open(source, 'rb') as src, gzip.open(partial, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(partial, target)
+
+
+def create_backup(conn: sqlite3.Connection):
+    """
+    Копирует main и attached archive. Вызывается в отдельном потоке. Возвращает список созданных файлов
+    """
+    Path(BACKUP_DIR).mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+    created = []
+
+    for schema, db_path in BACKUP_SOURCES.items():
+        if schema not in attached:
+            continue
+
+        started = time.monotonic()
+        target = _backup_path(db_path, stamp)
+        with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as tmp_dir:
+            raw_path = Path(tmp_dir) / 'snapshot.db'
+            raw = sqlite3.connect(raw_path)
+            try:
+                # Одним шагом: копия читается с одного снимка WAL, и запись других соединений ее не прерывает.
+                # Пошаговое копирование начинается заново после каждой такой записи и под нагрузкой
+                # может не завершиться никогда
+                conn.backup(raw, pages=-1, name=schema)
+            finally:
+                raw.close()
+            raw_size = raw_path.stat().st_size
+            _compress(raw_path, target)
+
+        duration = time.monotonic() - started
+        logger.info(
+            f"💾 Резервная копия {target.name}: {raw_size / 1024 / 1024:.1f} МБ -> "
+            f"{target.stat().st_size / 1024 / 1024:.1f} МБ за {duration:.1f} сек."
+        )
+        if duration > BACKUP_WARN_SECONDS:
+            logger.warning(f"⚠️ Резервная копия {target.name} заняла {duration:.0f} сек. (порог {BACKUP_WARN_SECONDS} сек.)")
+        created.append(target)
+
+        for old_backup in _list_backups(db_path)[BACKUP_KEEP:]:
+            old_backup.unlink()
+
+    return created
+
+
+def restore_backup(stamp: str = None):
+    """Восстанавливает БД из копии с меткой stamp (по умолчанию - последней). Бот должен быть остановлен"""
+    backups = _list_backups(DB_NAME)
+    if stamp:
+        backups = [path for path in backups if path == _backup_path(DB_NAME, stamp)]
+    if not backups:
+        print("❌ Резервная копия не найдена")
+        return False
+
+    stamp = backups[0].name[len(_backup_prefix(DB_NAME)):-len('.db.gz')]
+    for db_path in BACKUP_SOURCES.values():
+        source = _backup_path(db_path, stamp)
+        if not source.exists():
+            continue
+
+        with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as tmp_dir:
+            raw_path = Path(tmp_dir) / 'restore.db'
+            with gzip.open(source, 'rb') as src, open(raw_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            raw = sqlite3.connect(raw_path)
+            try:
+                if raw.execute('PRAGMA integrity_check').fetchone()[0] != 'ok':
+                    print(f"❌ Копия {source.name} повреждена, восстановление отменено")
+                    return False
+                # Через backup API, а не заменой файла: корректно учитывает WAL целевой БД
+                target = sqlite3.connect(db_path)
+                try:
+                    raw.backup(target)
+                finally:
+                    target.close()
+            finally:
+                raw.close()
+
+        print(f"✅ {db_path} восстановлена из {source.name}")
+
+    return True
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'restore':
+        sys.exit(0 if restore_backup(sys.argv[2] if len(sys.argv) > 2 else None) else 1)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    from database import Database
+    for path in create_backup(Database().conn):
+        print(f"✅ {path}")
@@ -0,0 +1,507 @@
+# benchmark_database.py
+"""
+Нагрузочный замер методов Database и MenuManager на синтетических данных.
+
+Данные генерируются во временный файл SQLite (рабочая БД не затрагивается). При масштабе 1.0 это
+100 тыс. пользователей, 2 млн позиций заказов, 5 лет ежедневных смен и 500 тыс. бронирований.
+
+    python benchmark_database.py                          - масштаб 0.05, сравнение с benchmark_baseline.json
+    python benchmark_database.py --scale 1 --repeat 20    - полный объем
+    python benchmark_database.py --save-baseline          - записать результаты как новую базовую линию
+    python benchmark_database.py --db /tmp/bench.db       - сохранить/переиспользовать сгенерированную БД
+
+Код выхода 1 - есть методы, ставшие медленнее базовой линии больше чем на --tolerance
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Объемы при --scale 1.0
+FULL_SCALE = {
+    'users': 100_000,
+    'order_items': 2_000_000,
+    'years': 5,
+    'bookings': 500_000,
+}
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+FIRST_NAMES = ['Иван', 'Алексей', 'Мария', 'Анна', 'Дмитрий', 'Ольга', 'Сергей', 'Екатерина', 'Артём', 'Фёдор']
+LAST_NAMES = ['Иванов', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов', 'Лебедева', 'Козлов', 'Новикова', 'Орлов']
+PAYMENT_METHODS = ['qr', 'card', 'cash', 'transfer']
+BOOKING_STATUSES = ['pending'] + ['confirmed'] * 6 + ['cancelled'] * 3
+
+# Методы, которые не замеряются: миграции, обслуживание и разрушающие операции
+SKIPPED_METHODS = {
+    'create_tables', 'create_miniapp_tables', 'fix_menu_categories', 'populate_menu_items', 'attach_archive',
+    'add_payment_method_column', 'add_order_version_column', 'add_shift_summary_column', 'add_username_column',
+    'create_user_search_index', 'create_dashboard_triggers', 'create_report_triggers',
+    'run_maintenance', 'archive_old_data', 'archive_ledger_transactions', 'build_ledger_snapshot',
+    'close_shift', 'create_shift', 'save_shift_sales', 'save_shift_summary', 'close_order',
+    'delete_menu_item', 'restore_menu_item', 'update_menu_item', 'add_menu_item',
+    'update_order', 'delete_one_order_item', 'bump_order_version',
+    # Разовые записи: каждый вызов добавляет строки, повторение искажает данные
+    'add_user', 'add_transaction', 'create_booking', 'create_miniapp_booking', 'create_bonus_request',
+    'create_bonus_request_if_covered', 'update_bonus_request', 'approve_bonus_request', 'award_referral_bonus',
+    'add_pending_deletions', 'remove_pending_deletions', 'remove_item_from_order', 'update_user_balance',
+    'create_broadcast_job', 'save_broadcast_progress', 'set_broadcast_progress_message', 'finish_broadcast_job',
+    'add_miniapp_menu_item', 'update_miniapp_menu_item', 'toggle_miniapp_menu_item', 'add_miniapp_gallery_item',
+    'set_miniapp_config',
+}
+
+
+def _batched_insert(conn, sql, rows, batch_size=10_000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def generate_dataset(db, scale, seed=42):
+    """Заполняет пустую БД синтетическими данными. Возвращает параметры для замеров (id, даты и т.п.)"""
+    rnd = random.Random(seed)
+    conn = db.conn
+    users_count = max(100, int(FULL_SCALE['users'] * scale))
+    items_count = max(1_000, int(FULL_SCALE['order_items'] * scale))
+    bookings_count = max(100, int(FULL_SCALE['bookings'] * scale))
+    days = FULL_SCALE['years'] * 365
+    started = time.perf_counter()
+
+    menu = [(name, price, category) for _, name, price, category, is_active in db.get_all_menu_items() if is_active]
+    if not menu:
+        from menu_manager import MenuManager
+        menu = MenuManager().get_all_items_with_categories()
+
+    first_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
+    def user_rows():
+        for index in range(1, users_count + 1):
+            registered = first_day + timedelta(minutes=rnd.randrange(days * 24 * 60))
+            yield (
+                1_000_000_000 + index, rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES),
+                f"+79{rnd.randrange(10 ** 9):09d}", rnd.randrange(0, 3000),
+                registered.strftime('%Y-%m-%d %H:%M:%S'), f"user{index}" if rnd.random() < 0.6 else None
+            )
+
+    with conn:
+        _batched_insert(conn, '''
+            INSERT INTO users (telegram_id, first_name, last_name, phone, bonus_balance, registration_date, username)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', user_rows())
+
+    # Ежедневные смены 18:00-04:00, заказы и позиции равномерно по сменам
+    orders_count = max(days, items_count // 4)
+    orders_per_shift = max(1, orders_count // days)
+    items_per_order = max(1, items_count // (orders_per_shift * days))
+    order_id = 0
+    shift_rows, order_rows, item_rows, sales_rows, spend_rows = [], [], [], [], []
+
+    for day in range(days):
+        opened = first_day + timedelta(days=day, hours=18)
+        closed = opened + timedelta(hours=10)
+        shift_id = day + 1
+        sales = {}
+        revenue = 0
+        for _ in range(orders_per_shift):
+            order_id += 1
+            created = opened + timedelta(minutes=rnd.randrange(9 * 60))
+            order_rows.append((order_id, rnd.randint(1, 20), 1, 'closed', created.strftime('%Y-%m-%d %H:%M:%S'),
+                               (created + timedelta(minutes=50)).strftime('%Y-%m-%d %H:%M:%S'),
+                               rnd.choice(PAYMENT_METHODS)))
+            for _ in range(items_per_order):
+                name, price, _ = rnd.choice(menu)
+                quantity = rnd.randint(1, 3)
+                item_rows.append((order_id, name, price, quantity, created.strftime('%Y-%m-%d %H:%M:%S')))
+                data = sales.setdefault(name, [0, 0])
+                data[0] += quantity
+                data[1] += price * quantity
+                revenue += price * quantity
+        shift_rows.append((shift_id, day % 31 + 1 + day // 31 * 100, opened.strftime('%Y-%m'), 1,
+                           opened.strftime('%Y-%m-%d %H:%M:%S'), closed.strftime('%Y-%m-%d %H:%M:%S'),
+                           revenue, orders_per_shift, 'closed'))
+        sales_rows.extend((shift_id, name, quantity, amount) for name, (quantity, amount) in sales.items())
+        spend_rows.append((rnd.randint(1, users_count), rnd.randrange(50, 500), 'spend', 'Списание бонусов',
+                           (opened + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S')))
+
+    with conn:
+        conn.executemany('''
+            INSERT INTO shifts (id, shift_number, month_year, admin_id, opened_at, closed_at,
+                                total_revenue, total_orders, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', shift_rows)
+        _batched_insert(conn, '''
+            INSERT INTO orders (id, table_number, admin_id, status, created_at, closed_at, payment_method)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', order_rows)
+        _batched_insert(conn, '''
+            INSERT INTO order_items (order_id, item_name, price, quantity, added_at) VALUES (?, ?, ?, ?, ?)
+        ''', item_rows)
+        _batched_insert(conn, '''
+            INSERT INTO shift_sales (shift_id, item_name, quantity, total_amount) VALUES (?, ?, ?, ?)
+        ''', sales_rows)
+        _batched_insert(conn, '''
+            INSERT INTO transactions (user_id, amount, type, description, date) VALUES (?, ?, ?, ?, ?)
+        ''', spend_rows)
+
+    def booking_rows():
+        for _ in range(bookings_count):
+            user_id = rnd.randint(1, users_count)
+            booking_day = first_day + timedelta(days=rnd.randrange(days + 30))
+            yield (user_id, rnd.choice(FIRST_NAMES), f"+79{rnd.randrange(10 ** 9):09d}",
+                   booking_day.strftime('%d.%m.%Y'), f"{rnd.randint(12, 23)}:00", rnd.randint(1, 8), '',
+                   rnd.choice(BOOKING_STATUSES), (booking_day - timedelta(days=2)).strftime('%Y-%m-%d %H:%M:%S'))
+
+    def earn_rows():
+        for _ in range(users_count * 3):
+            date = first_day + timedelta(minutes=rnd.randrange(days * 24 * 60))
+            yield (rnd.randint(1, users_count), rnd.randrange(10, 300), 'earn', 'Начисление за заказ',
+                   date.strftime('%Y-%m-%d %H:%M:%S'))
+
+    with conn:
+        _batched_insert(conn, '''
+            INSERT INTO bookings (user_id, customer_name, customer_phone, booking_date, booking_time, guests,
+                                  comment, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', booking_rows())
+        _batched_insert(conn, '''
+            INSERT INTO transactions (user_id, amount, type, description, date) VALUES (?, ?, ?, ?, ?)
+        ''', earn_rows())
+        _batched_insert(conn, '''
+            INSERT INTO bonus_requests (user_id, amount, status, created_at) VALUES (?, ?, ?, ?)
+        ''', ((rnd.randint(1, users_count), rnd.randrange(100, 1000), 'pending' if rnd.random() < 0.05 else 'approved',
+               db.get_moscow_time()) for _ in range(max(10, users_count // 20))))
+
+    # Активная смена с открытым заказом - для методов текущей смены и изменения заказа
+    admin_id = 1
+    db.create_shift(admin_id)
+    active_order_id = conn.execute('''
+        INSERT INTO orders (table_number, admin_id, status, created_at) VALUES (?, ?, 'active', ?)
+    ''', (99, admin_id, db.get_moscow_time())).lastrowid
+    conn.commit()
+    conn.execute('ANALYZE')
+
+    last_shift = shift_rows[-1]
+    sample_user = conn.execute('SELECT id, telegram_id, first_name FROM users WHERE id = ?',
+                               (users_count // 2,)).fetchone()
+    sample_order = order_rows[len(order_rows) // 2]
+    print(f"📦 Данные сгенерированы за {time.perf_counter() - started:.1f} сек.: пользователей {users_count}, "
+          f"заказов {order_id}, позиций {len(item_rows)}, смен {days}, бронирований {bookings_count}")
+
+    return {
+        'user_id': sample_user[0],
+        'telegram_id': sample_user[1],
+        'first_name': sample_user[2],
+        'shift_id': last_shift[0],
+        'shift_number': last_shift[1],
+        'month_year': last_shift[2],
+        'year': last_shift[2][:4],
+        'month': last_shift[2][5:],
+        'shift_opened_at': last_shift[4],
+        'order_id': sample_order[0],
+        'order_date': sample_order[4][:10],
+        'table_number': 99,
+        'active_order_id': active_order_id,
+        'booking_date': datetime.strptime(sample_order[4][:10], '%Y-%m-%d').strftime('%d.%m.%Y'),
+        'booking_id': 1,
+        'item_name': menu[0][0],
+        'category': menu[0][2],
+    }
+
+
+def benchmark_cases(db, menu_manager, ctx):
+    """Название -> вызов без аргументов. Тяжелые списочные методы тоже здесь: именно их рост и ищем"""
+    c = ctx
+    return {
+        # Пользователи и бонусы
+        'Database.get_user': lambda: db.get_user(c['telegram_id']),
+        'Database.get_user_by_id': lambda: db.get_user_by_id(c['user_id']),
+        'Database.get_user_by_telegram_id': lambda: db.get_user_by_telegram_id(c['telegram_id']),
+        'Database.search_users(name)': lambda: db.search_users(c['first_name'], 20),
+        'Database.search_users(telegram_id)': lambda: db.search_users(str(c['telegram_id']), 20),
+        'Database.get_users_page': lambda: db.get_users_page(),
+        'Database.get_users_count': lambda: db.get_users_count(),
+        'Database.iter_users': lambda: sum(1 for _ in db.iter_users(columns=('id',))),
+        'Database.get_all_users': lambda: db.get_all_users(),
+        'Database.update_username': lambda: db.update_username(c['telegram_id'], 'benchmark'),
+        'Database.credit_bonus': lambda: db.credit_bonus(c['user_id'], 1, 'Замер'),
+        'Database.debit_bonus': lambda: db.debit_bonus(c['user_id'], 1, 'Замер'),
+        'Database.get_referrer_stats': lambda: db.get_referrer_stats(c['user_id']),
+        'Database.get_pending_requests': lambda: db.get_pending_requests(),
+        'Database.get_dashboard_stats': lambda: db.get_dashboard_stats(),
+        'Database.get_dashboard_version': lambda: db.get_dashboard_version(),
+        'Database.count_broadcast_recipients': lambda: db.count_broadcast_recipients(),
+        'Database.get_broadcast_recipients': lambda: db.get_broadcast_recipients(0, 100),
+        'Database.get_ledger_folded_until': lambda: db.get_ledger_folded_until(),
+        # Бронирования
+        'Database.get_booking_stats': lambda: db.get_booking_stats(),
+        'Database.get_bookings_by_status': lambda: db.get_bookings_by_status('pending'),
+        'Database.get_bookings_by_date': lambda: db.get_bookings_by_date(c['booking_date']),
+        'Database.get_all_bookings_sorted': lambda: db.get_all_bookings_sorted(),
+        'Database.get_bookings_page': lambda: db.get_bookings_page('confirmed'),
+        'Database.get_booking_dates': lambda: db.get_booking_dates(),
+        'Database.get_user_bookings': lambda: db.get_user_bookings(c['user_id']),
+        'Database.get_miniapp_user_bookings': lambda: db.get_miniapp_user_bookings(c['user_id']),
+        'Database.get_or_create_miniapp_user': lambda: db.get_or_create_miniapp_user({'id': c['telegram_id']}),
+        'Database.update_booking_status': lambda: db.update_booking_status(c['booking_id'], 'confirmed'),
+        # Заказы
+        'Database.get_order_by_id': lambda: db.get_order_by_id(c['order_id']),
+        'Database.get_order_version': lambda: db.get_order_version(c['order_id']),
+        'Database.update_order_payment_method': lambda: db.update_order_payment_method(c['order_id'], 'card'),
+        'Database.get_active_orders': lambda: db.get_active_orders(),
+        'Database.get_active_order_by_table': lambda: db.get_active_order_by_table(c['table_number']),
+        'Database.get_orders_by_date': lambda: db.get_orders_by_date(c['order_date'], 'closed'),
+        'Database.get_all_closed_orders': lambda: db.get_all_closed_orders(),
+        'Database.get_order_dates': lambda: db.get_order_dates(),
+        'Database.get_orders_by_shift_id': lambda: db.get_orders_by_shift_id(c['shift_id']),
+        'Database.get_shift_order_items': lambda: db.get_shift_order_items(c['shift_opened_at']),
+        'Database.iter_shift_order_lines(month)': lambda: sum(
+            1 for _ in db.iter_shift_order_lines(month_year=c['month_year'])),
+        # Смены и отчеты
+        'Database.get_next_shift_number': lambda: db.get_next_shift_number(),
+        'Database.get_active_shift': lambda: db.get_active_shift(),
+        'Database.get_shift_by_number_and_month': lambda: db.get_shift_by_number_and_month(
+            c['shift_number'], c['month_year']),
+        'Database.get_shift_by_number': lambda: db.get_shift_by_number(c['shift_number']),
+        'Database.get_shift_sales': lambda: db.get_shift_sales(c['shift_number'], c['month_year']),
+        'Database.get_shift_summary': lambda: db.get_shift_summary(c['shift_number'], c['month_year']),
+        'Database.get_shift_years': lambda: db.get_shift_years(),
+        'Database.get_shift_months': lambda: db.get_shift_months(c['year']),
+        'Database.get_shifts_by_year_month': lambda: db.get_shifts_by_year_month(c['year'], c['month']),
+        'Database.get_all_shifts_sorted': lambda: db.get_all_shifts_sorted(),
+        'Database.get_all_shifts': lambda: db.get_all_shifts(),
+        'Database.get_all_shifts_debug': lambda: db.get_all_shifts_debug(),
+        'Database.get_shifts_by_month': lambda: db.get_shifts_by_month(c['month_year']),
+        'Database.get_shifts_by_period': lambda: db.get_shifts_by_period('year'),
+        'Database.get_current_month_year': lambda: db.get_current_month_year(),
+        'Database.get_sales_statistics_by_period': lambda: db.get_sales_statistics_by_period('year'),
+        'Database.get_total_revenue_by_period': lambda: db.get_total_revenue_by_period('year'),
+        'Database.get_sales_statistics_by_year': lambda: db.get_sales_statistics_by_year(c['year']),
+        'Database.get_total_revenue_by_year': lambda: db.get_total_revenue_by_year(c['year']),
+        'Database.get_sales_statistics_by_year_month': lambda: db.get_sales_statistics_by_year_month(
+            c['year'], c['month']),
+        'Database.get_total_revenue_by_year_month': lambda: db.get_total_revenue_by_year_month(c['year'], c['month']),
+        'Database.get_spent_bonuses_by_shift': lambda: db.get_spent_bonuses_by_shift(c['shift_number'], c['month_year']),
+        'Database.get_spent_bonuses_by_month': lambda: db.get_spent_bonuses_by_month(c['year'], c['month']),
+        'Database.get_spent_bonuses_by_year': lambda: db.get_spent_bonuses_by_year(c['year']),
+        'Database.get_spent_bonuses_by_period': lambda: db.get_spent_bonuses_by_period('year'),
+        'Database.get_payment_statistics_by_shift': lambda: db.get_payment_statistics_by_shift(
+            c['shift_number'], c['month_year']),
+        'Database.get_payment_statistics_by_month': lambda: db.get_payment_statistics_by_month(c['year'], c['month']),
+        'Database.get_payment_statistics_by_year': lambda: db.get_payment_statistics_by_year(c['year']),
+        'Database.get_payment_statistics_by_period': lambda: db.get_payment_statistics_by_period('year'),
+        'Database.get_report_version': lambda: db.get_report_version(),
+        # Меню и MiniApp
+        'Database.get_menu_version': lambda: db.get_menu_version(),
+        'Database.get_all_menu_categories': lambda: db.get_all_menu_categories(),
+        'Database.get_menu_items_by_category': lambda: db.get_menu_items_by_category(c['category']),
+        'Database.get_all_menu_items': lambda: db.get_all_menu_items(),
+        'Database.get_menu_item_by_id': lambda: db.get_menu_item_by_id(1),
+        'Database.get_menu_item_by_name': lambda: db.get_menu_item_by_name(c['item_name']),
+        'Database.get_inactive_menu_items': lambda: db.get_inactive_menu_items(),
+        'Database.get_miniapp_menu': lambda: db.get_miniapp_menu(),
+        'Database.get_miniapp_menu_item': lambda: db.get_miniapp_menu_item(1),
+        'Database.get_miniapp_config': lambda: db.get_miniapp_config(),
+        'Database.get_miniapp_gallery': lambda: db.get_miniapp_gallery(),
+        # Служебное
+        'Database.get_moscow_time': lambda: db.get_moscow_time(),
+        'Database.get_pending_deletions': lambda: db.get_pending_deletions(),
+        'Database.get_blocked_chat_ids': lambda: db.get_blocked_chat_ids(),
+        'Database.get_blocked_chats_count': lambda: db.get_blocked_chats_count(),
+        'Database.mark_chat_blocked+unmark_chat_blocked': lambda: (
+            db.mark_chat_blocked(c['telegram_id'], 'benchmark'), db.unmark_chat_blocked(c['telegram_id'])),
+        'Database.save_persistence_data': lambda: db.save_persistence_data([('bot_data', 'benchmark', '{}')]),
+        'Database.get_broadcast_job': lambda: db.get_broadcast_job(1),
+        'Database.get_persistence_data': lambda: db.get_persistence_data('bot_data'),
+        'Database.get_running_broadcast_jobs': lambda: db.get_running_broadcast_jobs(),
+        'Database.get_storage_stats': lambda: db.get_storage_stats(),
+        'Database.get_last_maintenance_at': lambda: db.get_last_maintenance_at(),
+        # MenuManager
+        'MenuManager.get_categories': lambda: menu_manager.get_categories(),
+        'MenuManager.get_items_by_category': lambda: menu_manager.get_items_by_category(c['category']),
+        'MenuManager.get_all_items_with_categories': lambda: menu_manager.get_all_items_with_categories(),
+        'MenuManager.get_item_by_name': lambda: menu_manager.get_item_by_name(c['item_name']),
+        'MenuManager.get_active_order_by_table': lambda: menu_manager.get_active_order_by_table(c['table_number']),
+        'MenuManager.get_order_items': lambda: menu_manager.get_order_items(c['order_id']),
+        'MenuManager.calculate_order_total': lambda: menu_manager.calculate_order_total(c['order_id']),
+        'MenuManager.add_item_to_order+remove_item_from_order': lambda: (
+            menu_manager.add_item_to_order(c['active_order_id'], c['item_name']),
+            menu_manager.remove_item_from_order(c['active_order_id'], c['item_name'])),
+        'MenuManager.create_order': lambda: menu_manager.create_order(c['table_number'] + 1, 1),
+        'MenuManager.get_category_keyboard': lambda: menu_manager.get_category_keyboard(),
+        'MenuManager.get_items_keyboard': lambda: menu_manager.get_items_keyboard(c['category']),
+    }
+
+
+def uncovered_methods(cases, *classes):
+    """Публичные методы, для которых нет замера и которые не исключены явно"""
+    covered = set()
+    for name in cases:
+        cls_name, _, methods = name.split('(')[0].partition('.')
+        covered |= {f"{cls_name}.{method}" for method in methods.split('+')}
+    missing = []
+    for cls in classes:
+        for name in dir(cls):
+            if name.startswith('_') or not callable(getattr(cls, name)) or name in SKIPPED_METHODS:
+                continue
+            if f"{cls.__name__}.{name}" not in covered:
+                missing.append(f"{cls.__name__}.{name}")
+    return missing
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по ближайшему рангу"""
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def run_benchmarks(cases, warmup, repeat):
+    """Повторы идут по кругу по всем методам: колебания загрузки машины распределяются поровну,
+    а не попадают целиком на методы, замеренные в неудачный момент"""
+    cases = dict(cases)
+    for name, func in list(cases.items()):
+        try:
+            for _ in range(warmup):
+                func()
+        except Exception as e:
+            print(f"❌ {name}: {e}")
+            del cases[name]
+
+    timings = {name: [] for name in cases}
+    for _ in range(repeat):
+        for name, func in cases.items():
+            started = time.perf_counter()
+            func()
+            timings[name].append((time.perf_counter() - started) * 1000)
+
+    results = {}
+    for name, values in timings.items():
+        values.sort()
+        results[name] = {'p50': round(percentile(values, 0.5), 3), 'p95': round(percentile(values, 0.95), 3)}
+    return results
+
+
+def machine_speed_ratio(results, baseline, min_ms=1.0):
+    """Медиана отношений текущее/база по методам дольше min_ms. Общее замедление машины сдвигает все
+    методы одинаково и учитывается этим множителем, а регрессия отдельных методов медиану не меняет"""
+    ratios = [timing['p50'] / baseline[name]['p50'] for name, timing in results.items()
+              if name in baseline and baseline[name]['p50'] >= min_ms]
+    return statistics.median(ratios) if len(ratios) >= 5 else 1.0
+
+
+def compare_with_baseline(results, baseline, tolerance, min_delta_ms, speed_ratio=1.0):
+    """Печатает таблицу и возвращает список методов, ставших медленнее базовой линии.
+    speed_ratio - во сколько раз эта машина медленнее той, где снята базовая линия"""
+    regressions = []
+    print(f"\n{'Метод':<62} {'p50, мс':>10} {'p95, мс':>10} {'база p50':>10} {'изм.':>8}")
+    for name, timing in results.items():
+        base = baseline.get(name)
+        if base:
+            base = {key: value * speed_ratio for key, value in base.items()}
+        change = ''
+        if base:
+            delta = timing['p50'] - base['p50']
+            change = f"{delta / base['p50'] * 100:+.0f}%" if base['p50'] else ''
+            if delta > min_delta_ms and timing['p50'] > base['p50'] * (1 + tolerance):
+                regressions.append(name)
+                change += ' ⚠️'
+        base_p50 = f"{base['p50']:.3f}" if base else '-'
+        print(f"{name:<62} {timing['p50']:>10.3f} {timing['p95']:>10.3f} {base_p50:>10} {change:>8}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер методов Database и MenuManager на синтетических данных")
+    parser.add_argument('--scale', type=float, default=0.05, help="доля от полного объема (1.0 = 100 тыс. пользователей)")
+    parser.add_argument('--warmup', type=int, default=2, help="прогревочных вызовов на метод")
+    parser.add_argument('--repeat', type=int, default=10, help="замеряемых вызовов на метод")
+    parser.add_argument('--db', help="файл БД для данных (по умолчанию - временный); существующий переиспользуется")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="JSON с базовой линией")
+    parser.add_argument('--save-baseline', action='store_true', help="записать результаты в --baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="допустимое замедление p50 (0.25 = 25%%)")
+    parser.add_argument('--min-delta', type=float, default=0.5, help="замедления меньше стольких мс не считаются")
+    parser.add_argument('--only', help="замерять только методы, в названии которых есть эта строка")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    db_path = args.db
+    if not db_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp_dir.name, 'benchmark.db')
+    reuse = os.path.exists(db_path)
+
+    # config читает путь к БД при импорте - подменяем до импорта Database
+    os.environ['DB_NAME'] = db_path
+    os.environ['ARCHIVE_DB_NAME'] = str(Path(db_path).with_name(Path(db_path).stem + '_archive.db'))
+    from database import Database
+    from menu_manager import MenuManager
+
+    db = Database()
+    context_path = Path(db_path).with_suffix('.json')
+    if reuse and context_path.exists():
+        ctx = json.loads(context_path.read_text(encoding='utf-8'))
+        print(f"📦 Используется существующая БД {db_path}")
+    else:
+        ctx = generate_dataset(db, args.scale)
+        context_path.write_text(json.dumps({**ctx, 'scale': args.scale}, ensure_ascii=False), encoding='utf-8')
+    scale = ctx.get('scale', args.scale)
+
+    menu_manager = MenuManager()
+    cases = benchmark_cases(db, menu_manager, ctx)
+    missing = uncovered_methods(cases, Database, MenuManager)
+    if args.only:
+        cases = {name: func for name, func in cases.items() if args.only in name}
+
+    results = run_benchmarks(cases, args.warmup, args.repeat)
+
+    baseline = {}
+    speed_ratio = 1.0
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists():
+        stored = json.loads(baseline_path.read_text(encoding='utf-8'))
+        if stored.get('scale') == scale:
+            baseline = stored.get('results', {})
+            speed_ratio = machine_speed_ratio(results, baseline)
+            if abs(speed_ratio - 1) > 0.05:
+                print(f"⚙️ Общая скорость машины отличается от базовой линии: база умножена на {speed_ratio:.2f}")
+        else:
+            print(f"⚠️ Базовая линия снята при scale={stored.get('scale')}, текущий scale={scale} - сравнение пропущено")
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance, args.min_delta, speed_ratio)
+
+    if missing:
+        print(f"\n⚠️ Нет замеров для методов: {', '.join(missing)}")
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps({
+            'scale': scale,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'results': results,
+        }, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"\n✅ Базовая линия сохранена в {baseline_path}")
+
+    db.conn.close()
+    menu_manager.db.conn.close()
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+    if regressions and not args.save_baseline:
+        print(f"\n❌ Медленнее базовой линии: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
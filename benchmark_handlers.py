@@ -0,0 +1,570 @@
+# benchmark_handlers.py
+"""
+Сквозной офлайн-замер обработчиков бота без сети.
+
+Приложение PTB собирается как в main.py (setup_handlers, SQLitePersistence), но запросы к Bot API
+уходят в заглушку: вызовы записываются локально и получают правдоподобный ответ. Через приложение
+прогоняется сценарий: регистрация, бронирование, открытие смены, N заказов с оплатой, закрытие смены,
+годовой отчет и рассылка. Кнопки нажимаются так же, как это сделал бы человек: данные берутся из
+клавиатур, которые бот отправил ранее.
+
+Для каждого обработчика выводится время, число запросов к БД и вызовов Bot API. Сценарий повторяется
+--runs раз, каждый прогон - в отдельном процессе на чистой БД; времена обработчиков объединяются.
+
+    python benchmark_handlers.py                     - сценарий и сравнение с benchmark_handlers_baseline.json
+    python benchmark_handlers.py --orders 200        - больше заказов за смену
+    python benchmark_handlers.py --save-baseline     - записать результаты как новую базовую линию
+
+Запускать из корня проекта (main.py при импорте создает static/). Код выхода 1 - ошибки в обработчиках
+или регрессии: обработчик стал медленнее базовой линии либо делает больше запросов к БД / Bot API
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_BASELINE = 'benchmark_handlers_baseline.json'
+BOT_TOKEN = '123456:BENCHMARK'
+BOT_ID = 123456
+ADMIN_ID = 900000001
+CUSTOMER_ID = 900000002
+
+# Служебные операторы транзакций не считаются запросами
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+# Счетчики, которые обработчики увеличивают во время работы
+counters = Counter()
+
+
+def _count_statement(statement):
+    # Операторы внутри триггеров приходят с префиксом "-- TRIGGER"
+    if not statement.startswith('--') and not statement.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+        counters['queries'] += 1
+
+
+def install_query_counter():
+    """Все соединения sqlite3, открытые после вызова, считают выполненные запросы"""
+    connect = sqlite3.connect
+
+    @functools.wraps(connect)
+    def counting_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(_count_statement)
+        return conn
+
+    sqlite3.connect = counting_connect
+
+
+class FakeBotApi:
+    """Заглушка Bot API: записывает вызовы и помнит инлайн-клавиатуры отправленных сообщений"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._message_id = 0
+        # chat_id -> {message_id: inline_keyboard}, в порядке отправки
+        self.keyboards = defaultdict(dict)
+
+    def next_message_id(self):
+        self._message_id += 1
+        return self._message_id
+
+    def _message(self, chat_id, message_id, params):
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark'},
+            'text': params.get('text') or params.get('caption') or '',
+        }
+
+    def _remember_keyboard(self, chat_id, message_id, params):
+        keyboards = self.keyboards[chat_id]
+        keyboards.pop(message_id, None)
+        markup = params.get('reply_markup')
+        if isinstance(markup, dict) and markup.get('inline_keyboard'):
+            keyboards[message_id] = markup['inline_keyboard']
+
+    def handle(self, endpoint, params):
+        """Ответ на вызов метода Bot API (поле result)"""
+        counters['api_calls'] += 1
+        self.calls[endpoint] += 1
+        chat_id = params.get('chat_id')
+
+        if endpoint == 'getMe':
+            return {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+        if endpoint == 'getChat':
+            return {'id': chat_id, 'type': 'private'}
+        if endpoint == 'copyMessage':
+            return {'message_id': self.next_message_id()}
+        if endpoint == 'copyMessages':
+            return [{'message_id': self.next_message_id()} for _ in params.get('message_ids', [])]
+        if endpoint == 'sendMediaGroup':
+            return [self._message(chat_id, self.next_message_id(), params) for _ in params.get('media', [])]
+        if endpoint.startswith('send'):
+            message_id = self.next_message_id()
+            self._remember_keyboard(chat_id, message_id, params)
+            return self._message(chat_id, message_id, params)
+        if endpoint.startswith('edit'):
+            if 'inline_message_id' in params:
+                return True
+            self._remember_keyboard(chat_id, params['message_id'], params)
+            return self._message(chat_id, params['message_id'], params)
+        if endpoint == 'deleteMessage':
+            self.keyboards[chat_id].pop(params.get('message_id'), None)
+        elif endpoint == 'deleteMessages':
+            for message_id in params.get('message_ids', []):
+                self.keyboards[chat_id].pop(message_id, None)
+        return True
+
+    def find_button(self, chat_id, text=None, data=None, pick=0):
+        """Кнопка из последнего сообщения, где она есть: text - точный текст, data - начало callback_data.
+        Возвращает (message_id, callback_data)"""
+        for message_id, keyboard in reversed(list(self.keyboards[chat_id].items())):
+            matches = [button['callback_data'] for row in keyboard for button in row
+                       if 'callback_data' in button
+                       and (text is None or button['text'] == text)
+                       and (data is None or button['callback_data'].startswith(data))]
+            if matches:
+                return message_id, matches[pick % len(matches)]
+        return None, None
+
+    def describe_keyboards(self, chat_id, limit=3):
+        recent = list(self.keyboards[chat_id].items())[-limit:]
+        return '; '.join(f"#{message_id}: " + ', '.join(button.get('callback_data', button['text'])
+                                                        for row in keyboard for button in row)
+                         for message_id, keyboard in recent) or 'нет клавиатур'
+
+
+def make_request_class():
+    """Транспорт бота поверх FakeBotApi (telegram импортируется только после настройки окружения)"""
+    from telegram.request import BaseRequest
+
+    class FakeRequest(BaseRequest):
+        def __init__(self, api):
+            self.api = api
+
+        @property
+        def read_timeout(self):
+            return None
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                             connect_timeout=None, pool_timeout=None):
+            endpoint = url.rsplit('/', 1)[-1]
+            params = request_data.parameters if request_data else {}
+            result = self.api.handle(endpoint, params)
+            return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+    return FakeRequest
+
+
+class ScenarioError(Exception):
+    pass
+
+
+class HandlerStats:
+    """Время и счетчики по каждому обработчику и этапу сценария"""
+
+    def __init__(self):
+        self.handlers = defaultdict(lambda: {'timings': [], 'queries': 0, 'api_calls': 0})
+        self.stages = {}
+        self.errors = []
+
+    def wrap(self, callback):
+        name = callback.__qualname__.replace('.<locals>.', '.')
+
+        @functools.wraps(callback)
+        async def timed(update, context):
+            queries, api_calls = counters['queries'], counters['api_calls']
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                record = self.handlers[name]
+                record['timings'].append((time.perf_counter() - started) * 1000)
+                record['queries'] += counters['queries'] - queries
+                record['api_calls'] += counters['api_calls'] - api_calls
+
+        return timed
+
+    def instrument(self, application):
+        """Оборачивает обработчики всех групп, включая состояния ConversationHandler"""
+        from telegram.ext import ConversationHandler
+
+        def walk(handlers):
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler):
+                    walk(handler.entry_points)
+                    for state_handlers in handler.states.values():
+                        walk(state_handlers)
+                    walk(handler.fallbacks)
+                else:
+                    handler.callback = self.wrap(handler.callback)
+
+        for group_handlers in application.handlers.values():
+            walk(group_handlers)
+
+    async def on_error(self, update, context):
+        self.errors.append(f"{type(context.error).__name__}: {context.error}")
+
+
+class Scenario:
+    """Скриптованные действия пользователей: сообщения и нажатия на кнопки из клавиатур бота"""
+
+    def __init__(self, application, api, stats):
+        self.application = application
+        self.api = api
+        self.stats = stats
+        self._update_id = 0
+        self.actors = {
+            ADMIN_ID: {'id': ADMIN_ID, 'is_bot': False, 'first_name': 'Админ', 'username': 'bench_admin'},
+            CUSTOMER_ID: {'id': CUSTOMER_ID, 'is_bot': False, 'first_name': 'Гость', 'username': 'bench_guest'},
+        }
+
+    async def _process(self, data):
+        from telegram import Update
+        self._update_id += 1
+        data['update_id'] = self._update_id
+        await self.application.process_update(Update.de_json(data, self.application.bot))
+
+    async def send(self, actor_id, text):
+        message = {
+            'message_id': self.api.next_message_id(),
+            'date': int(time.time()),
+            'chat': {'id': actor_id, 'type': 'private'},
+            'from': self.actors[actor_id],
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        await self._process({'message': message})
+
+    async def press(self, actor_id, text=None, data=None, pick=0):
+        message_id, callback_data = self.api.find_button(actor_id, text, data, pick)
+        if callback_data is None:
+            raise ScenarioError(f"нет кнопки text={text!r} data={data!r}; последние клавиатуры: "
+                                f"{self.api.describe_keyboards(actor_id)}")
+        await self._process({'callback_query': {
+            'id': str(self._update_id + 1),
+            'from': self.actors[actor_id],
+            'chat_instance': str(actor_id),
+            'data': callback_data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': actor_id, 'type': 'private'},
+                'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark'},
+                'text': '',
+            },
+        }})
+
+    async def stage(self, name, steps):
+        """Этап сценария: время, число апдейтов и счетчики целиком"""
+        queries, api_calls, updates = counters['queries'], counters['api_calls'], self._update_id
+        started = time.perf_counter()
+        await steps()
+        self.stats.stages[name] = {
+            'updates': self._update_id - updates,
+            'ms': round((time.perf_counter() - started) * 1000, 1),
+            'queries': counters['queries'] - queries,
+            'api_calls': counters['api_calls'] - api_calls,
+        }
+
+    async def register(self, actor_id, first_name, last_name, phone):
+        await self.send(actor_id, '/start')
+        await self.send(actor_id, first_name)
+        await self.send(actor_id, last_name)
+        await self.send(actor_id, phone)
+        await self.send(actor_id, '✅ Подтвердить')
+
+    async def book_table(self):
+        await self.send(CUSTOMER_ID, '📅 Забронировать стол')
+        await self.press(CUSTOMER_ID, text='📅 Через неделю')
+        await self.send(CUSTOMER_ID, '20:00')
+        await self.send(CUSTOMER_ID, '4')
+
+    async def open_shift(self):
+        await self.send(ADMIN_ID, '🍽️ Управление заказами')
+        await self.press(ADMIN_ID, data='open_shift')
+
+    async def create_orders(self, count):
+        for index in range(count):
+            await self.press(ADMIN_ID, data='create_order')
+            await self.send(ADMIN_ID, str(index + 1))
+            await self.press(ADMIN_ID, data='category_', pick=index)
+            await self.press(ADMIN_ID, data='item_', pick=index)
+            await self.press(ADMIN_ID, data='back_to_category_')
+            await self.press(ADMIN_ID, data='category_', pick=index + 1)
+            await self.press(ADMIN_ID, data='item_', pick=index * 7)
+            await self.press(ADMIN_ID, data='finish_order')
+
+    async def pay_orders(self, count):
+        await self.press(ADMIN_ID, data='active_orders')
+        for index in range(count):
+            await self.press(ADMIN_ID, data='calculate_')
+            await self.press(ADMIN_ID, data='payment_', pick=index)
+
+    async def close_shift(self):
+        await self.press(ADMIN_ID, data='close_shift')
+
+    async def year_report(self):
+        year = datetime.now().year
+        await self.press(ADMIN_ID, data='order_history')
+        await self.press(ADMIN_ID, data='history_year')
+        await self.press(ADMIN_ID, data=f'history_year_{year}')
+        await self.press(ADMIN_ID, data=f'history_full_year_{year}')
+
+    async def broadcast(self):
+        from broadcast_manager import broadcast_manager
+        await self.send(ADMIN_ID, '📢 Рассылка')
+        await self.send(ADMIN_ID, 'Сегодня живая музыка с 20:00!')
+        # Рассылка идет фоном - ждем ее, чтобы учесть все отправленные копии
+        await asyncio.gather(*broadcast_manager._tasks.values(), return_exceptions=True)
+
+    async def run(self, orders):
+        await self.stage('Регистрация', lambda: self.register(CUSTOMER_ID, 'Иван', 'Петров', '+79990000002'))
+        await self.stage('Регистрация админа', lambda: self.register(ADMIN_ID, 'Анна', 'Смирнова', '+79990000001'))
+        await self.stage('Бронирование', self.book_table)
+        await self.stage('Открытие смены', self.open_shift)
+        await self.stage(f'Создание {orders} заказов', lambda: self.create_orders(orders))
+        await self.stage(f'Оплата {orders} заказов', lambda: self.pay_orders(orders))
+        await self.stage('Закрытие смены', self.close_shift)
+        await self.stage('Годовой отчет', self.year_report)
+        await self.stage('Рассылка', self.broadcast)
+
+
+def add_broadcast_recipients(db, count):
+    """Зарегистрированные пользователи, которым уйдет рассылка"""
+    with db.conn:
+        db.conn.executemany('''
+            INSERT INTO users (telegram_id, first_name, last_name, phone, registration_date, username)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(800000000 + index, 'Гость', f'№{index}', f'+7990{index:07d}', db.get_moscow_time(), None)
+              for index in range(count)])
+
+
+def merge_runs(runs):
+    """Сводит прогоны: времена обработчиков объединяются, у этапов берется медианное время"""
+    handlers = defaultdict(lambda: {'timings': [], 'queries': 0, 'api_calls': 0})
+    for run_result in runs:
+        for name, record in run_result['handlers'].items():
+            merged = handlers[name]
+            merged['timings'] += record['timings']
+            merged['queries'] += record['queries']
+            merged['api_calls'] += record['api_calls']
+
+    stages = {}
+    for name, stage in runs[0]['stages'].items():
+        stages[name] = dict(stage, ms=statistics.median(run_result['stages'][name]['ms'] for run_result in runs
+                                                        if name in run_result['stages']))
+    return handlers, stages
+
+
+def summarize(handlers, runs_count):
+    from benchmark_database import percentile
+    results = {}
+    for name, record in sorted(handlers.items()):
+        timings = sorted(record['timings'])
+        calls = len(timings)
+        results[name] = {
+            'calls': calls // runs_count,
+            'p50': round(percentile(timings, 0.5), 3),
+            'p95': round(percentile(timings, 0.95), 3),
+            'queries': round(record['queries'] / calls, 2),
+            'api_calls': round(record['api_calls'] / calls, 2),
+        }
+    return results
+
+
+def print_report(stages, results, api_methods):
+    print(f"\n{'Этап':<28} {'апдейтов':>9} {'мс':>10} {'запросов БД':>12} {'вызовов API':>12}")
+    for name, stage in stages.items():
+        print(f"{name:<28} {stage['updates']:>9} {stage['ms']:>10.1f} {stage['queries']:>12} {stage['api_calls']:>12}")
+
+    print(f"\n{'Обработчик':<52} {'вызовов':>8} {'p50, мс':>9} {'p95, мс':>9} {'БД/вызов':>9} {'API/вызов':>10}")
+    for name, result in results.items():
+        print(f"{name:<52} {result['calls']:>8} {result['p50']:>9.2f} {result['p95']:>9.2f} "
+              f"{result['queries']:>9.2f} {result['api_calls']:>10.2f}")
+
+    print("\nВызовы Bot API: " + ', '.join(f"{method} {count}" for method, count in Counter(api_methods).most_common()))
+
+
+def compare_with_baseline(results, baseline, tolerance, min_delta_ms):
+    """Регрессии: рост p50 сверх допуска или больше запросов к БД / Bot API на вызов"""
+    from benchmark_database import machine_speed_ratio
+    speed_ratio = machine_speed_ratio(results, baseline)
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        base_p50 = base['p50'] * speed_ratio
+        if result['p50'] - base_p50 > min_delta_ms and result['p50'] > base_p50 * (1 + tolerance):
+            regressions.append(f"{name}: p50 {result['p50']:.2f} мс (база {base_p50:.2f})")
+        for key, label in (('queries', 'запросов БД'), ('api_calls', 'вызовов API')):
+            if result[key] > base[key] + 0.01:
+                regressions.append(f"{name}: {label} на вызов {result[key]} (база {base[key]})")
+    return regressions
+
+
+async def run(args):
+    from telegram.ext import Application
+    from persistence import SQLitePersistence
+    from database import Database
+    from message_manager import message_manager
+    from broadcast_manager import broadcast_manager
+    from shift_stats import shift_tracker
+    from menu_manager import menu_manager
+    import main as bot_main
+
+    add_broadcast_recipients(Database(), args.users)
+
+    api = FakeBotApi()
+    request_class = make_request_class()
+    application = Application.builder() \
+        .token(BOT_TOKEN) \
+        .request(request_class(api)) \
+        .get_updates_request(request_class(api)) \
+        .persistence(SQLitePersistence()) \
+        .build()
+    bot_main.setup_handlers(application)
+
+    stats = HandlerStats()
+    stats.instrument(application)
+    application.add_error_handler(stats.on_error)
+
+    await application.initialize()
+    # Как в post_init, кроме фоновых задач обслуживания: они не относятся к обработке апдейтов
+    message_manager.start_scheduler(application.bot)
+    shift_tracker.rebuild(menu_manager.db)
+
+    scenario = Scenario(application, api, stats)
+    failed = None
+    try:
+        await scenario.run(args.orders)
+    except ScenarioError as e:
+        failed = str(e)
+    finally:
+        await broadcast_manager.stop()
+        await message_manager.stop_scheduler()
+        await application.update_persistence()
+        await application.shutdown()
+
+    return stats, api, failed
+
+
+def run_once(args):
+    """Один прогон сценария на чистой временной БД. Результат - словарь, пригодный для JSON"""
+    tmp_dir = tempfile.TemporaryDirectory()
+    # config читает окружение при импорте - настраиваем до импорта модулей бота
+    os.environ['DB_NAME'] = os.path.join(tmp_dir.name, 'benchmark.db')
+    os.environ['ARCHIVE_DB_NAME'] = os.path.join(tmp_dir.name, 'benchmark_archive.db')
+    os.environ['BOT_TOKEN'] = BOT_TOKEN
+    os.environ['ADMIN_IDS'] = str(ADMIN_ID)
+    install_query_counter()
+
+    stats, api, failed = asyncio.run(run(args))
+    tmp_dir.cleanup()
+    return {
+        'stages': stats.stages,
+        'handlers': {name: dict(record) for name, record in stats.handlers.items()},
+        'api_methods': dict(api.calls),
+        'errors': stats.errors,
+        'failed': failed,
+    }
+
+
+def run_in_subprocess(args):
+    """Прогон в отдельном процессе: модули бота держат соединение с БД с момента импорта,
+    поэтому чистую БД для каждого прогона дает только новый процесс"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, 'run.json')
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--orders', str(args.orders), '--users', str(args.users),
+             '--worker-output', output],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0 or not os.path.exists(output):
+            print(completed.stdout[-3000:], completed.stderr[-3000:], sep='\n')
+            raise SystemExit(f"❌ Прогон сценария завершился с кодом {completed.returncode}")
+        with open(output, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-замер обработчиков бота на скриптованном сценарии")
+    parser.add_argument('--orders', type=int, default=50, help="заказов за смену")
+    parser.add_argument('--users', type=int, default=50, help="дополнительных получателей рассылки")
+    parser.add_argument('--runs', type=int, default=3, help="прогонов сценария, каждый на чистой БД")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="JSON с базовой линией")
+    parser.add_argument('--save-baseline', action='store_true', help="записать результаты в --baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="допустимое замедление p50 (0.25 = 25%%)")
+    parser.add_argument('--min-delta', type=float, default=2.0, help="замедления меньше стольких мс не считаются")
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_output:
+        with open(args.worker_output, 'w', encoding='utf-8') as f:
+            json.dump(run_once(args), f, ensure_ascii=False)
+        return 0
+
+    runs = []
+    for index in range(args.runs):
+        print(f"🔄 Прогон {index + 1} из {args.runs}...")
+        runs.append(run_in_subprocess(args))
+
+    handlers, stages = merge_runs(runs)
+    results = summarize(handlers, len(runs))
+    print_report(stages, results, runs[0]['api_methods'])
+
+    problems = []
+    for run_result in runs:
+        if run_result['failed']:
+            problems.append(f"Сценарий прерван: {run_result['failed']}")
+        problems += [f"Ошибка в обработчике: {error}" for error in run_result['errors']]
+    problems = list(dict.fromkeys(problems))
+
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists() and not args.save_baseline:
+        stored = json.loads(baseline_path.read_text(encoding='utf-8'))
+        if stored.get('orders') == args.orders and stored.get('users') == args.users:
+            problems += compare_with_baseline(results, stored.get('handlers', {}), args.tolerance, args.min_delta)
+        else:
+            print(f"\n⚠️ Базовая линия снята с другими --orders/--users - сравнение пропущено")
+
+    if args.save_baseline and not problems:
+        baseline_path.write_text(json.dumps({
+            'orders': args.orders,
+            'users': args.users,
+            'runs': len(runs),
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'stages': stages,
+            'api_methods': runs[0]['api_methods'],
+            'handlers': results,
+        }, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"\n✅ Базовая линия сохранена в {baseline_path}")
+
+    if problems:
+        print("\n❌ " + "\n❌ ".join(problems))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Движок рассылок: отправка через общий лимитер запросов с ограниченной параллельностью,
+обработка RetryAfter и сохранение прогресса в БД (рассылка продолжается после перезапуска)
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional, Tuple
+from telegram import Bot, error
+from config import BROADCAST_CONCURRENCY, BROADCAST_BATCH_SIZE, BROADCAST_PROGRESS_INTERVAL
+from database import Database
+from message_manager import message_manager
+from utils.rate_limiter import api_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз пробуем отправить сообщение одному получателю при RetryAfter
+MAX_SEND_ATTEMPTS = 3
+
+
+def is_dead_chat_error(error_message: str) -> bool:
+    """Ошибка означает, что писать в этот чат больше нельзя (блокировка, удаленный аккаунт)"""
+    error_message = error_message.lower()
+    return any(marker in error_message for marker in (
+        "bot was blocked", "user is deactivated", "user not found", "chat not found", "forbidden"
+    ))
+
+
+def classify_send_error(error_message: str) -> str:
+    """Человекочитаемый тип ошибки отправки для отчета"""
+    error_message = error_message.lower()
+    if "bot was blocked" in error_message:
+        return "Пользователь заблокировал бота"
+    if "user is deactivated" in error_message:
+        return "Аккаунт удален"
+    if "user not found" in error_message:
+        return "Пользователь не найден"
+    if "chat not found" in error_message:
+        return "Чат не найден"
+    if "forbidden" in error_message:
+        return "Доступ запрещен"
+    if "flood" in error_message or "retry" in error_message:
+        return "Превышен лимит отправки"
+    if "too many requests" in error_message:
+        return "Слишком много запросов"
+    return "Неизвестная ошибка"
+
+
+def build_broadcast_payload(from_chat_id: int, message_ids: List[int]) -> dict:
+    """Исходные сообщения администратора, которые копируются получателям (альбом - несколько id)"""
+    return {'from_chat_id': from_chat_id, 'message_ids': sorted(message_ids)}
+
+
+class BroadcastManager:
+    def __init__(self):
+        self.db = Database()
+        self._tasks = {}
+
+    def start_job(self, bot: Bot, admin_id: int, payload: dict) -> Tuple[Optional[int], int]:
+        """Создает задание рассылки и запускает его в фоне. Возвращает (id задания, число получателей)"""
+        total_count = self.db.count_broadcast_recipients()
+        if not total_count:
+            return None, 0
+
+        job_id = self.db.create_broadcast_job(admin_id, json.dumps(payload, ensure_ascii=False), total_count)
+        self._launch(bot, job_id)
+        logger.info(f"📨 Рассылка #{job_id} запущена для {total_count} пользователей")
+        return job_id, total_count
+
+    def resume_jobs(self, bot: Bot):
+        """Продолжает рассылки, прерванные перезапуском бота"""
+        for job_id in self.db.get_running_broadcast_jobs():
+            if job_id not in self._tasks:
+                logger.info(f"🔄 Продолжаем рассылку #{job_id}")
+                self._launch(bot, job_id)
+
+    async def stop(self):
+        """Останавливает рассылки; их прогресс уже в БД, после запуска они продолжатся"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _launch(self, bot: Bot, job_id: int):
+        task = asyncio.create_task(self._run_job(bot, job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run_job(self, bot: Bot, job_id: int):
+        (admin_id, payload, total_count, last_user_id, success_count, failed_count,
+         errors, progress_chat_id, progress_message_id) = self.db.get_broadcast_job(job_id)
+        payload = json.loads(payload)
+        errors = json.loads(errors or '{}')
+
+        try:
+            # Одно сообщение с прогрессом, которое редактируется по ходу рассылки
+            if not progress_message_id:
+                progress_chat_id = admin_id
+                progress_message_id = await self._send_progress_message(bot, admin_id, job_id, total_count)
+                if progress_message_id:
+                    self.db.set_broadcast_progress_message(job_id, progress_chat_id, progress_message_id)
+
+            semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+            last_progress_update = time.monotonic()
+
+            while True:
+                recipients = self.db.get_broadcast_recipients(last_user_id, BROADCAST_BATCH_SIZE)
+                if not recipients:
+                    break
+
+                results = await asyncio.gather(*(
+                    self._send_with_semaphore(semaphore, bot, telegram_id, payload)
+                    for _, telegram_id in recipients
+                ))
+
+                for error_type in results:
+                    if error_type is None:
+                        success_count += 1
+                    else:
+                        failed_count += 1
+                        errors[error_type] = errors.get(error_type, 0) + 1
+
+                last_user_id = recipients[-1][0]
+                self.db.save_broadcast_progress(job_id, last_user_id, success_count, failed_count,
+                                                json.dumps(errors, ensure_ascii=False))
+
+                if time.monotonic() - last_progress_update >= BROADCAST_PROGRESS_INTERVAL:
+                    await self._edit_progress_message(
+                        bot, progress_chat_id, progress_message_id,
+                        self._format_progress(job_id, total_count, success_count, failed_count)
+                    )
+                    last_progress_update = time.monotonic()
+
+            self.db.finish_broadcast_job(job_id, 'completed')
+            await self._edit_progress_message(
+                bot, progress_chat_id, progress_message_id,
+                self._format_report(job_id, total_count, success_count, failed_count, errors)
+            )
+            logger.info(
+                f"Рассылка #{job_id} завершена. "
+                f"Успешно: {success_count}, Ошибок: {failed_count}"
+            )
+
+        except asyncio.CancelledError:
+            logger.info(f"⏸ Рассылка #{job_id} приостановлена, продолжится после перезапуска")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка в рассылке #{job_id}: {e}")
+            self.db.finish_broadcast_job(job_id, 'failed')
+
+    async def _send_with_semaphore(self, semaphore, bot: Bot, chat_id: int, payload: dict) -> Optional[str]:
+        async with semaphore:
+            return await self._send_to_recipient(bot, chat_id, payload)
+
+    async def _send_to_recipient(self, bot: Bot, chat_id: int, payload: dict) -> Optional[str]:
+        """Отправляет рассылку одному получателю. Возвращает тип ошибки или None при успехе"""
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            try:
+                async with api_rate_limiter:
+                    await self._deliver(bot, chat_id, payload)
+                return None
+            except error.RetryAfter as e:
+                retry_after = e.retry_after
+                if hasattr(retry_after, 'total_seconds'):
+                    retry_after = retry_after.total_seconds()
+                # Притормаживаем все отправки, а не только этот запрос
+                api_rate_limiter.pause(retry_after)
+                logger.warning(f"⏳ Flood control, пауза {retry_after} сек. (попытка {attempt + 1})")
+                await asyncio.sleep(retry_after)
+            except Exception as e:
+                error_message = str(e)
+                if is_dead_chat_error(error_message):
+                    message_manager.mark_user_inactive(chat_id, error_message)
+                else:
+                    logger.warning(f"Не удалось отправить рассылку {chat_id}: {error_message}")
+                return classify_send_error(error_message)
+
+        return "Превышен лимит отправки"
+
+    async def _deliver(self, bot: Bot, chat_id: int, payload: dict):
+        """Ровно один запрос на получателя при любом типе содержимого"""
+        message_ids = payload['message_ids']
+        if len(message_ids) == 1:
+            await bot.copy_message(chat_id, payload['from_chat_id'], message_ids[0])
+        else:
+            # Альбом копируется целиком, с сохранением группировки
+            await bot.copy_messages(chat_id, payload['from_chat_id'], message_ids)
+
+    async def _send_progress_message(self, bot: Bot, chat_id: int, job_id: int, total_count: int) -> Optional[int]:
+        try:
+            async with api_rate_limiter:
+                message = await bot.send_message(chat_id, self._format_progress(job_id, total_count, 0, 0))
+            return message.message_id
+        except Exception as e:
+            logger.error(f"❌ Не удалось отправить прогресс рассылки #{job_id}: {e}")
+            return None
+
+    async def _edit_progress_message(self, bot: Bot, chat_id: int, message_id: int, text: str):
+        if not message_id:
+            return
+        try:
+            async with api_rate_limiter:
+                await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except error.BadRequest as e:
+            if "Message is not modified" not in str(e):
+                logger.error(f"❌ Ошибка при обновлении прогресса рассылки: {e}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при обновлении прогресса рассылки: {e}")
+
+    def _format_progress(self, job_id: int, total_count: int, success_count: int, failed_count: int) -> str:
+        processed = success_count + failed_count
+        return (
+            f"📨 Рассылка #{job_id}\n\n"
+            f"Обработано: {processed}/{total_count}\n"
+            f"✅ Доставлено: {success_count}\n"
+            f"❌ Ошибок: {failed_count}"
+        )
+
+    def _format_report(self, job_id: int, total_count: int, success_count: int,
+                       failed_count: int, errors: dict) -> str:
+        processed = success_count + failed_count
+        message = f"✅ РАССЫЛКА #{job_id} ЗАВЕРШЕНА\n\n"
+        message += "📊 СТАТИСТИКА:\n"
+        message += f"• 📨 Получателей рассылки: {total_count}\n"
+        message += f"• 🎯 Успешно доставлено: {success_count}\n"
+        message += f"• ⚠️  Ошибок при отправке: {failed_count}\n"
+
+        if errors:
+            message += "\n📈 Распределение ошибок по типам:\n"
+            for error_type, count in sorted(errors.items(), key=lambda item: -item[1]):
+                message += f"  • {error_type}: {count}\n"
+
+        delivery_rate = (success_count / processed * 100) if processed else 0
+        message += f"\n📈 Эффективность рассылки: {delivery_rate:.1f}% успешных отправок\n"
+        if failed_count:
+            message += "ℹ️ Заблокировавшие бота исключены из следующих рассылок\n"
+        return message
+
+
+# Глобальный экземпляр менеджера рассылок
+broadcast_manager = BroadcastManager()
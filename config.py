@@ -40,11 +40,74 @@ REFERRAL_BONUS = 25
 
 # ========== НАСТРОЙКИ БАЗЫ ДАННЫХ ==========
 DB_NAME = os.getenv('DB_NAME', 'loyalty_bot.db')
+# Архив закрытых заказов, продаж смен, броней и бонусных операций (подключается через ATTACH)
+ARCHIVE_DB_NAME = os.getenv('ARCHIVE_DB_NAME', 'loyalty_bot_archive.db')
 
 # ========== НАСТРОЙКИ СООБЩЕНИЙ ==========
 # Задержка перед удалением временных сообщений (секунды)
 MESSAGE_CLEANUP_DELAY = 30
 
+# Сколько последних сообщений каждого типа помнить для одного чата
+MAX_TRACKED_MESSAGES_PER_CHAT = 200
+
+# Сколько чатов держать в памяти (давно неактивные вытесняются)
+MAX_TRACKED_CHATS = 5000
+
+# Как часто записывать в базу новые отложенные удаления (секунды): они копятся в памяти
+# и пишутся одним запросом; при аварийном падении теряются не больше чем за этот интервал
+PENDING_DELETIONS_FLUSH_INTERVAL = 5
+
+# Лимит исходящих запросов к Telegram API (запросов в секунду)
+API_RATE_LIMIT = 25
+
+# ========== НАСТРОЙКИ РАССЫЛКИ ==========
+# Сколько сообщений рассылки отправляется одновременно (общий темп задает API_RATE_LIMIT)
+BROADCAST_CONCURRENCY = 10
+
+# Размер пачки получателей; прогресс сохраняется в БД после каждой пачки
+BROADCAST_BATCH_SIZE = 100
+
+# Как часто обновлять сообщение с прогрессом рассылки (секунды)
+BROADCAST_PROGRESS_INTERVAL = 5
+
+# ========== НАСТРОЙКИ СОХРАНЕНИЯ СОСТОЯНИЯ ==========
+# Как часто изменения user_data/bot_data/диалогов сбрасываются в БД (секунды)
+PERSISTENCE_UPDATE_INTERVAL = 30
+
+# ========== НАСТРОЙКИ ОБРАБОТКИ ОБНОВЛЕНИЙ ==========
+# Сколько обновлений от разных чатов обрабатывается одновременно
+UPDATE_CONCURRENCY = 16
+
+# ========== ПОИСК ПОЛЬЗОВАТЕЛЕЙ ==========
+# Сколько лучших совпадений показывать администратору
+USER_SEARCH_LIMIT = 20
+
+# ========== ФОНОВЫЕ ЗАДАЧИ ==========
+# Как часто сворачивать бонусный леджер в помесячные снимки (секунды)
+LEDGER_SNAPSHOT_INTERVAL = 6 * 60 * 60
+
+# Закрытые данные старше стольких месяцев переносятся в архивную БД (0 - не переносить)
+ARCHIVE_AFTER_MONTHS = 12
+
+# Как часто запускать перенос в архив (секунды)
+ARCHIVE_INTERVAL = 24 * 60 * 60
+
+# ========== РЕЗЕРВНОЕ КОПИРОВАНИЕ ==========
+# Папка для сжатых копий БД (восстановление: python backup.py restore)
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+
+# Как часто делать копию (секунды) и сколько последних копий хранить
+BACKUP_INTERVAL = 6 * 60 * 60
+BACKUP_KEEP = 14
+
+# Копия дольше стольких секунд - предупреждение в лог (копирование идет одним шагом со снимка WAL)
+BACKUP_WARN_SECONDS = 5 * 60
+
+# ========== ОБСЛУЖИВАНИЕ БД ==========
+# Как часто проверять, пора ли обслуживать БД (секунды). Само обслуживание (PRAGMA optimize,
+# incremental vacuum, checkpoint WAL) - не чаще раза в сутки и только вне OPENING_TIME-CLOSING_TIME
+MAINTENANCE_CHECK_INTERVAL = 30 * 60
+
 # ========== НАСТРОЙКИ ЛОГИРОВАНИЯ ==========
 LOG_FILE = os.getenv('LOG_FILE', 'bot_errors.log')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
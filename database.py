@@ -1,19 +1,79 @@
+import os
+import re
+import json
 import sqlite3
 import logging
-from config import DB_NAME
+import time
+from pathlib import Path
+from config import DB_NAME, ARCHIVE_DB_NAME
 from datetime import datetime
 import pytz
 
 logger = logging.getLogger(__name__)
 
+# Таблицы, старые закрытые строки которых переносятся в архивную БД.
+# Колонки перечислены явно: в старых БД часть колонок добавлена через ALTER и порядок отличается
+ARCHIVE_TABLES = {
+    'orders': ('id', 'table_number', 'admin_id', 'status', 'created_at', 'closed_at', 'payment_method', 'version'),
+    'order_items': ('id', 'order_id', 'item_name', 'price', 'quantity', 'added_at'),
+    'shift_sales': ('id', 'shift_id', 'item_name', 'quantity', 'total_amount'),
+    'transactions': ('id', 'user_id', 'amount', 'type', 'description', 'date'),
+    'bookings': ('id', 'user_id', 'customer_name', 'customer_phone', 'booking_date', 'booking_time',
+                 'guests', 'comment', 'status', 'created_at', 'source'),
+}
+
+# booking_date хранится как ДД.ММ.ГГГГ - для сравнения с датой приводим к ГГГГ-ММ-ДД
+BOOKING_DATE_ISO_SQL = '''CASE WHEN booking_date LIKE '__.__.____'
+    THEN substr(booking_date, 7, 4) || '-' || substr(booking_date, 4, 2) || '-' || substr(booking_date, 1, 2)
+    ELSE booking_date END'''
+
+
+# Колонки users, доступные для выборки и фильтров iter_users
+USER_COLUMNS = (
+    'id', 'telegram_id', 'first_name', 'last_name', 'phone', 'bonus_balance', 'registration_date',
+    'is_active', 'referred_by', 'total_spent', 'total_orders', 'username'
+)
+
+
+def _user_search_values(row):
+    """Значения users_fts для строки users: имя, телефон только из цифр, telegram id, username"""
+    digits = f"{row}.phone"
+    for char in "+-() ":
+        digits = f"replace({digits}, '{char}', '')"
+    # Российский номер индексируется дважды: с кодом 7 (8 приводится к 7) и без него (10 цифр),
+    # чтобы находились и '8999...', и '999...'
+    national = (
+        f"CASE WHEN length({digits}) = 11 AND substr({digits}, 1, 1) IN ('7', '8') THEN substr({digits}, 2) "
+        f"WHEN length({digits}) = 10 THEN {digits} END"
+    )
+    phone = f"COALESCE('7' || {national} || ' ' || {national}, {digits})"
+    # Токенизатор не снимает диакритику с кириллицы: ё ищется как е
+    name = f"COALESCE({row}.first_name, '') || ' ' || COALESCE({row}.last_name, '')"
+    name = f"replace(replace({name}, 'ё', 'е'), 'Ё', 'Е')"
+    return f"{row}.id, {name}, {phone}, CAST({row}.telegram_id AS TEXT), {row}.username"
+
+
+def read_only_uri(path):
+    """URI файла БД для подключения только на чтение (sqlite3.connect(..., uri=True))"""
+    return f"{Path(path).resolve().as_uri()}?mode=ro"
+
 
 class Database:
     def __init__(self):
         self.conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+        # WAL: чтение (в том числе отчеты с отдельного подключения) не блокирует запись и наоборот
+        self.conn.execute('PRAGMA journal_mode=WAL')
         self.create_tables()
         self.fix_menu_categories()
         self.add_payment_method_column()
+        self.add_order_version_column()
+        self.add_shift_summary_column()
+        self.add_username_column()
+        self.create_user_search_index()
+        self.create_dashboard_triggers()
+        self.create_report_triggers()
         self.create_miniapp_tables()  # Создаем таблицы для MiniApp
+        self.attach_archive()
 
     def get_moscow_time(self):
         """Получить текущее время в московском часовом поясе"""
@@ -38,6 +98,7 @@ class Database:
                 referred_by INTEGER DEFAULT NULL,
                 total_spent INTEGER DEFAULT 0,
                 total_orders INTEGER DEFAULT 0,
+                username TEXT DEFAULT NULL,
                 FOREIGN KEY (referred_by) REFERENCES users (id)
             )
         ''')
@@ -70,6 +131,8 @@ class Database:
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
+        # Постраничные списки бронирований по статусу (keyset по id)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_status_id ON bookings (status, id)')
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS bonus_requests (
@@ -117,6 +180,9 @@ class Database:
                 FOREIGN KEY (order_id) REFERENCES orders (id)
             )
         ''')
+        # Заказы смены выбираются по диапазону created_at, позиции - по order_id
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)')
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS menu_items (
@@ -128,6 +194,139 @@ class Database:
             )
         ''')
 
+        # Отложенные удаления временных сообщений (переживают перезапуск бота)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pending_deletions (
+                chat_id INTEGER,
+                message_id INTEGER,
+                due_at INTEGER, -- unix-время, когда сообщение нужно удалить
+                PRIMARY KEY (chat_id, message_id)
+            )
+        ''')
+
+        # Чаты, заблокировавшие бота или удаленные (не тратим на них запросы к API)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blocked_chats (
+                chat_id INTEGER PRIMARY KEY,
+                reason TEXT,
+                blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_failure_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Состояние бота между перезапусками (user_data, chat_data, bot_data, диалоги)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bot_persistence (
+                kind TEXT, -- user / chat / bot / conversation
+                key TEXT,
+                data BLOB,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (kind, key)
+            )
+        ''')
+
+        # Снимки бонусного леджера: по месяцам для каждого пользователя.
+        # Отчеты по списаниям читают снимки + хвост transactions после folded_until,
+        # поэтому свернутые старые операции можно переносить в архив
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ledger_monthly (
+                month TEXT, -- YYYY-MM
+                user_id INTEGER,
+                earned INTEGER DEFAULT 0,
+                spent INTEGER DEFAULT 0, -- сумма списаний (отрицательная, как в transactions)
+                closing_balance INTEGER DEFAULT 0, -- баланс по леджеру на конец месяца
+                PRIMARY KEY (month, user_id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ledger_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                folded_until TEXT, -- YYYY-MM-01: операции раньше этой даты свернуты в ledger_monthly
+                last_snapshot_at TIMESTAMP
+            )
+        ''')
+
+        # Списания за закрытые смены, зафиксированные при снимке
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS shift_bonus_spend (
+                shift_id INTEGER PRIMARY KEY,
+                spent INTEGER DEFAULT 0
+            )
+        ''')
+
+        # Задания рассылки: прогресс сохраняется после каждой пачки получателей,
+        # поэтому после перезапуска рассылка продолжается с места остановки
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                admin_id INTEGER,
+                payload TEXT, -- JSON с содержимым рассылки
+                status TEXT DEFAULT 'running', -- running / completed / failed
+                total_count INTEGER DEFAULT 0,
+                last_user_id INTEGER DEFAULT 0, -- курсор: пользователи с id <= last_user_id обработаны
+                success_count INTEGER DEFAULT 0,
+                failed_count INTEGER DEFAULT 0,
+                errors TEXT DEFAULT '{}', -- JSON: тип ошибки -> количество
+                progress_chat_id INTEGER,
+                progress_message_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+
+        # Версия данных панели статистики: увеличивается триггерами при изменении
+        # пользователей, бронирований и запросов на списание (см. create_dashboard_triggers)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dashboard_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO dashboard_state (id, version) VALUES (1, 0)')
+
+        # Версия меню: любое изменение menu_items (в том числе из скриптов миграции)
+        # увеличивает ее, и классификатор позиций по категориям пересобирается
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS menu_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO menu_state (id, version) VALUES (1, 0)')
+
+        # Версия данных отчетов по истории: по ней кэшируются отрисованные страницы отчетов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS report_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO report_state (id, version) VALUES (1, 0)')
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS menu_items_version_{event.lower()}
+                AFTER {event} ON menu_items BEGIN
+                    UPDATE menu_state SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+        # История обслуживания БД: размер файла и статистика страниц после каждого запуска
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS db_maintenance_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_at TEXT,
+                file_size INTEGER,
+                wal_size INTEGER,
+                page_size INTEGER,
+                page_count INTEGER,
+                freelist_count INTEGER,
+                freed_pages INTEGER,
+                duration REAL,
+                actions TEXT
+            )
+        ''')
+
         # Проверяем таблицу shifts
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='shifts'")
         shifts_table_exists = cursor.fetchone()
@@ -653,12 +852,24 @@ class Database:
         """Получить бронирования пользователя для MiniApp"""
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT id, booking_date, booking_time, guests, comment, status, created_at
-            FROM bookings 
-            WHERE user_id = ? AND source = 'miniapp'
+            SELECT * FROM (
+                SELECT id, booking_date, booking_time, guests, comment, status, created_at
+                FROM main.bookings
+                WHERE user_id = ? AND source = 'miniapp'
+                ORDER BY booking_date DESC, booking_time DESC
+                LIMIT 10
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT id, booking_date, booking_time, guests, comment, status, created_at
+                FROM archive.bookings
+                WHERE user_id = ? AND source = 'miniapp'
+                ORDER BY booking_date DESC, booking_time DESC
+                LIMIT 10
+            )
             ORDER BY booking_date DESC, booking_time DESC
             LIMIT 10
-        ''', (user_id,))
+        ''', (user_id, user_id))
         return cursor.fetchall()
 
     def get_or_create_miniapp_user(self, telegram_user):
@@ -675,13 +886,14 @@ class Database:
         # Создаем нового пользователя
         try:
             cursor.execute('''
-                INSERT INTO users (telegram_id, first_name, last_name, registration_date, bonus_balance)
-                VALUES (?, ?, ?, ?, 0)
+                INSERT INTO users (telegram_id, first_name, last_name, registration_date, bonus_balance, username)
+                VALUES (?, ?, ?, ?, 0, ?)
             ''', (
                 telegram_user.get('id'),
                 telegram_user.get('first_name', ''),
                 telegram_user.get('last_name', ''),
-                self.get_moscow_time()
+                self.get_moscow_time(),
+                telegram_user.get('username')
             ))
             user_id = cursor.lastrowid
             self.conn.commit()
@@ -705,18 +917,23 @@ class Database:
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT b.*, u.first_name, u.last_name, u.phone, u.telegram_id
-            FROM bookings b 
+            FROM main.bookings b 
+            LEFT JOIN users u ON b.user_id = u.id 
+            WHERE b.status = ?
+            UNION ALL
+            SELECT b.*, u.first_name, u.last_name, u.phone, u.telegram_id
+            FROM archive.bookings b 
             LEFT JOIN users u ON b.user_id = u.id 
             WHERE b.status = ?
-            ORDER BY b.booking_date, b.booking_time
-        ''', (status,))
+            ORDER BY booking_date, booking_time
+        ''', (status, status))
         return cursor.fetchall()
 
     def get_bookings_by_date(self, date):
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT b.*, u.first_name, u.last_name, u.phone, u.telegram_id
-            FROM bookings b 
+            FROM bookings_all b 
             LEFT JOIN users u ON b.user_id = u.id 
             WHERE b.booking_date = ?
             ORDER BY b.booking_time
@@ -727,19 +944,75 @@ class Database:
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT b.*, u.first_name, u.last_name, u.phone, u.telegram_id
-            FROM bookings b 
+            FROM main.bookings b 
+            LEFT JOIN users u ON b.user_id = u.id 
+            UNION ALL
+            SELECT b.*, u.first_name, u.last_name, u.phone, u.telegram_id
+            FROM archive.bookings b 
             LEFT JOIN users u ON b.user_id = u.id 
-            ORDER BY b.booking_date, b.booking_time
+            ORDER BY booking_date, booking_time
         ''')
         return cursor.fetchall()
 
+    def get_bookings_page(self, status=None, before_id=None, after_id=None, limit=10):
+        """Страница бронирований (status=None - все) по убыванию id, вместе с архивом (id при переносе сохраняются)"""
+        select_sql = '''
+            SELECT b.*, u.first_name, u.last_name, u.phone, u.telegram_id
+            FROM {schema}.bookings b
+            LEFT JOIN users u ON b.user_id = u.id
+        '''
+        if status == 'pending':
+            # Ожидающие бронирования в архив не переносятся
+            return self._keyset_page(select_sql.format(schema='main') + ' WHERE b.status = ?', 'b.id', (status,),
+                                     before_id, after_id, limit)
+        if status:
+            return self._keyset_page_all(select_sql + ' WHERE b.status = ?', 'b.id', (status,), before_id, after_id, limit)
+        return self._keyset_page_all(select_sql + ' WHERE 1', 'b.id', (), before_id, after_id, limit)
+
+    def get_report_version(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT version FROM report_state WHERE id = 1')
+        return cursor.fetchone()[0]
+
+    def get_menu_version(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT version FROM menu_state WHERE id = 1')
+        return cursor.fetchone()[0]
+
+    def get_dashboard_version(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT version FROM dashboard_state WHERE id = 1')
+        return cursor.fetchone()[0]
+
+    def get_dashboard_stats(self):
+        """Все счетчики панели статистики одним запросом (вместе с версией данных, по которой они посчитаны)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT
+                (SELECT version FROM dashboard_state WHERE id = 1),
+                COUNT(*),
+                COALESCE(SUM(bonus_balance), 0),
+                (SELECT COUNT(*) FROM main.bookings WHERE status = 'pending'),
+                (SELECT COUNT(*) FROM main.bookings WHERE status = 'confirmed')
+                    + (SELECT COUNT(*) FROM archive.bookings WHERE status = 'confirmed'),
+                (SELECT COUNT(*) FROM main.bookings WHERE status = 'cancelled')
+                    + (SELECT COUNT(*) FROM archive.bookings WHERE status = 'cancelled'),
+                (SELECT COUNT(*) FROM bonus_requests WHERE status = 'pending')
+            FROM users
+            WHERE is_active = TRUE
+        ''')
+        keys = ('version', 'total_users', 'total_bonuses', 'bookings_pending', 'bookings_confirmed',
+                'bookings_cancelled', 'pending_requests')
+        return dict(zip(keys, cursor.fetchone()))
+
     def get_booking_stats(self):
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT 
-                status,
-                COUNT(*) as count
-            FROM bookings 
+            SELECT status, SUM(count) FROM (
+                SELECT status, COUNT(*) as count FROM main.bookings GROUP BY status
+                UNION ALL
+                SELECT status, COUNT(*) as count FROM archive.bookings GROUP BY status
+            )
             GROUP BY status
         ''')
         stats = cursor.fetchall()
@@ -761,15 +1034,16 @@ class Database:
 
     # ========== СУЩЕСТВУЮЩИЕ МЕТОДЫ (сохраняем все из вашего файла) ==========
 
-    def add_user(self, telegram_id, first_name, last_name, phone, referred_by=None):
+    def add_user(self, telegram_id, first_name, last_name, phone, referred_by=None, username=None):
         try:
             cursor = self.conn.cursor()
             registration_date = self.get_moscow_time()
 
             cursor.execute('''
-                INSERT INTO users (telegram_id, first_name, last_name, phone, bonus_balance, referred_by, registration_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (telegram_id, first_name, last_name, phone, 100, referred_by, registration_date))
+                INSERT INTO users (telegram_id, first_name, last_name, phone, bonus_balance, referred_by,
+                                   registration_date, username)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (telegram_id, first_name, last_name, phone, 100, referred_by, registration_date, username))
             user_id = cursor.lastrowid
 
             if referred_by:
@@ -788,6 +1062,51 @@ class Database:
         cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
         return cursor.fetchone()
 
+    def update_username(self, telegram_id, username):
+        cursor = self.conn.cursor()
+        cursor.execute('UPDATE users SET username = ? WHERE telegram_id = ?', (username, telegram_id))
+        self.conn.commit()
+
+    def search_users(self, search_query, limit):
+        """
+        Поиск активных пользователей для администратора: точное совпадение по id,
+        затем префиксный полнотекстовый поиск по имени, телефону, telegram id и username (лучшие - первыми)
+        """
+        cursor = self.conn.cursor()
+        users = []
+
+        if search_query.isdigit():
+            cursor.execute('SELECT * FROM users WHERE id = ? AND is_active = TRUE', (int(search_query),))
+            users = cursor.fetchall()
+
+        if re.fullmatch(r'[\d\s+()\-]+', search_query):
+            # Телефон в индексе хранится только цифрами, с кодом 7 и без кода
+            digits = re.sub(r'\D', '', search_query)
+            if not digits:
+                return users
+            variants = [digits]
+            if digits.startswith('8'):
+                # 8 вместо 7 в начале номера; сам номер без кода тоже может начинаться с 8
+                variants.append('7' + digits[1:])
+            match = ' OR '.join(f'"{variant}"*' for variant in variants)
+        else:
+            terms = re.findall(r'\w+', search_query.replace('ё', 'е').replace('Ё', 'Е'))
+            if not terms:
+                return users
+            match = ' '.join(f'"{term}"*' for term in terms)
+
+        cursor.execute('''
+            SELECT u.* FROM users_fts
+            JOIN users u ON u.id = users_fts.rowid
+            WHERE users_fts MATCH ? AND u.is_active = TRUE
+            ORDER BY users_fts.rank
+            LIMIT ?
+        ''', (match, limit))
+
+        found_ids = {user[0] for user in users}
+        users += [user for user in cursor.fetchall() if user[0] not in found_ids]
+        return users[:limit]
+
     def get_user_by_id(self, user_id):
         cursor = self.conn.cursor()
         cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
@@ -815,11 +1134,151 @@ class Database:
         self.conn.commit()
         return cursor.lastrowid
 
-    def get_all_users(self):
+    # ========== ОПЕРАЦИИ С БАЛЛАМИ ==========
+    # Баланс меняется условным UPDATE ... RETURNING вместе с записью в transactions
+    # в одной транзакции: без чтения баланса заранее и без гонок между админами
+
+    def _change_balance(self, cursor, user_id, amount, transaction_type, description):
+        """Изменить баланс (amount < 0 - списание, только если хватает баллов). Без commit"""
+        cursor.execute('''
+            UPDATE users SET bonus_balance = bonus_balance + ?
+            WHERE id = ? AND bonus_balance + ? >= 0
+            RETURNING bonus_balance
+        ''', (amount, user_id, amount))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        cursor.execute('''
+            INSERT INTO transactions (user_id, amount, type, description, date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, amount, transaction_type, description, self.get_moscow_time()))
+        return row[0]
+
+    def credit_bonus(self, user_id, amount, description, transaction_type='earn'):
+        """Начислить баллы. Возвращает новый баланс или None, если пользователь не найден"""
+        with self.conn:
+            return self._change_balance(self.conn.cursor(), user_id, amount, transaction_type, description)
+
+    def debit_bonus(self, user_id, amount, description, transaction_type='spend'):
+        """Списать баллы, если их хватает. Возвращает новый баланс или None"""
+        with self.conn:
+            return self._change_balance(self.conn.cursor(), user_id, -amount, transaction_type, description)
+
+    def approve_bonus_request(self, request_id):
+        """Одобрить запрос на списание: (True, новый баланс) или (False, причина)"""
+        cursor = self.conn.cursor()
+        try:
+            # Запрос переводится из pending только один раз - повторное нажатие ничего не спишет
+            cursor.execute('''
+                UPDATE bonus_requests SET status = 'approved'
+                WHERE id = ? AND status = 'pending'
+                RETURNING user_id, amount
+            ''', (request_id,))
+            request = cursor.fetchone()
+            if request is None:
+                self.conn.rollback()
+                return False, "Запрос не найден или уже обработан"
+
+            user_id, amount = request
+            new_balance = self._change_balance(cursor, user_id, -amount, 'spend', 'Списание по запросу')
+            if new_balance is None:
+                self.conn.rollback()
+                return False, "У пользователя недостаточно баллов для списания"
+
+            self.conn.commit()
+            return True, new_balance
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def create_bonus_request_if_covered(self, user_id, amount):
+        """Создать запрос на списание, только если на балансе хватает баллов. Возвращает id или None"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO bonus_requests (user_id, amount, created_at)
+            SELECT id, ?, ? FROM users WHERE id = ? AND bonus_balance >= ?
+            RETURNING id
+        ''', (amount, self.get_moscow_time(), user_id, amount))
+        row = cursor.fetchone()
+        self.conn.commit()
+        return row[0] if row else None
+
+    def get_all_users(self, include_blocked=False):
+        """Активные пользователи; заблокировавшие бота по умолчанию не возвращаются"""
+        return list(self.iter_users(filters={'include_blocked': include_blocked}))
+
+    def iter_users(self, batch_size=500, filters=None, columns=None):
+        """
+        Пользователи по убыванию id пачками через fetchmany - память не зависит от числа пользователей.
+        filters: {'include_blocked': bool, <колонка>: значение} (по умолчанию - активные, без заблокировавших бота);
+        columns: кортеж нужных колонок (по умолчанию все, в порядке таблицы)
+        """
+        filters = {'is_active': True, 'include_blocked': False, **(filters or {})}
+        columns = tuple(columns or ('*',))
+        unknown = [name for name in (*columns, *filters) if name not in (*USER_COLUMNS, '*', 'include_blocked')]
+        if unknown:
+            raise ValueError(f"Неизвестные колонки users: {unknown}")
+
+        conditions, params = [], []
+        for name, value in filters.items():
+            if name == 'include_blocked':
+                if not value:
+                    conditions.append('telegram_id NOT IN (SELECT chat_id FROM blocked_chats)')
+            else:
+                conditions.append(f'{name} = ?')
+                params.append(value)
+
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE is_active = TRUE ORDER BY id DESC')
+        cursor.execute(f'''
+            SELECT {', '.join(columns)} FROM users
+            WHERE {' AND '.join(conditions) or '1'}
+            ORDER BY id DESC
+        ''', params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def get_users_page(self, before_id=None, after_id=None, limit=20):
+        """Страница активных пользователей по убыванию id"""
+        return self._keyset_page('SELECT * FROM users WHERE is_active = TRUE', 'id', (), before_id, after_id, limit)
+
+    def get_users_count(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM users WHERE is_active = TRUE')
+        return cursor.fetchone()[0]
+
+    def _keyset_page(self, select_sql, key, params, before_id, after_id, limit):
+        """
+        Страница по ключу вместо OFFSET: строки с key < before_id (следующая страница)
+        или key > after_id (предыдущая), всегда по убыванию key. select_sql заканчивается условием WHERE
+        """
+        cursor = self.conn.cursor()
+        if after_id is not None:
+            cursor.execute(f'{select_sql} AND {key} > ? ORDER BY {key} ASC LIMIT ?', (*params, after_id, limit))
+            return cursor.fetchall()[::-1]
+        if before_id is not None:
+            cursor.execute(f'{select_sql} AND {key} < ? ORDER BY {key} DESC LIMIT ?', (*params, before_id, limit))
+        else:
+            cursor.execute(f'{select_sql} ORDER BY {key} DESC LIMIT ?', (*params, limit))
         return cursor.fetchall()
 
+    def _keyset_page_all(self, select_sql, key, params, before_id, after_id, limit):
+        """
+        _keyset_page по основной БД и архиву: в select_sql вместо схемы таблицы стоит {schema}.
+        Каждая схема отдает страницу по своему индексу, страницы сливаются по ключу (первое поле строки)
+        """
+        rows = []
+        for schema in ('main', 'archive'):
+            rows += self._keyset_page(select_sql.format(schema=schema), key, params, before_id, after_id, limit)
+        rows.sort(key=lambda row: row[0], reverse=True)
+        return rows[-limit:] if after_id is not None else rows[:limit]
+
     def get_pending_requests(self):
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -838,7 +1297,7 @@ class Database:
 
     def get_user_bookings(self, user_id):
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM bookings WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
+        cursor.execute('SELECT * FROM bookings_all WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
         return cursor.fetchall()
 
     def get_referrer_stats(self, user_id):
@@ -884,6 +1343,163 @@ class Database:
 
         return None, 0
 
+    # ========== ОТЛОЖЕННОЕ УДАЛЕНИЕ СООБЩЕНИЙ ==========
+
+    def add_pending_deletions(self, deletions):
+        """Сохранить отложенные удаления: deletions - список (chat_id, message_id, due_at)"""
+        if not deletions:
+            return
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO pending_deletions (chat_id, message_id, due_at)
+            VALUES (?, ?, ?)
+        ''', deletions)
+        self.conn.commit()
+
+    def remove_pending_deletions(self, messages):
+        """Удалить записи об отложенном удалении: messages - список (chat_id, message_id)"""
+        if not messages:
+            return
+        cursor = self.conn.cursor()
+        cursor.executemany('DELETE FROM pending_deletions WHERE chat_id = ? AND message_id = ?', messages)
+        self.conn.commit()
+
+    def get_pending_deletions(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT chat_id, message_id, due_at FROM pending_deletions ORDER BY due_at')
+        return cursor.fetchall()
+
+    # ========== ЗАБЛОКИРОВАННЫЕ ЧАТЫ ==========
+
+    def mark_chat_blocked(self, chat_id, reason=None):
+        """Запомнить, что чат недоступен (при повторной ошибке обновляется только last_failure_at)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO blocked_chats (chat_id, reason)
+            VALUES (?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                reason = excluded.reason,
+                last_failure_at = CURRENT_TIMESTAMP
+        ''', (chat_id, reason))
+        self.conn.commit()
+
+    def unmark_chat_blocked(self, chat_id):
+        """Снять отметку о блокировке; возвращает True, если отметка была"""
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM blocked_chats WHERE chat_id = ?', (chat_id,))
+        self.conn.commit()
+        return cursor.rowcount > 0
+
+    def get_blocked_chat_ids(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT chat_id FROM blocked_chats')
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_blocked_chats_count(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM blocked_chats')
+        return cursor.fetchone()[0]
+
+    # ========== СОСТОЯНИЕ БОТА (PERSISTENCE) ==========
+
+    def get_persistence_data(self, kind):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT key, data FROM bot_persistence WHERE kind = ?', (kind,))
+        return cursor.fetchall()
+
+    def save_persistence_data(self, rows):
+        """Записать накопленные изменения одной транзакцией: rows - список (kind, key, data), data=None удаляет"""
+        if not rows:
+            return
+        upserts = [(kind, key, data) for kind, key, data in rows if data is not None]
+        deletes = [(kind, key) for kind, key, data in rows if data is None]
+        try:
+            with self.conn:
+                if upserts:
+                    self.conn.executemany('''
+                        INSERT INTO bot_persistence (kind, key, data, updated_at)
+                        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(kind, key) DO UPDATE SET
+                            data = excluded.data,
+                            updated_at = excluded.updated_at
+                    ''', upserts)
+                if deletes:
+                    self.conn.executemany('DELETE FROM bot_persistence WHERE kind = ? AND key = ?', deletes)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояния бота: {e}")
+            raise
+
+    # ========== РАССЫЛКИ ==========
+
+    def count_broadcast_recipients(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) FROM users
+            WHERE is_active = TRUE
+            AND telegram_id NOT IN (SELECT chat_id FROM blocked_chats)
+        ''')
+        return cursor.fetchone()[0]
+
+    def get_broadcast_recipients(self, after_user_id, limit):
+        """Следующая пачка получателей рассылки: (id, telegram_id) по возрастанию id"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, telegram_id FROM users
+            WHERE is_active = TRUE AND id > ?
+            AND telegram_id NOT IN (SELECT chat_id FROM blocked_chats)
+            ORDER BY id
+            LIMIT ?
+        ''', (after_user_id, limit))
+        return cursor.fetchall()
+
+    def create_broadcast_job(self, admin_id, payload, total_count):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO broadcast_jobs (admin_id, payload, total_count, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (admin_id, payload, total_count, self.get_moscow_time()))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def get_broadcast_job(self, job_id):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT admin_id, payload, total_count, last_user_id, success_count, failed_count,
+                   errors, progress_chat_id, progress_message_id
+            FROM broadcast_jobs WHERE id = ?
+        ''', (job_id,))
+        return cursor.fetchone()
+
+    def get_running_broadcast_jobs(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id FROM broadcast_jobs WHERE status = 'running' ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
+
+    def set_broadcast_progress_message(self, job_id, chat_id, message_id):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE broadcast_jobs SET progress_chat_id = ?, progress_message_id = ?
+            WHERE id = ?
+        ''', (chat_id, message_id, job_id))
+        self.conn.commit()
+
+    def save_broadcast_progress(self, job_id, last_user_id, success_count, failed_count, errors):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE broadcast_jobs
+            SET last_user_id = ?, success_count = ?, failed_count = ?, errors = ?
+            WHERE id = ?
+        ''', (last_user_id, success_count, failed_count, errors, job_id))
+        self.conn.commit()
+
+    def finish_broadcast_job(self, job_id, status):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE broadcast_jobs SET status = ?, finished_at = ?
+            WHERE id = ?
+        ''', (status, self.get_moscow_time(), job_id))
+        self.conn.commit()
+
     def get_booking_dates(self):
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -924,7 +1540,7 @@ class Database:
         if status:
             cursor.execute('''
                 SELECT o.*, u.first_name, u.last_name 
-                FROM orders o 
+                FROM orders_all o 
                 LEFT JOIN users u ON o.admin_id = u.id 
                 WHERE DATE(o.created_at) = ? AND o.status = ?
                 ORDER BY o.created_at DESC
@@ -932,7 +1548,7 @@ class Database:
         else:
             cursor.execute('''
                 SELECT o.*, u.first_name, u.last_name 
-                FROM orders o 
+                FROM orders_all o 
                 LEFT JOIN users u ON o.admin_id = u.id 
                 WHERE DATE(o.created_at) = ?
                 ORDER BY o.created_at DESC
@@ -943,7 +1559,7 @@ class Database:
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT o.*, u.first_name, u.last_name 
-            FROM orders o 
+            FROM orders_all o 
             LEFT JOIN users u ON o.admin_id = u.id 
             WHERE o.status = 'closed'
             ORDER BY o.closed_at DESC
@@ -954,7 +1570,7 @@ class Database:
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT DISTINCT DATE(created_at) as order_date 
-            FROM orders 
+            FROM orders_all 
             WHERE status = 'closed'
             ORDER BY order_date DESC
         ''')
@@ -963,7 +1579,13 @@ class Database:
 
     def remove_item_from_order(self, order_id, item_name):
         cursor = self.conn.cursor()
+        success, message = self.delete_one_order_item(cursor, order_id, item_name)
+        if success:
+            self.conn.commit()
+        return success, message
 
+    def delete_one_order_item(self, cursor, order_id, item_name):
+        """Убрать одну единицу позиции из заказа (без commit - для использования внутри транзакции)"""
         cursor.execute('''
             SELECT id, quantity FROM order_items 
             WHERE order_id = ? AND item_name = ?
@@ -990,7 +1612,6 @@ class Database:
             ''', (item_id,))
             message = "Позиция удалена"
 
-        self.conn.commit()
         return True, message
 
     def get_orders_by_shift_id(self, shift_id):
@@ -1006,19 +1627,32 @@ class Database:
 
         if closed_at:
             cursor.execute('''
-                SELECT * FROM orders 
+                SELECT * FROM orders_all 
                 WHERE created_at >= ? AND created_at <= ?
                 ORDER BY created_at DESC
             ''', (opened_at, closed_at))
         else:
             cursor.execute('''
-                SELECT * FROM orders 
+                SELECT * FROM orders_all 
                 WHERE created_at >= ?
                 ORDER BY created_at DESC
             ''', (opened_at,))
 
         return cursor.fetchall()
 
+    def get_shift_order_items(self, opened_at):
+        """Заказы открытой смены с позициями и категориями меню - для восстановления живой статистики"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT o.id, o.status, o.payment_method, oi.item_name, oi.price, oi.quantity, m.category
+            FROM orders o
+            LEFT JOIN order_items oi ON oi.order_id = o.id
+            LEFT JOIN menu_items m ON m.name = oi.item_name
+            WHERE o.created_at >= ?
+            ORDER BY o.id, oi.id
+        ''', (opened_at,))
+        return cursor.fetchall()
+
     def get_next_shift_number(self, month_year=None):
         cursor = self.conn.cursor()
 
@@ -1170,13 +1804,49 @@ class Database:
 
         cursor.execute('''
             SELECT item_name, SUM(quantity) as total_quantity, SUM(total_amount) as total_amount
-            FROM shift_sales 
+            FROM shift_sales_all 
             WHERE shift_id = ?
             GROUP BY item_name
             ORDER BY total_amount DESC
         ''', (shift_id,))
         return cursor.fetchall()
 
+    def iter_shift_order_lines(self, year=None, month_year=None, shift_number=None, batch_size=500):
+        """
+        Позиции заказов закрытых смен (за год, месяц или одну смену) пачками через fetchmany - для выгрузки.
+        Строка: (month_year, shift_number, order_id, table_number, created_at, closed_at, payment_method,
+        item_name, price, quantity, сумма)
+        """
+        conditions, params = ["s.status = 'closed'"], []
+        if year:
+            conditions.append('substr(s.month_year, 1, 4) = ?')
+            params.append(str(year))
+        if month_year:
+            conditions.append('s.month_year = ?')
+            params.append(month_year)
+        if shift_number is not None:
+            conditions.append('s.shift_number = ?')
+            params.append(shift_number)
+
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT s.month_year, s.shift_number, o.id, o.table_number, o.created_at, o.closed_at,
+                   o.payment_method, oi.item_name, oi.price, oi.quantity, oi.price * oi.quantity
+            FROM shifts s
+            JOIN orders_all o ON o.created_at >= s.opened_at AND o.created_at <= s.closed_at
+            JOIN order_items_all oi ON oi.order_id = o.id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY s.opened_at, o.id, oi.id
+        ''', params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
     def get_shift_years(self):
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -1251,7 +1921,7 @@ class Database:
             start_date = datetime.now().replace(day=1).strftime('%Y-%m-%d')
             cursor.execute('''
                 SELECT ss.item_name, SUM(ss.quantity) as total_quantity, SUM(ss.total_amount) as total_amount
-                FROM shift_sales ss
+                FROM shift_sales_all ss
                 JOIN shifts s ON ss.shift_id = s.id
                 WHERE DATE(s.opened_at) >= ? AND s.status = 'closed'
                 GROUP BY ss.item_name
@@ -1261,7 +1931,7 @@ class Database:
             start_date = datetime.now().replace(month=1, day=1).strftime('%Y-%m-%d')
             cursor.execute('''
                 SELECT ss.item_name, SUM(ss.quantity) as total_quantity, SUM(ss.total_amount) as total_amount
-                FROM shift_sales ss
+                FROM shift_sales_all ss
                 JOIN shifts s ON ss.shift_id = s.id
                 WHERE DATE(s.opened_at) >= ? AND s.status = 'closed'
                 GROUP BY ss.item_name
@@ -1270,7 +1940,7 @@ class Database:
         else:
             cursor.execute('''
                 SELECT ss.item_name, SUM(ss.quantity) as total_quantity, SUM(ss.total_amount) as total_amount
-                FROM shift_sales ss
+                FROM shift_sales_all ss
                 JOIN shifts s ON ss.shift_id = s.id
                 WHERE s.status = 'closed'
                 GROUP BY ss.item_name
@@ -1303,7 +1973,7 @@ class Database:
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT ss.item_name, SUM(ss.quantity) as total_quantity, SUM(ss.total_amount) as total_amount
-            FROM shift_sales ss
+            FROM shift_sales_all ss
             JOIN shifts s ON ss.shift_id = s.id
             WHERE substr(s.month_year, 1, 4) = ? AND s.status = 'closed'
             GROUP BY ss.item_name
@@ -1326,7 +1996,7 @@ class Database:
 
         cursor.execute('''
             SELECT ss.item_name, SUM(ss.quantity) as total_quantity, SUM(ss.total_amount) as total_amount
-            FROM shift_sales ss
+            FROM shift_sales_all ss
             JOIN shifts s ON ss.shift_id = s.id
             WHERE s.month_year = ? AND s.status = 'closed'
             GROUP BY ss.item_name
@@ -1375,6 +2045,262 @@ class Database:
     def get_current_month_year(self):
         return datetime.now().strftime('%Y-%m')
 
+    # ========== АРХИВНАЯ БД ==========
+
+    def attach_archive(self, read_only=False):
+        """
+        Подключить архивную БД и создать представления <таблица>_all = основная таблица + архив.
+        read_only - для подключений только на чтение (открытых с uri=True): архив не создается и не меняется
+        """
+        cursor = self.conn.cursor()
+        if read_only:
+            cursor.execute('ATTACH DATABASE ? AS archive', (read_only_uri(ARCHIVE_DB_NAME),))
+        else:
+            cursor.execute('ATTACH DATABASE ? AS archive', (ARCHIVE_DB_NAME,))
+            self._create_archive_tables(cursor)
+
+        for table, columns in ARCHIVE_TABLES.items():
+            # Представление над другой схемой может быть только временным - оно создается на каждом подключении
+            column_list = ', '.join(columns)
+            cursor.execute(f'''
+                CREATE TEMP VIEW IF NOT EXISTS {table}_all AS
+                SELECT {column_list} FROM main.{table}
+                UNION ALL
+                SELECT {column_list} FROM archive.{table}
+            ''')
+
+        self.conn.commit()
+
+    def _create_archive_tables(self, cursor):
+        for table, columns in ARCHIVE_TABLES.items():
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} (id INTEGER PRIMARY KEY, {", ".join(columns[1:])})')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_created ON orders (created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_order_items_order ON order_items (order_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_shift_sales_shift ON shift_sales (shift_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_bookings_date ON bookings (booking_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_bookings_user ON bookings (user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_bookings_status_id ON bookings (status, id)')
+
+        # Операции, перенесенные в архив до появления архивной БД
+        cursor.execute("SELECT name FROM main.sqlite_master WHERE type='table' AND name='transactions_archive'")
+        if cursor.fetchone():
+            columns = ', '.join(ARCHIVE_TABLES['transactions'])
+            cursor.execute(f'INSERT OR IGNORE INTO archive.transactions ({columns}) '
+                           f'SELECT {columns} FROM main.transactions_archive')
+            cursor.execute('DROP TABLE main.transactions_archive')
+
+    # ========== ОБСЛУЖИВАНИЕ БД ==========
+
+    def get_storage_stats(self):
+        """Размер файла БД и WAL, размер страницы, число страниц и свободных страниц"""
+        cursor = self.conn.cursor()
+        stats = {}
+        for pragma in ('page_size', 'page_count', 'freelist_count'):
+            cursor.execute(f'PRAGMA main.{pragma}')
+            stats[pragma] = cursor.fetchone()[0]
+
+        wal_path = DB_NAME + '-wal'
+        stats['file_size'] = os.path.getsize(DB_NAME)
+        stats['wal_size'] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        return stats
+
+    def get_last_maintenance_at(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT MAX(run_at) FROM db_maintenance_log')
+        return cursor.fetchone()[0]
+
+    def run_maintenance(self):
+        """
+        Статистика для планировщика, возврат свободных страниц и усечение WAL.
+        Тяжелые шаги - запускать в нерабочее время. Возвращает записанную статистику
+        """
+        started = time.monotonic()
+        cursor = self.conn.cursor()
+        freelist_before = self.get_storage_stats()['freelist_count']
+        actions = []
+
+        # Первый запуск - полный ANALYZE, дальше optimize пересчитывает только устаревшую статистику
+        cursor.execute('PRAGMA analysis_limit = 1000')
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'")
+        if cursor.fetchone():
+            cursor.execute('PRAGMA optimize')
+            actions.append('optimize')
+        else:
+            cursor.execute('ANALYZE main')
+            actions.append('analyze')
+        self.conn.commit()
+
+        cursor.execute('PRAGMA main.auto_vacuum')
+        if cursor.fetchone()[0] != 2:
+            # Инкрементальный режим для существующей БД включается только полным VACUUM (один раз)
+            cursor.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+            cursor.execute('VACUUM main')
+            actions.append('vacuum')
+        elif freelist_before:
+            # executescript выполняет прагму до конца (execute освобождает лишь одну страницу за шаг)
+            self.conn.executescript('PRAGMA main.incremental_vacuum;')
+            actions.append('incremental_vacuum')
+
+        cursor.execute('PRAGMA main.wal_checkpoint(TRUNCATE)')
+        busy = cursor.fetchone()[0]
+        actions.append('checkpoint_busy' if busy else 'checkpoint')
+
+        stats = self.get_storage_stats()
+        stats['freed_pages'] = max(freelist_before - stats['freelist_count'], 0)
+        stats['duration'] = round(time.monotonic() - started, 3)
+        stats['actions'] = ','.join(actions)
+
+        cursor.execute('''
+            INSERT INTO db_maintenance_log (run_at, file_size, wal_size, page_size, page_count,
+                                            freelist_count, freed_pages, duration, actions)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (self.get_moscow_time(), stats['file_size'], stats['wal_size'], stats['page_size'],
+              stats['page_count'], stats['freelist_count'], stats['freed_pages'], stats['duration'], stats['actions']))
+        self.conn.commit()
+        return stats
+
+    def archive_old_data(self, before_date):
+        """
+        Перенести в архивную БД закрытые заказы, продажи закрытых смен и брони старше before_date (ГГГГ-ММ-ДД),
+        а также свернутые в снимки бонусные операции. Возвращает {таблица: перенесено строк}.
+        Ожидающие брони не переносятся: их подтверждают и отменяют в основной БД
+        """
+        # Позиции - раньше заказов: условие для них строится по заказам в основной БД
+        moved = self._move_to_archive({
+            'order_items': "order_id IN (SELECT id FROM main.orders WHERE status = 'closed' AND closed_at < ?)",
+            'orders': "status = 'closed' AND closed_at < ?",
+            'shift_sales': "shift_id IN (SELECT id FROM main.shifts WHERE status = 'closed' AND closed_at < ?)",
+            'bookings': f"status != 'pending' AND {BOOKING_DATE_ISO_SQL} < ?",
+        }, before_date)
+        moved['transactions'] = self.archive_ledger_transactions(before_date)
+        return moved
+
+    def _move_to_archive(self, conditions, value):
+        """Перенести строки, подходящие под условия {таблица: WHERE с одним параметром}"""
+        # В WAL транзакция над двумя файлами не атомарна: каждый файл фиксируется отдельно. Поэтому сначала
+        # фиксируется копия в архиве, и только потом отдельной транзакцией удаляются строки, которые там уже есть.
+        # Сбой между шагами оставит строку в обеих БД (следующий перенос ее доудалит), но не потеряет ее
+        with self.conn:
+            for table, condition in conditions.items():
+                columns = ', '.join(ARCHIVE_TABLES[table])
+                self.conn.execute(f'''
+                    INSERT OR IGNORE INTO archive.{table} ({columns})
+                    SELECT {columns} FROM main.{table} WHERE {condition}
+                ''', (value,))
+
+        moved = {}
+        with self.conn:
+            for table, condition in conditions.items():
+                cursor = self.conn.execute(f'''
+                    DELETE FROM main.{table}
+                    WHERE {condition} AND id IN (SELECT id FROM archive.{table})
+                ''', (value,))
+                moved[table] = cursor.rowcount
+        return moved
+
+    # ========== СНИМКИ БОНУСНОГО ЛЕДЖЕРА ==========
+
+    def get_ledger_folded_until(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT folded_until FROM ledger_state WHERE id = 1')
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+    def build_ledger_snapshot(self):
+        """Свернуть завершенные месяцы transactions в ledger_monthly. Возвращает число новых месяцев"""
+        now = datetime.now(pytz.timezone('Europe/Moscow'))
+        horizon = now.strftime('%Y-%m-01')
+
+        # Месяц открытой смены не сворачиваем: ее отчет считается по transactions
+        active_shift = self.get_active_shift()
+        if active_shift and active_shift[4] and active_shift[4] < horizon:
+            horizon = active_shift[4][:7] + '-01'
+
+        folded_until = self.get_ledger_folded_until()
+        if folded_until and folded_until >= horizon:
+            return 0
+
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT strftime('%Y-%m', date) FROM transactions
+            WHERE date >= ? AND date < ?
+            ORDER BY 1
+        ''', (folded_until or '', horizon))
+        months = [row[0] for row in cursor.fetchall() if row[0]]
+
+        try:
+            for month in months:
+                year, month_number = map(int, month.split('-'))
+                next_month = f"{year + month_number // 12}-{month_number % 12 + 1:02d}-01"
+
+                # Закрывающий баланс = баланс на конец предыдущего месяца + операции месяца
+                cursor.execute('''
+                    INSERT OR REPLACE INTO ledger_monthly (month, user_id, earned, spent, closing_balance)
+                    SELECT ?, t.user_id,
+                           SUM(CASE WHEN t.amount > 0 THEN t.amount ELSE 0 END),
+                           SUM(CASE WHEN t.type = 'spend' THEN t.amount ELSE 0 END),
+                           COALESCE((SELECT lm.closing_balance FROM ledger_monthly lm
+                                     WHERE lm.user_id = t.user_id AND lm.month < ?
+                                     ORDER BY lm.month DESC LIMIT 1), 0) + SUM(t.amount)
+                    FROM transactions t
+                    WHERE t.date >= ? AND t.date < ?
+                    GROUP BY t.user_id
+                ''', (month, month, f"{month}-01", next_month))
+
+            cursor.execute('''
+                INSERT OR IGNORE INTO shift_bonus_spend (shift_id, spent)
+                SELECT s.id, COALESCE((
+                    SELECT SUM(t.amount) FROM transactions t
+                    WHERE t.type = 'spend' AND t.date >= s.opened_at AND t.date <= s.closed_at
+                ), 0)
+                FROM shifts s
+                WHERE s.closed_at IS NOT NULL AND s.closed_at < ?
+            ''', (horizon,))
+
+            cursor.execute('''
+                INSERT INTO ledger_state (id, folded_until, last_snapshot_at)
+                VALUES (1, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    folded_until = excluded.folded_until,
+                    last_snapshot_at = excluded.last_snapshot_at
+            ''', (horizon, self.get_moscow_time()))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        return len(months)
+
+    def archive_ledger_transactions(self, before_date):
+        """Перенести в архивную БД операции старше before_date, уже свернутые в снимки"""
+        folded_until = self.get_ledger_folded_until()
+        if not folded_until:
+            return 0
+
+        boundary = min(before_date, folded_until)
+        return self._move_to_archive({'transactions': 'date < ?'}, boundary)['transactions']
+
+    def _sum_spent_since(self, start_date=None):
+        """Списания с начала месяца start_date (или за все время): снимки + хвост transactions"""
+        cursor = self.conn.cursor()
+        start_date = start_date or ''
+        folded_until = self.get_ledger_folded_until()
+
+        folded = 0
+        tail_start = start_date
+        if folded_until:
+            cursor.execute('''
+                SELECT SUM(spent) FROM ledger_monthly WHERE month >= ? AND month < ?
+            ''', (start_date[:7], folded_until[:7]))
+            folded = cursor.fetchone()[0] or 0
+            tail_start = max(start_date, folded_until)
+
+        cursor.execute('''
+            SELECT SUM(amount) FROM transactions WHERE type = 'spend' AND date >= ?
+        ''', (tail_start,))
+        return folded + (cursor.fetchone()[0] or 0)
+
     def get_spent_bonuses_by_shift(self, shift_number, month_year):
         cursor = self.conn.cursor()
 
@@ -1385,6 +2311,12 @@ class Database:
         shift_id = shift[0]
         opened_at, closed_at = shift[4], shift[5]
 
+        # Закрытая смена могла быть зафиксирована при снимке леджера
+        cursor.execute('SELECT spent FROM shift_bonus_spend WHERE shift_id = ?', (shift_id,))
+        frozen = cursor.fetchone()
+        if frozen:
+            return frozen[0] or 0
+
         if closed_at:
             cursor.execute('''
                 SELECT SUM(amount) 
@@ -1411,52 +2343,51 @@ class Database:
         else:
             month_str = f"{year}-{month}"
 
-        cursor.execute('''
-            SELECT SUM(amount) 
-            FROM transactions 
-            WHERE type = 'spend' 
-            AND strftime('%Y-%m', date) = ?
-        ''', (month_str,))
+        folded_until = self.get_ledger_folded_until()
+        if folded_until and month_str < folded_until[:7]:
+            cursor.execute('SELECT SUM(spent) FROM ledger_monthly WHERE month = ?', (month_str,))
+        else:
+            cursor.execute('''
+                SELECT SUM(amount) 
+                FROM transactions 
+                WHERE type = 'spend' 
+                AND strftime('%Y-%m', date) = ?
+            ''', (month_str,))
 
         result = cursor.fetchone()
         return result[0] or 0
 
     def get_spent_bonuses_by_year(self, year):
         cursor = self.conn.cursor()
+        folded_until = self.get_ledger_folded_until() or ''
+
+        folded = 0
+        if folded_until:
+            cursor.execute('''
+                SELECT SUM(spent) FROM ledger_monthly WHERE month LIKE ? AND month < ?
+            ''', (f"{year}-%", folded_until[:7]))
+            folded = cursor.fetchone()[0] or 0
+
         cursor.execute('''
             SELECT SUM(amount) 
             FROM transactions 
             WHERE type = 'spend' 
             AND strftime('%Y', date) = ?
-        ''', (year,))
+            AND date >= ?
+        ''', (year, folded_until))
 
         result = cursor.fetchone()
-        return result[0] or 0
+        return folded + (result[0] or 0)
 
     def get_spent_bonuses_by_period(self, period):
-        cursor = self.conn.cursor()
-
         if period == 'month':
             start_date = datetime.now().replace(day=1).strftime('%Y-%m-%d')
-            cursor.execute('''
-                SELECT SUM(amount) 
-                FROM transactions 
-                WHERE type = 'spend' 
-                AND date >= ?
-            ''', (start_date,))
         elif period == 'year':
             start_date = datetime.now().replace(month=1, day=1).strftime('%Y-%m-%d')
-            cursor.execute('''
-                SELECT SUM(amount) 
-                FROM transactions 
-                WHERE type = 'spend' 
-                AND date >= ?
-            ''', (start_date,))
         else:
-            cursor.execute('SELECT SUM(amount) FROM transactions WHERE type = "spend"')
+            start_date = None
 
-        result = cursor.fetchone()
-        return result[0] or 0
+        return self._sum_spent_since(start_date)
 
     def get_payment_statistics_by_month(self, year, month):
         cursor = self.conn.cursor()
@@ -1467,8 +2398,8 @@ class Database:
             FROM (
                 SELECT o.id, o.payment_method, 
                        SUM(oi.price * oi.quantity) as total
-                FROM orders o
-                LEFT JOIN order_items oi ON o.id = oi.order_id
+                FROM orders_all o
+                LEFT JOIN order_items_all oi ON o.id = oi.order_id
                 WHERE strftime('%Y-%m', o.created_at) = ? 
                     AND o.status = 'closed'
                     AND o.payment_method IS NOT NULL
@@ -1491,8 +2422,8 @@ class Database:
             FROM (
                 SELECT o.id, o.payment_method, 
                        SUM(oi.price * oi.quantity) as total
-                FROM orders o
-                LEFT JOIN order_items oi ON o.id = oi.order_id
+                FROM orders_all o
+                LEFT JOIN order_items_all oi ON o.id = oi.order_id
                 WHERE strftime('%Y', o.created_at) = ? 
                     AND o.status = 'closed'
                     AND o.payment_method IS NOT NULL
@@ -1507,6 +2438,96 @@ class Database:
 
         return stats
 
+    def add_username_column(self):
+        cursor = self.conn.cursor()
+        cursor.execute("PRAGMA table_info(users)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if 'username' not in columns:
+            cursor.execute('ALTER TABLE users ADD COLUMN username TEXT DEFAULT NULL')
+            self.conn.commit()
+            return True
+        return False
+
+    def create_user_search_index(self):
+        """Полнотекстовый индекс users_fts (FTS5), синхронизируется с users триггерами"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users_fts'")
+        index_exists = cursor.fetchone()
+
+        if index_exists:
+            # Индекс, построенный по старым правилам (например, без номера телефона без кода), перестраивается
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name='users_fts_insert'")
+            trigger = cursor.fetchone()
+            if not trigger or _user_search_values('new') not in trigger[0]:
+                for name in ('insert', 'update', 'delete'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS users_fts_{name}')
+                cursor.execute('DELETE FROM users_fts')
+                index_exists = None
+
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                name, phone, telegram_id, username,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+
+        columns = 'rowid, name, phone, telegram_id, username'
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+                INSERT INTO users_fts ({columns}) VALUES ({_user_search_values('new')});
+            END
+        ''')
+        # Только поля поиска: изменения баланса индекс не трогают
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS users_fts_update
+            AFTER UPDATE OF first_name, last_name, phone, telegram_id, username ON users BEGIN
+                DELETE FROM users_fts WHERE rowid = old.id;
+                INSERT INTO users_fts ({columns}) VALUES ({_user_search_values('new')});
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+                DELETE FROM users_fts WHERE rowid = old.id;
+            END
+        ''')
+
+        if not index_exists:
+            cursor.execute(f'INSERT INTO users_fts ({columns}) SELECT {_user_search_values("users")} FROM users')
+        self.conn.commit()
+
+    def create_dashboard_triggers(self):
+        """Изменения, влияющие на панель статистики, увеличивают dashboard_state.version"""
+        cursor = self.conn.cursor()
+        watched = {
+            'users': 'bonus_balance, is_active',
+            'bookings': 'status',
+            'bonus_requests': 'status',
+        }
+        for table, columns in watched.items():
+            for event in ('INSERT', 'DELETE', f'UPDATE OF {columns}'):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS dashboard_{table}_{event.split()[0].lower()}
+                    AFTER {event} ON {table} BEGIN
+                        UPDATE dashboard_state SET version = version + 1 WHERE id = 1;
+                    END
+                ''')
+        self.conn.commit()
+
+    def create_report_triggers(self):
+        """Любое изменение заказов, смен и бонусных операций увеличивает report_state.version"""
+        cursor = self.conn.cursor()
+        for table in ('orders', 'order_items', 'shifts', 'shift_sales', 'transactions'):
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS report_{table}_{event.lower()}
+                    AFTER {event} ON {table} BEGIN
+                        UPDATE report_state SET version = version + 1 WHERE id = 1;
+                    END
+                ''')
+        self.conn.commit()
+
     def add_payment_method_column(self):
         cursor = self.conn.cursor()
         cursor.execute("PRAGMA table_info(orders)")
@@ -1518,6 +2539,58 @@ class Database:
             return True
         return False
 
+    def add_order_version_column(self):
+        """Версия заказа для оптимистичной блокировки (растет при каждом изменении)"""
+        cursor = self.conn.cursor()
+        cursor.execute("PRAGMA table_info(orders)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if 'version' not in columns:
+            cursor.execute('ALTER TABLE orders ADD COLUMN version INTEGER DEFAULT 0')
+            self.conn.commit()
+            return True
+        return False
+
+    def add_shift_summary_column(self):
+        """Итоги смены, зафиксированные при закрытии (JSON)"""
+        cursor = self.conn.cursor()
+        cursor.execute("PRAGMA table_info(shifts)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if 'summary' not in columns:
+            cursor.execute('ALTER TABLE shifts ADD COLUMN summary TEXT DEFAULT NULL')
+            self.conn.commit()
+            return True
+        return False
+
+    def save_shift_summary(self, shift_id, summary):
+        cursor = self.conn.cursor()
+        cursor.execute('UPDATE shifts SET summary = ? WHERE id = ?',
+                       (json.dumps(summary, ensure_ascii=False), shift_id))
+        self.conn.commit()
+
+    def get_shift_summary(self, shift_number, month_year):
+        """Итоги закрытой смены словарем или None (смена открыта или закрыта до появления итогов)"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT summary FROM shifts WHERE shift_number = ? AND month_year = ?',
+                       (shift_number, month_year))
+        result = cursor.fetchone()
+        return json.loads(result[0]) if result and result[0] else None
+
+    def get_order_version(self, order_id):
+        """(status, version) заказа или None"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT status, version FROM orders WHERE id = ?', (order_id,))
+        return cursor.fetchone()
+
+    def bump_order_version(self, cursor, order_id, expected_version):
+        """Compare-and-swap: увеличить версию, только если заказ не менялся. Без commit"""
+        cursor.execute('''
+            UPDATE orders SET version = version + 1
+            WHERE id = ? AND version = ?
+        ''', (order_id, expected_version))
+        return cursor.rowcount == 1
+
     def update_order_payment_method(self, order_id, payment_method):
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -1541,8 +2614,8 @@ class Database:
                 FROM (
                     SELECT o.id, o.payment_method, 
                            SUM(oi.price * oi.quantity) as total
-                    FROM orders o
-                    LEFT JOIN order_items oi ON o.id = oi.order_id
+                    FROM orders_all o
+                    LEFT JOIN order_items_all oi ON o.id = oi.order_id
                     WHERE o.created_at >= ? AND o.created_at <= ? 
                         AND o.status = 'closed'
                         AND o.payment_method IS NOT NULL
@@ -1556,8 +2629,8 @@ class Database:
                 FROM (
                     SELECT o.id, o.payment_method, 
                            SUM(oi.price * oi.quantity) as total
-                    FROM orders o
-                    LEFT JOIN order_items oi ON o.id = oi.order_id
+                    FROM orders_all o
+                    LEFT JOIN order_items_all oi ON o.id = oi.order_id
                     WHERE o.created_at >= ? 
                         AND o.status = 'closed'
                         AND o.payment_method IS NOT NULL
@@ -1582,8 +2655,8 @@ class Database:
                 FROM (
                     SELECT o.id, o.payment_method, 
                            SUM(oi.price * oi.quantity) as total
-                    FROM orders o
-                    LEFT JOIN order_items oi ON o.id = oi.order_id
+                    FROM orders_all o
+                    LEFT JOIN order_items_all oi ON o.id = oi.order_id
                     WHERE o.created_at >= ? 
                         AND o.status = 'closed'
                         AND o.payment_method IS NOT NULL
@@ -1598,8 +2671,8 @@ class Database:
                 FROM (
                     SELECT o.id, o.payment_method, 
                            SUM(oi.price * oi.quantity) as total
-                    FROM orders o
-                    LEFT JOIN order_items oi ON o.id = oi.order_id
+                    FROM orders_all o
+                    LEFT JOIN order_items_all oi ON o.id = oi.order_id
                     WHERE o.created_at >= ? 
                         AND o.status = 'closed'
                         AND o.payment_method IS NOT NULL
@@ -1613,8 +2686,8 @@ class Database:
                 FROM (
                     SELECT o.id, o.payment_method, 
                            SUM(oi.price * oi.quantity) as total
-                    FROM orders o
-                    LEFT JOIN order_items oi ON o.id = oi.order_id
+                    FROM orders_all o
+                    LEFT JOIN order_items_all oi ON o.id = oi.order_id
                     WHERE o.status = 'closed'
                         AND o.payment_method IS NOT NULL
                     GROUP BY o.id
@@ -58,6 +58,7 @@ from .admin_bookings import (
     show_confirmed_bookings,
     show_cancelled_bookings,
     show_all_bookings,
+    handle_bookings_page,
     back_to_booking_menu,
     handle_booking_action,
     handle_booking_cancellation_with_reason,
@@ -75,6 +76,7 @@ from .admin_bonuses import (
 
 from .admin_messages import (
     get_broadcast_handler,
+    get_broadcast_album_handler,
     get_user_message_handler,
     message_user_callback,
     broadcast_message,
@@ -156,6 +158,8 @@ from .order_history import (
     show_full_month_history,
     show_more_shifts,
     show_selected_shift_history,
+    handle_report_page,
+    handle_report_export,
     show_select_shift_menu,
     show_today_orders,
     show_yesterday_orders,
@@ -246,6 +250,7 @@ __all__ = [
     'show_confirmed_bookings',
     'show_cancelled_bookings',
     'show_all_bookings',
+    'handle_bookings_page',
     'back_to_booking_menu',
     'handle_booking_action',
     'handle_booking_cancellation_with_reason',
@@ -265,6 +270,7 @@ __all__ = [
 
     # admin_messages
     'get_broadcast_handler',
+    'get_broadcast_album_handler',
     'get_user_message_handler',
     'message_user_callback',
     'broadcast_message',
@@ -336,6 +342,8 @@ __all__ = [
     'show_full_month_history',
     'show_more_shifts',
     'show_selected_shift_history',
+    'handle_report_page',
+    'handle_report_export',
     'show_select_shift_menu',
     'show_today_orders',
     'show_yesterday_orders',
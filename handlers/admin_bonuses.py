@@ -115,32 +115,30 @@ async def handle_bonus_request_action(update: Update, context: ContextTypes.DEFA
     user_data = db.get_user_by_id(request_data[1])
 
     if action == 'approve':
-        # Проверяем достаточно ли баллов
-        if request_data[2] > user_data[5]:
+        # Списание баллов (проверка баланса и смена статуса запроса - в той же транзакции)
+        success, result = db.approve_bonus_request(request_id)
+        if not success:
             try:
-                await query.edit_message_text("❌ У пользователя недостаточно баллов для списания.")
+                await query.edit_message_text(f"❌ {result}.")
             except Exception as e:
                 if "Message is not modified" not in str(e):
                     logger.error(f"Ошибка при обработке запроса на списание: {e}")
                     from message_manager import message_manager
                     await message_manager.send_message(
                         update, context,
-                        "❌ У пользователя недостаточно баллов для списания.",
+                        f"❌ {result}.",
                         is_temporary=True
                     )
             return
 
-        # Списание баллов
-        db.update_user_balance(request_data[1], -request_data[2])
-        db.update_bonus_request(request_id, 'approved')
-        db.add_transaction(request_data[1], -request_data[2], 'spend', 'Списание по запросу')
+        new_balance = result
 
         # Уведомляем пользователя
         try:
             await context.bot.send_message(
                 user_data[1],
                 f"✅ Ваш запрос на списание {request_data[2]} бонусных баллов одобрен!\n"
-                f"💰 Новый баланс: {user_data[5] - request_data[2]} баллов"
+                f"💰 Новый баланс: {new_balance} баллов"
             )
         except Exception as e:
             logger.error(f"Не удалось уведомить пользователя: {e}")
@@ -215,6 +213,8 @@ def get_bonus_handler():
         return ConversationHandler.END
 
     return ConversationHandler(
+        name="bonus",
+        persistent=True,
         entry_points=[
             CallbackQueryHandler(add_bonus_callback, pattern="^add_bonus_"),
             CallbackQueryHandler(remove_bonus_callback, pattern="^remove_bonus_")
@@ -7,6 +7,7 @@ from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboard
 from telegram.ext import ContextTypes, ConversationHandler, CallbackQueryHandler, MessageHandler, filters
 from config import ADMIN_IDS
 from database import Database
+from utils.pagination import parse_page_callback, fetch_page, page_navigation, show_page
 
 logger = logging.getLogger(__name__)
 db = Database()
@@ -14,6 +15,8 @@ db = Database()
 # Состояния для фильтрации бронирований
 SELECTING_YEAR, SELECTING_MONTH, SELECTING_DATE, AWAITING_CANCELLATION_REASON = range(4)
 
+BOOKINGS_PER_PAGE = 10
+
 
 def is_admin(user_id):
     return user_id in ADMIN_IDS
@@ -114,180 +117,182 @@ async def show_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-async def show_pending_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать ожидающие бронирования"""
-    if not is_admin(update.effective_user.id):
-        return
+# Заголовок списка и текст для пустого списка по статусу ('all' - все бронирования)
+BOOKING_LISTS = {
+    'pending': ("⏳ Ожидающие бронирования", "⏳ Нет ожидающих бронирований."),
+    'confirmed': ("✅ Подтвержденные бронирования", "✅ Нет подтвержденных бронирований."),
+    'cancelled': ("❌ Отмененные бронирования", "❌ Нет отмененных бронирований."),
+    'all': ("📋 Все бронирования", "📭 Бронирования не найдены."),
+}
+BOOKINGS_PAGE_PREFIX = "bookings_page_"
+# Суффикс callback_data кнопок действий из списка: результат не должен затирать сам список
+BOOKING_LIST_ACTION_SUFFIX = "_list"
+
+
+def _format_booking_line(booking):
+    """Краткая запись о бронировании для списка (полная - _format_booking_message)"""
+    status_emoji = {'pending': '⏳', 'confirmed': '✅', 'cancelled': '❌'}
+    comment = booking[7] or ""
+    if len(comment) > 100:
+        comment = comment[:100] + "…"
+
+    line = (
+        f"{status_emoji.get(booking[8], '📅')} #{booking[0]} | {booking[4]} {booking[5]} | 👥 {booking[6]}\n"
+        f"   👤 {booking[2] or 'Не указано'} 📱 {booking[3] or 'Не указано'}"
+    )
+    if comment:
+        line += f"\n   💬 {comment}"
+    return line
+
+
+def _render_bookings_page(context: ContextTypes.DEFAULT_TYPE, status: str, before_id=None, after_id=None, page=1):
+    """
+    Текст и кнопки страницы бронирований; keyboard = None, если список пуст.
+    Курсор показанной страницы запоминается в user_data, чтобы перерисовать ее после действия
+    """
+    bookings, has_prev, has_next = fetch_page(
+        lambda before, after, limit: db.get_bookings_page(
+            None if status == 'all' else status, before, after, limit
+        ),
+        before_id, after_id, BOOKINGS_PER_PAGE
+    )
+    if not bookings and (before_id is not None or after_id is not None):
+        # Страница опустела (бронирования с нее подтверждены или отменены) - показываем первую
+        return _render_bookings_page(context, status)
 
-    from message_manager import message_manager
-    from keyboards.menus import get_booking_filter_menu, get_booking_actions_keyboard
+    context.user_data['booking_list_cursor'] = (status, before_id, after_id, page)
+    title, empty_text = BOOKING_LISTS[status]
+    if not bookings:
+        return empty_text, None
+
+    # Счетчики для заголовка считаются при открытии списка, листание их не пересчитывает
+    stats = context.user_data.get('booking_list_stats')
+    if stats is None:
+        stats = db.get_booking_stats()
+        context.user_data['booking_list_stats'] = stats
+    total = stats.get('total' if status == 'all' else status, 0)
+    total_pages = max((total + BOOKINGS_PER_PAGE - 1) // BOOKINGS_PER_PAGE, page)
+
+    message = f"{title} ({total}), стр. {page}/{total_pages}:\n\n"
+    message += "\n\n".join(_format_booking_line(booking) for booking in bookings)
+
+    # Для ожидающих бронирований - кнопки действий
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                f"✅ #{booking[0]}", callback_data=f"confirm_booking_{booking[0]}{BOOKING_LIST_ACTION_SUFFIX}"
+            ),
+            InlineKeyboardButton(
+                f"❌ #{booking[0]}", callback_data=f"cancel_booking_reason_{booking[0]}{BOOKING_LIST_ACTION_SUFFIX}"
+            )
+        ]
+        for booking in bookings if booking[8] == 'pending'
+    ]
+    nav_buttons = page_navigation(f"{BOOKINGS_PAGE_PREFIX}{status}_", bookings, has_prev, has_next, page)
+    if nav_buttons:
+        keyboard.append(nav_buttons)
 
-    # Очищаем только временные сообщения при переходе между разделами
-    await message_manager.cleanup_user_messages(context, update.effective_user.id)
+    return message, keyboard
 
-    bookings = db.get_bookings_by_status('pending')
-    
-    logger.info(f"📊 Найдено ожидающих бронирований: {len(bookings)}")
 
-    if not bookings:
-        await message_manager.send_message(
-            update, context,
-            "⏳ Нет ожидающих бронирований.",
-            reply_markup=get_booking_filter_menu(),
-            is_temporary=True
-        )
-        return
-
-    await message_manager.send_message(
-        update, context,
-        f"⏳ Ожидающие бронирования ({len(bookings)}):",
-        reply_markup=get_booking_filter_menu(),
-        is_temporary=False
-    )
+async def _show_bookings_list(update: Update, context: ContextTypes.DEFAULT_TYPE, status: str,
+                              before_id=None, after_id=None, page=1):
+    """Страница бронирований одним сообщением; листание редактирует это же сообщение"""
+    from message_manager import message_manager
+    from keyboards.menus import get_booking_filter_menu
 
-    for booking in bookings:
-        message = _format_booking_message(booking)
+    message, keyboard = _render_bookings_page(context, status, before_id, after_id, page)
+    if keyboard is None and not update.callback_query:
         await message_manager.send_message(
             update, context,
             message,
-            reply_markup=get_booking_actions_keyboard(booking[0]),
-            is_temporary=False
+            reply_markup=get_booking_filter_menu() if status != 'all' else None,
+            is_temporary=True
         )
-
-
-async def show_confirmed_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать подтвержденные бронирования"""
-    if not is_admin(update.effective_user.id):
         return
 
-    from message_manager import message_manager
-    from keyboards.menus import get_booking_filter_menu
+    await show_page(update, context, message, keyboard)
 
-    # Очищаем только временные сообщения при переходе между разделами
-    await message_manager.cleanup_user_messages(context, update.effective_user.id)
 
-    bookings = db.get_bookings_by_status('confirmed')
-    
-    logger.info(f"📊 Найдено подтвержденных бронирований: {len(bookings)}")
+async def _refresh_bookings_list(update: Update, context: ContextTypes.DEFAULT_TYPE, list_message=None):
+    """
+    Перерисовать список после действия с бронированием с той же страницы (курсор из user_data).
+    list_message - (chat_id, message_id) списка, если обновление пришло не от его кнопки
+    """
+    status, before_id, after_id, page = context.user_data.get('booking_list_cursor', ('pending', None, None, 1))
+    # Счетчики в заголовке изменились
+    context.user_data.pop('booking_list_stats', None)
 
-    if not bookings:
-        await message_manager.send_message(
-            update, context,
-            "✅ Нет подтвержденных бронирований.",
-            reply_markup=get_booking_filter_menu(),
-            is_temporary=True
-        )
+    if list_message is None:
+        await _show_bookings_list(update, context, status, before_id, after_id, page)
         return
 
-    await message_manager.send_message(
-        update, context,
-        f"✅ Подтвержденные бронирования ({len(bookings)}):",
-        reply_markup=get_booking_filter_menu(),
-        is_temporary=False
-    )
-
-    for booking in bookings:
-        message = _format_booking_message(booking)
-        await message_manager.send_message(
-            update, context,
-            message,
-            is_temporary=False
+    message, keyboard = _render_bookings_page(context, status, before_id, after_id, page)
+    chat_id, message_id = list_message
+    try:
+        await context.bot.edit_message_text(
+            message, chat_id=chat_id, message_id=message_id,
+            reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None
         )
+    except Exception as e:
+        if "Message is not modified" not in str(e):
+            logger.error(f"Ошибка при обновлении списка бронирований: {e}")
 
 
-async def show_cancelled_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать отмененные бронирования"""
+async def _open_bookings_list(update: Update, context: ContextTypes.DEFAULT_TYPE, status: str):
     if not is_admin(update.effective_user.id):
         return
 
     from message_manager import message_manager
-    from keyboards.menus import get_booking_filter_menu
 
     # Очищаем только временные сообщения при переходе между разделами
     await message_manager.cleanup_user_messages(context, update.effective_user.id)
+    context.user_data.pop('booking_list_stats', None)
+    await _show_bookings_list(update, context, status)
 
-    bookings = db.get_bookings_by_status('cancelled')
-    
-    logger.info(f"📊 Найдено отмененных бронирований: {len(bookings)}")
 
-    if not bookings:
-        await message_manager.send_message(
-            update, context,
-            "❌ Нет отмененных бронирований.",
-            reply_markup=get_booking_filter_menu(),
-            is_temporary=True
-        )
-        return
+async def show_pending_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать ожидающие бронирования"""
+    await _open_bookings_list(update, context, 'pending')
 
-    await message_manager.send_message(
-        update, context,
-        f"❌ Отмененные бронирования ({len(bookings)}):",
-        reply_markup=get_booking_filter_menu(),
-        is_temporary=False
-    )
 
-    for booking in bookings:
-        message = _format_booking_message(booking)
-        await message_manager.send_message(
-            update, context,
-            message,
-            is_temporary=False
-        )
+async def show_confirmed_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать подтвержденные бронирования"""
+    await _open_bookings_list(update, context, 'confirmed')
+
+
+async def show_cancelled_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать отмененные бронирования"""
+    await _open_bookings_list(update, context, 'cancelled')
 
 
 async def show_all_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать все бронирования"""
-    if not is_admin(update.effective_user.id):
-        return
+    await _open_bookings_list(update, context, 'all')
 
-    from message_manager import message_manager
-    from keyboards.menus import get_booking_filter_menu, get_booking_actions_keyboard
 
-    # Очищаем только временные сообщения при переходе между разделами
-    await message_manager.cleanup_user_messages(context, update.effective_user.id)
+async def handle_bookings_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание списка бронирований: bookings_page_<статус>_<курсор>"""
+    query = update.callback_query
+    await query.answer()
 
-    bookings = db.get_all_bookings_sorted()
-    
-    logger.info(f"📊 Найдено всех бронирований: {len(bookings)}")
+    if not is_admin(query.from_user.id):
+        return
 
-    if not bookings:
-        await message_manager.send_message(
-            update, context,
-            "📭 Бронирования не найдены.",
-            is_temporary=True
-        )
+    status = query.data[len(BOOKINGS_PAGE_PREFIX):].split('_')[0]
+    if status not in BOOKING_LISTS:
         return
 
-    await message_manager.send_message(
-        update, context,
-        f"📋 Все бронирования ({len(bookings)}):",
-        reply_markup=get_booking_filter_menu(),
-        is_temporary=False
-    )
-
-    for booking in bookings:
-        message = _format_booking_message(booking)
-
-        # Для ожидающих бронирований показываем кнопки действий
-        if booking[8] == 'pending':  # Статус на индексе 8
-            await message_manager.send_message(
-                update, context,
-                message,
-                reply_markup=get_booking_actions_keyboard(booking[0]),
-                is_temporary=False
-            )
-        else:
-            await message_manager.send_message(
-                update, context,
-                message,
-                is_temporary=False
-            )
+    before_id, after_id, page = parse_page_callback(query.data, f"{BOOKINGS_PAGE_PREFIX}{status}_")
+    await _show_bookings_list(update, context, status, before_id, after_id, page)
 
 
 async def handle_booking_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка действий с бронированиями"""
     query = update.callback_query
-    
+    # Кнопка из списка бронирований: результат - отдельным сообщением, список остается на месте
+    from_list = False
+
     # Обработка inline-кнопок
     if query:
         await query.answer()
@@ -313,6 +318,7 @@ async def handle_booking_action(update: Update, context: ContextTypes.DEFAULT_TY
 
         action = parts[0] + '_' + parts[1]
         booking_id = parts[2]
+        from_list = query.data.endswith(BOOKING_LIST_ACTION_SUFFIX)
     
     # Обработка текстовых команд из MiniApp
     elif update.message and update.message.text:
@@ -433,7 +439,15 @@ async def handle_booking_action(update: Update, context: ContextTypes.DEFAULT_TY
         else:
             logger.info("ℹ️ Пользователь не зарегистрирован, уведомление не отправлено")
 
-        if query:
+        if from_list:
+            from message_manager import message_manager
+            await message_manager.send_message(
+                update, context,
+                f"✅ Бронирование #{booking_id} подтверждено.\n👤 Клиент: {display_name}\n📞 Телефон: {customer_phone}",
+                is_temporary=True
+            )
+            await _refresh_bookings_list(update, context)
+        elif query:
             try:
                 await query.edit_message_text(
                     f"✅ Бронирование #{booking_id} подтверждено.\n"
@@ -482,7 +496,15 @@ async def handle_booking_action(update: Update, context: ContextTypes.DEFAULT_TY
         else:
             logger.info("ℹ️ Пользователь не зарегистрирован, уведомление об отмене не отправлено")
 
-        if query:
+        if from_list:
+            from message_manager import message_manager
+            await message_manager.send_message(
+                update, context,
+                f"❌ Бронирование #{booking_id} отменено.\n👤 Клиент: {display_name}\n📞 Телефон: {customer_phone}",
+                is_temporary=True
+            )
+            await _refresh_bookings_list(update, context)
+        elif query:
             try:
                 await query.edit_message_text(
                     f"❌ Бронирование #{booking_id} отменено.\n"
@@ -764,7 +786,7 @@ def get_booking_years():
     try:
         cursor.execute('''
             SELECT DISTINCT booking_date 
-            FROM bookings 
+            FROM bookings_all 
             WHERE booking_date IS NOT NULL AND booking_date != ''
             ORDER BY booking_date DESC
         ''')
@@ -796,7 +818,7 @@ def get_booking_months(year):
     try:
         cursor.execute('''
             SELECT DISTINCT booking_date 
-            FROM bookings 
+            FROM bookings_all 
             WHERE booking_date IS NOT NULL AND booking_date != ''
             ORDER BY booking_date DESC
         ''')
@@ -828,7 +850,7 @@ def get_booking_dates_by_year_month(year, month):
     try:
         cursor.execute('''
             SELECT DISTINCT booking_date 
-            FROM bookings 
+            FROM bookings_all 
             WHERE booking_date IS NOT NULL AND booking_date != ''
             ORDER BY booking_date DESC
         ''')
@@ -1084,10 +1106,22 @@ async def handle_booking_cancellation_with_reason(update: Update, context: Conte
     if not is_admin(query.from_user.id):
         return
 
-    booking_id = int(query.data.split('_')[-1])
+    booking_id = int(query.data[len("cancel_booking_reason_"):].split('_')[0])
     context.user_data['cancelling_booking_id'] = booking_id
 
     from keyboards.menus import get_cancel_keyboard
+    if query.data.endswith(BOOKING_LIST_ACTION_SUFFIX):
+        # Список остается на месте, после отмены он перерисуется
+        context.user_data['cancelling_booking_list'] = (query.message.chat_id, query.message.message_id)
+        from message_manager import message_manager
+        await message_manager.send_message(
+            update, context,
+            f"📝 Укажите причину отмены бронирования #{booking_id}:",
+            reply_markup=get_cancel_keyboard(),
+            is_temporary=True
+        )
+        return AWAITING_CANCELLATION_REASON
+
     try:
         await query.edit_message_text(
             "📝 Укажите причину отмены бронирования:",
@@ -1111,11 +1145,17 @@ async def process_cancellation_reason(update: Update, context: ContextTypes.DEFA
     if update.message.text == "❌ Отмена":
         context.user_data.pop('cancelling_booking_id', None)
         from message_manager import message_manager
+        from keyboards.menus import get_booking_filter_menu
+        list_message = context.user_data.pop('cancelling_booking_list', None)
         await message_manager.send_message(
             update, context,
             "❌ Отмена бронирования отменена.",
+            reply_markup=get_booking_filter_menu() if list_message else None,
             is_temporary=True
         )
+        if list_message:
+            # Возвращаемся к списку бронирований, он остался на месте
+            return ConversationHandler.END
         from handlers.admin_utils import back_to_main_menu
         await back_to_main_menu(update, context)
         return ConversationHandler.END
@@ -1179,6 +1219,22 @@ async def process_cancellation_reason(update: Update, context: ContextTypes.DEFA
         if not display_name:
             display_name = customer_name
 
+    context.user_data.pop('cancelling_booking_id', None)
+    list_message = context.user_data.pop('cancelling_booking_list', None)
+    if list_message:
+        # Отмена из списка: возвращаем меню бронирований и перерисовываем список с той же страницы
+        from keyboards.menus import get_booking_filter_menu
+        await message_manager.send_message(
+            update, context,
+            f"❌ Бронирование #{booking_id} отменено.\n"
+            f"👤 Клиент: {display_name}\n"
+            f"📝 Причина: {reason}",
+            reply_markup=get_booking_filter_menu(),
+            is_temporary=True
+        )
+        await _refresh_bookings_list(update, context, list_message)
+        return ConversationHandler.END
+
     await message_manager.send_message(
         update, context,
         f"❌ Бронирование #{booking_id} отменено.\n"
@@ -1187,7 +1243,6 @@ async def process_cancellation_reason(update: Update, context: ContextTypes.DEFA
         is_temporary=False
     )
 
-    context.user_data.pop('cancelling_booking_id', None)
     import asyncio
     await asyncio.sleep(2)
     from handlers.admin_utils import back_to_main_menu
@@ -1199,6 +1254,8 @@ def get_booking_date_handler():
     """Создать обработчик фильтрации по дате"""
     from telegram.ext import ConversationHandler, MessageHandler, filters
     return ConversationHandler(
+        name="booking_date",
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex("^📅 По дате$"), show_dates_for_filter)],
         states={
             SELECTING_YEAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, select_year_for_filter)],
@@ -1215,6 +1272,8 @@ def get_booking_cancellation_handler():
     from .admin_utils import cancel_operation
 
     return ConversationHandler(
+        name="booking_cancellation",
+        persistent=True,
         entry_points=[
             CallbackQueryHandler(handle_booking_cancellation_with_reason, pattern="^cancel_booking_reason_")
         ],
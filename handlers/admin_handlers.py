@@ -41,6 +41,7 @@ from .admin_bookings import (
     show_confirmed_bookings,
     show_cancelled_bookings,
     show_all_bookings,
+    handle_bookings_page,
     show_dates_for_filter,
     select_year_for_filter,
     select_month_for_filter,
@@ -4,13 +4,17 @@
 import logging
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton  # УЖЕ ЕСТЬ
 from telegram.ext import ContextTypes, ConversationHandler
-from config import ADMIN_IDS
+from config import ADMIN_IDS, USER_SEARCH_LIMIT
 from database import Database
+from utils.pagination import parse_page_callback, fetch_page, page_navigation, show_page
 import asyncio
 
 logger = logging.getLogger(__name__)
 db = Database()
 
+USERS_PER_PAGE = 20
+USERS_PAGE_PREFIX = "show_full_users_list_"
+
 # Состояния для админских функций
 AWAITING_BONUS_AMOUNT, AWAITING_SPENT_AMOUNT, AWAITING_SEARCH_QUERY = range(3)
 
@@ -36,7 +40,8 @@ async def show_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE, pa
         "📌 Просто напишите в чат:\n"
         "• ID пользователя (например: 123)\n"
         "• Имя или фамилию (например: Иван)\n"
-        "• Часть имени\n\n"
+        "• Начало имени, телефона или username\n"
+        "• Telegram ID\n\n"
         "Или нажмите кнопку для просмотра полного списка:",
         reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton("📋 Показать полный список", callback_data="show_full_users_list_0")],
@@ -60,7 +65,7 @@ async def start_user_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await query.edit_message_text(
         "🔍 Поиск пользователя\n\n"
-        "Введите ID пользователя, имя или фамилию для поиска:",
+        "Введите ID пользователя, имя, фамилию, телефон или username для поиска:",
         reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton("❌ Отмена", callback_data="cancel_search")]
         ])
@@ -84,26 +89,8 @@ async def process_user_search(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return AWAITING_SEARCH_QUERY
 
-    # Ищем пользователей в базе данных
-    cursor = db.conn.cursor()
-
-    # Поиск по ID
-    if search_query.isdigit():
-        cursor.execute('''
-            SELECT * FROM users 
-            WHERE id = ? AND is_active = TRUE 
-            ORDER BY id DESC
-        ''', (int(search_query),))
-    else:
-        # Поиск по имени или фамилии
-        search_pattern = f"%{search_query}%"
-        cursor.execute('''
-            SELECT * FROM users 
-            WHERE (first_name LIKE ? OR last_name LIKE ?) AND is_active = TRUE 
-            ORDER BY id DESC
-        ''', (search_pattern, search_pattern))
-
-    users = cursor.fetchall()
+    # Ищем пользователей в базе данных (полнотекстовый индекс, лучшие совпадения первыми)
+    users = db.search_users(search_query, USER_SEARCH_LIMIT)
 
     if not users:
         from message_manager import message_manager
@@ -120,6 +107,8 @@ async def process_user_search(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Показываем найденных пользователей
     message = f"🔍 Результаты поиска по запросу: '{search_query}'\n\n"
     message += f"Найдено пользователей: {len(users)}\n\n"
+    if len(users) >= USER_SEARCH_LIMIT:
+        message += "Показаны лучшие совпадения - уточните запрос, если нужного нет в списке.\n\n"
 
     keyboard = []
     for user in users:
@@ -313,42 +302,24 @@ async def show_full_users_list(update: Update, context: ContextTypes.DEFAULT_TYP
     if not is_admin(query.from_user.id):
         return
 
-    page = 0
-    if query.data.startswith("show_full_users_list_"):
-        try:
-            page = int(query.data.split("_")[-1])
-        except:
-            page = 0
+    # Одна страница - один запрос по ключу, без загрузки всех пользователей
+    before_id, after_id, page = parse_page_callback(query.data, USERS_PAGE_PREFIX)
 
     context.user_data.pop('search_users_mode', None)
-    users = db.get_all_users()
+    users_page, has_prev, has_next = fetch_page(db.get_users_page, before_id, after_id, USERS_PER_PAGE)
 
-    if not users:
+    if not users_page:
         await query.edit_message_text("📭 Пользователи не найдены.")
         return
 
-    users_per_page = 20
-    total_pages = (len(users) + users_per_page - 1) // users_per_page
-
-    if page < 0:
-        page = 0
-    elif page >= total_pages:
-        page = total_pages - 1
+    total_users = db.get_users_count()
+    total_pages = max((total_users + USERS_PER_PAGE - 1) // USERS_PER_PAGE, page)
 
-    start_index = page * users_per_page
-    end_index = min(start_index + users_per_page, len(users))
-    users_page = users[start_index:end_index]
-
-    message = f"👥 Список пользователей (стр. {page + 1}/{total_pages}, всего: {len(users)})\n\n"
+    message = f"👥 Список пользователей (стр. {page}/{total_pages}, всего: {total_users})\n\n"
     message += "Выберите пользователя:"
 
     keyboard = []
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data=f"show_full_users_list_{page - 1}"))
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton("Следующая ➡️", callback_data=f"show_full_users_list_{page + 1}"))
-
+    nav_buttons = page_navigation(USERS_PAGE_PREFIX, users_page, has_prev, has_next, page)
     if nav_buttons:
         keyboard.append(nav_buttons)
 
@@ -362,10 +333,7 @@ async def show_full_users_list(update: Update, context: ContextTypes.DEFAULT_TYP
     keyboard.append([InlineKeyboardButton("🔍 Вернуться к поиску", callback_data="back_to_search_mode")])
     keyboard.append([InlineKeyboardButton("❌ Выйти из поиска", callback_data="exit_search_mode")])
 
-    await query.edit_message_text(
-        message,
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+    await show_page(update, context, message, keyboard)
 
 
 async def back_to_search_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -383,7 +351,8 @@ async def back_to_search_mode(update: Update, context: ContextTypes.DEFAULT_TYPE
         "📌 Просто напишите в чат:\n"
         "• ID пользователя (например: 123)\n"
         "• Имя или фамилию (например: Иван)\n"
-        "• Часть имени\n\n"
+        "• Начало имени, телефона или username\n"
+        "• Telegram ID\n\n"
         "Или нажмите кнопку для просмотра полного списка:",
         reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton("📋 Показать полный список", callback_data="show_full_users_list_0")],
@@ -473,8 +442,7 @@ async def process_spent_amount(update: Update, context: ContextTypes.DEFAULT_TYP
 
         if action == 'add_bonus_percent':
             bonus_amount = int(spent_amount * 0.05)
-            db.update_user_balance(user_id, bonus_amount)
-            db.add_transaction(user_id, bonus_amount, 'earn', f'Начисление 5% от суммы {spent_amount} руб')
+            new_balance = db.credit_bonus(user_id, bonus_amount, f'Начисление 5% от суммы {spent_amount} руб')
 
             # Уведомляем пользователя о начислении
             try:
@@ -482,7 +450,7 @@ async def process_spent_amount(update: Update, context: ContextTypes.DEFAULT_TYP
                     user_data[1],
                     f"🎉 Вам начислены бонусные баллы!\n\n"
                     f"💰 Начислено: {bonus_amount} баллов (5% от {spent_amount} руб)\n"
-                    f"💳 Новый баланс: {user_data[5] + bonus_amount} баллов\n\n"
+                    f"💳 Новый баланс: {new_balance} баллов\n\n"
                     f"Мы будем рады если вы оставите свой отзыв:\n"
                     f"📍 [Оставить отзыв на Яндекс Картах](https://yandex.ru/maps/org/vovsetyazhkiye/57633254342)\n\n"
                     f"Спасибо за посещение нашего заведения! 🏪",
@@ -496,7 +464,7 @@ async def process_spent_amount(update: Update, context: ContextTypes.DEFAULT_TYP
             await message_manager.send_message(
                 update, context,
                 f"✅ Пользователю {user_data[2]} {user_data[3]} начислено {bonus_amount} бонусных баллов (5% от {spent_amount} руб).\n"
-                f"💰 Новый баланс: {user_data[5] + bonus_amount} баллов",
+                f"💰 Новый баланс: {new_balance} баллов",
                 reply_markup=get_admin_main_menu(),
                 is_temporary=False
             )
@@ -569,7 +537,9 @@ async def process_remove_bonus(update: Update, context: ContextTypes.DEFAULT_TYP
 
         user_data = db.get_user_by_id(user_id)
 
-        if amount > user_data[5]:
+        # Списание только если баллов хватает - проверка и списание одним запросом
+        new_balance = db.debit_bonus(user_id, amount, 'Списание администратором')
+        if new_balance is None:
             from message_manager import message_manager
             await message_manager.send_message(
                 update, context,
@@ -578,15 +548,12 @@ async def process_remove_bonus(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return AWAITING_BONUS_AMOUNT
 
-        db.update_user_balance(user_id, -amount)
-        db.add_transaction(user_id, -amount, 'spend', 'Списание администратором')
-
         # Уведомляем пользователя о списании
         try:
             await context.bot.send_message(
                 user_data[1],
                 f"📊 С вашего счета списано {amount} бонусных баллов.\n"
-                f"💰 Новый баланс: {user_data[5] - amount} баллов"
+                f"💰 Новый баланс: {new_balance} баллов"
             )
         except Exception as e:
             logger.error(f"Не удалось уведомить пользователя о списании: {e}")
@@ -596,7 +563,7 @@ async def process_remove_bonus(update: Update, context: ContextTypes.DEFAULT_TYP
         await message_manager.send_message(
             update, context,
             f"✅ У пользователя {user_data[2]} {user_data[3]} списано {amount} бонусных баллов.\n"
-            f"💰 Новый баланс: {user_data[5] - amount} баллов",
+            f"💰 Новый баланс: {new_balance} баллов",
             reply_markup=get_admin_main_menu(),
             is_temporary=False
         )
@@ -618,6 +585,8 @@ def get_user_search_handler():
     """Создать обработчик поиска пользователей"""
     from telegram.ext import ConversationHandler, MessageHandler, filters, CallbackQueryHandler
     return ConversationHandler(
+        name="user_search",
+        persistent=True,
         entry_points=[
             CallbackQueryHandler(start_user_search, pattern="^search_user$"),
         ],
@@ -5,8 +5,21 @@ import logging
 from telegram import Update  # ДОБАВИТЬ ЭТОТ ИМПОРТ
 from telegram.ext import ContextTypes
 from config import ADMIN_IDS
+from database import Database
 
 logger = logging.getLogger(__name__)
+db = Database()
+
+# Счетчики панели статистики и версия данных, по которой они посчитаны
+_dashboard_cache = {'version': None, 'stats': None}
+
+
+def get_dashboard_stats():
+    """Счетчики из кэша; пересчет - только если с прошлого раза менялись пользователи, брони или запросы"""
+    if _dashboard_cache['version'] != db.get_dashboard_version():
+        stats = db.get_dashboard_stats()
+        _dashboard_cache.update(version=stats['version'], stats=stats)
+    return _dashboard_cache['stats']
 
 
 def is_admin(user_id):
@@ -94,25 +107,15 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update.effective_user.id):
         return
 
-    from database import Database
     from message_manager import message_manager
     from keyboards.menus import get_admin_main_menu
 
-    db = Database()
-
     # Очищаем только временные сообщения при переходе между разделами
     await message_manager.cleanup_user_messages(context, update.effective_user.id)
 
-    users = db.get_all_users()
-    total_users = len(users)
-    total_bonuses = sum(user[5] for user in users)
-
-    # Получаем статистику бронирований
-    booking_stats = db.get_booking_stats()
-
-    # Получаем статистику запросов
-    requests = db.get_pending_requests()
-    pending_requests_count = len(requests)
+    stats = get_dashboard_stats()
+    total_users = stats['total_users']
+    total_bonuses = stats['total_bonuses']
 
     message = (
         f"📊 Статистика системы:\n\n"
@@ -120,10 +123,10 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"💰 Всего бонусных баллов: {total_bonuses}\n"
         f"🏆 Средний баланс: {total_bonuses // total_users if total_users > 0 else 0} баллов\n\n"
         f"📅 Бронирования:\n"
-        f"⏳ Ожидающие: {booking_stats.get('pending', 0)}\n"
-        f"✅ Подтвержденные: {booking_stats.get('confirmed', 0)}\n"
-        f"❌ Отмененные: {booking_stats.get('cancelled', 0)}\n\n"
-        f"📋 Запросы на списание: {pending_requests_count}"
+        f"⏳ Ожидающие: {stats['bookings_pending']}\n"
+        f"✅ Подтвержденные: {stats['bookings_confirmed']}\n"
+        f"❌ Отмененные: {stats['bookings_cancelled']}\n\n"
+        f"📋 Запросы на списание: {stats['pending_requests']}"
     )
 
     # Статистика - постоянное сообщение
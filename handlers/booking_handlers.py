@@ -285,6 +285,8 @@ async def cancel_booking_conversation(update: Update, context: ContextTypes.DEFA
 def get_booking_handler():
     """Создает обработчик бронирования с календарем и ручным вводом"""
     return ConversationHandler(
+        name="booking",
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex("^📅 Забронировать стол$"), start_booking)],
         states={
             BOOKING_DATE: [
@@ -535,6 +535,8 @@ def get_menu_management_handlers():
     """Возвращает все обработчики для управления меню"""
 
     add_item_handler = ConversationHandler(
+        name="menu_add_item",
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex("^➕ Добавить позицию$"), start_add_item)],
         states={
             AWAITING_ITEM_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_item_name)],
@@ -547,6 +549,8 @@ def get_menu_management_handlers():
     )
 
     edit_name_handler = ConversationHandler(
+        name="menu_edit_name",
+        persistent=True,
         entry_points=[CallbackQueryHandler(start_edit_name, pattern="^edit_name_")],
         states={
             AWAITING_EDIT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_edit_field)],
@@ -558,6 +562,8 @@ def get_menu_management_handlers():
     )
 
     edit_price_handler = ConversationHandler(
+        name="menu_edit_price",
+        persistent=True,
         entry_points=[CallbackQueryHandler(start_edit_price, pattern="^edit_price_")],
         states={
             AWAITING_EDIT_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_edit_field)],
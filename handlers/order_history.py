@@ -5,14 +5,52 @@
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+import os
+import tempfile
 from datetime import datetime, timedelta
 from keyboards.menus import PAYMENT_METHOD_NAMES
+from reporting import report_runner, write_orders_csv
+from utils.rate_limiter import api_rate_limiter
+from utils.report_pages import report_pages, render_pages, show_report, parse_report_page_callback
 from handlers.order_utils import (
     is_admin, message_manager, menu_manager, db, logger, format_datetime,
-    group_items_by_category, back_to_admin_main
+    group_items_by_category, build_shift_summary, back_to_admin_main
 )
 
 
+def _payment_lines(payment_stats):
+    """Секция отчета со статистикой по способам оплаты"""
+    if not payment_stats:
+        return ["💳 Статистика по оплате: нет данных"]
+
+    lines = ["💳 Статистика по оплате:"]
+    total_payment_count = 0
+    total_payment_amount = 0
+    for method, data in payment_stats.items():
+        name = PAYMENT_METHOD_NAMES.get(method, method)
+        lines.append(f"  {name}: {data['count']} зак. - {data['total_amount']}₽")
+        total_payment_count += data['count']
+        total_payment_amount += data['total_amount']
+    lines.append(f"  Всего: {total_payment_count} зак. - {total_payment_amount}₽")
+    return lines
+
+
+def _category_sections(categories):
+    """По секции на каждую категорию с продажами: итог и детали по позициям"""
+    sections = []
+    for category_key in ['Кальяны', 'Чай', 'Коктейли', 'Напитки', 'Другое']:
+        category_data = categories[category_key]
+        if category_data['total_quantity'] > 0:
+            lines = [
+                f"{category_data['name']}:",
+                f"  Всего: {category_data['total_quantity']} шт. - {category_data['total_amount']}₽"
+            ]
+            lines.extend(f"  • {item_name}: {item_data['quantity']} шт. - {item_data['total_amount']}₽"
+                         for item_name, item_data in category_data['items'].items())
+            sections.append(lines)
+    return sections
+
+
 # ИСТОРИЯ ЗАКАЗОВ - ОБНОВЛЕННАЯ ВЕРСИЯ
 async def show_order_history_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать меню истории заказов - ОБНОВЛЕННАЯ ВЕРСИЯ БЕЗ КНОПКИ 'ЗА МЕСЯЦ'"""
@@ -143,8 +181,8 @@ async def show_shift_history(update: Update, context: ContextTypes.DEFAULT_TYPE)
         created_at = format_datetime(order[4])
         closed_at = format_datetime(order[5]) if order[5] else "Еще не закрыт"
 
-        items = menu_manager.get_order_items(order_id)
-        total = menu_manager.calculate_order_total(order_id)
+        items = menu_manager.get_order_items(order_id, include_archive=True)
+        total = menu_manager.calculate_order_total(order_id, include_archive=True)
         total_revenue += total
 
         # Считаем статистику по статусам
@@ -472,8 +510,22 @@ async def show_full_year_history(update: Update, context: ContextTypes.DEFAULT_T
     year = query.data.replace("history_full_year_", "")
     context.user_data['selected_year'] = year
 
-    # Получаем статистику за весь год
-    sales_stats = db.get_sales_statistics_by_year(year)
+    # Данные не менялись с прошлой отрисовки - показываем готовые страницы
+    report_key = f"year_{year}"
+    if report_pages.get(report_key, db.get_report_version()):
+        await show_report(update, context, report_key)
+        return
+
+    # Получаем статистику за весь год (одним снимком на подключении для отчетов)
+    sales_stats, total_revenue, spent_bonuses, payment_stats, version = await report_runner.run(
+        lambda report_db: (
+            report_db.get_sales_statistics_by_year(year),
+            report_db.get_total_revenue_by_year(year),
+            report_db.get_spent_bonuses_by_year(year),
+            report_db.get_payment_statistics_by_year(year),
+            report_db.get_report_version(),
+        )
+    )
 
     if not sales_stats:
         try:
@@ -490,87 +542,34 @@ async def show_full_year_history(update: Update, context: ContextTypes.DEFAULT_T
                 logger.error(f"Ошибка при показе статистики года: {e}")
         return
 
-    total_revenue = db.get_total_revenue_by_year(year)
-
-    # Получаем сумму списанных бонусов за год
-    spent_bonuses = db.get_spent_bonuses_by_year(year)
-
-    # Получаем статистику по оплате за год
-    payment_stats = db.get_payment_statistics_by_year(year)
-
     # Считаем общую сумму всех продаж
     total_sales_amount = sum(total_amount for _, _, total_amount in sales_stats)
 
     # Группируем позиции по категориям
     categories = group_items_by_category(sales_stats)
 
-    message = f"📊 Статистика за {year} год\n\n"
-    message += f"💰 Общая сумма продаж: {total_sales_amount}₽\n"
-    message += f"🎫 Сумма списанных бонусов: {spent_bonuses}₽\n\n"
-
-    # Добавляем статистику по оплате
-    if payment_stats:
-        message += "💳 Статистика по оплате:\n"
-        total_payment_count = 0
-        total_payment_amount = 0
-
-        for method, data in payment_stats.items():
-            name = PAYMENT_METHOD_NAMES.get(method, method)
-            message += f"  {name}: {data['count']} зак. - {data['total_amount']}₽\n"
-            total_payment_count += data['count']
-            total_payment_amount += data['total_amount']
-
-        message += f"  Всего: {total_payment_count} зак. - {total_payment_amount}₽\n\n"
-    else:
-        message += "💳 Статистика по оплате: нет данных\n\n"
-
-    # Проверяем, есть ли данные для отображения
-    has_data = False
-    for category_key in ['Кальяны', 'Чай', 'Коктейли', 'Напитки', 'Другое']:
-        category_data = categories[category_key]
-        if category_data['total_quantity'] > 0:
-            has_data = True
-            break
+    sections = [
+        [f"📊 Статистика за {year} год"],
+        [f"💰 Общая сумма продаж: {total_sales_amount}₽", f"🎫 Сумма списанных бонусов: {spent_bonuses}₽"],
+        _payment_lines(payment_stats),
+    ]
 
-    if not has_data:
-        message += "📭 Нет данных о продажах за этот период."
+    category_sections = _category_sections(categories)
+    if not category_sections:
+        sections.append(["📭 Нет данных о продажах за этот период."])
     else:
-        message += "📈 Продажи по категориям:\n\n"
-
-        # Выводим категории с группировкой
-        for category_key in ['Кальяны', 'Чай', 'Коктейли', 'Напитки', 'Другое']:
-            category_data = categories[category_key]
-            if category_data['total_quantity'] > 0:
-                message += f"{category_data['name']}:\n"
-                message += f"  Всего: {category_data['total_quantity']} шт. - {category_data['total_amount']}₽\n"
-
-                # Выводим детали по позиции внутри категории
-                for item_name, item_data in category_data['items'].items():
-                    message += f"  • {item_name}: {item_data['quantity']} шт. - {item_data['total_amount']}₽\n"
-                message += "\n"
+        sections.append(["📈 Продажи по категориям:"])
+        sections.extend(category_sections)
 
     keyboard = [
+        [InlineKeyboardButton("📥 Выгрузить CSV", callback_data=f"history_export_year_{year}")],
         [InlineKeyboardButton("📅 Выбрать месяц", callback_data=f"history_year_{year}")],
         [InlineKeyboardButton("📊 Другая статистика", callback_data="order_history")],
         [InlineKeyboardButton("⬅️ Назад в управление", callback_data="back_to_order_management")]
     ]
 
-    try:
-        await query.edit_message_text(
-            message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-    except Exception as e:
-        if "Message is not modified" in str(e):
-            logger.debug("Сообщение статистики года не требует изменений")
-        else:
-            logger.error(f"Ошибка при показе статистики года: {e}")
-            await message_manager.send_message(
-                update, context,
-                message,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                is_temporary=False
-            )
+    report_pages.put(report_key, version, render_pages(sections), keyboard)
+    await show_report(update, context, report_key)
 
 
 # НОВАЯ ФУНКЦИЯ: Показ всех смен в месяце с пагинацией
@@ -792,9 +791,21 @@ async def show_full_month_history(update: Update, context: ContextTypes.DEFAULT_
                 logger.error(f"Ошибка при показе статистики месяца: {e}")
         return
 
-    # Получаем статистику за весь месяц
-    sales_stats = db.get_sales_statistics_by_year_month(year, month)
-    total_revenue = db.get_total_revenue_by_year_month(year, month)
+    report_key = f"month_{year}_{month}"
+    if report_pages.get(report_key, db.get_report_version()):
+        await show_report(update, context, report_key)
+        return
+
+    # Получаем статистику за весь месяц (одним снимком на подключении для отчетов)
+    sales_stats, total_revenue, spent_bonuses, payment_stats, version = await report_runner.run(
+        lambda report_db: (
+            report_db.get_sales_statistics_by_year_month(year, month),
+            report_db.get_total_revenue_by_year_month(year, month),
+            report_db.get_spent_bonuses_by_month(year, month),
+            report_db.get_payment_statistics_by_month(year, month),
+            report_db.get_report_version(),
+        )
+    )
 
     if not sales_stats:
         try:
@@ -817,74 +828,29 @@ async def show_full_month_history(update: Update, context: ContextTypes.DEFAULT_
     }
     month_name = month_names.get(month, month)
 
-    # Получаем сумму списанных бонусов за месяц
-    spent_bonuses = db.get_spent_bonuses_by_month(year, month)
-
-    # Получаем статистику по оплате за месяц
-    payment_stats = db.get_payment_statistics_by_month(year, month)
-
     # Считаем общую сумму всех продаж
     total_sales_amount = sum(total_amount for _, _, total_amount in sales_stats)
 
     # Группируем позиции по категориям
     categories = group_items_by_category(sales_stats)
 
-    message = f"📊 Статистика за {month_name} {year} года\n\n"
-    message += f"💰 Общая сумма продаж: {total_sales_amount}₽\n"
-    message += f"🎫 Сумма списанных бонусов: {spent_bonuses}₽\n\n"
-
-    # Добавляем статистику по оплате
-    if payment_stats:
-        message += "💳 Статистика по оплате:\n"
-        total_payment_count = 0
-        total_payment_amount = 0
-
-        for method, data in payment_stats.items():
-            name = PAYMENT_METHOD_NAMES.get(method, method)
-            message += f"  {name}: {data['count']} зак. - {data['total_amount']}₽\n"
-            total_payment_count += data['count']
-            total_payment_amount += data['total_amount']
-
-        message += f"  Всего: {total_payment_count} зак. - {total_payment_amount}₽\n\n"
-    else:
-        message += "💳 Статистика по оплате: нет данных\n\n"
-
-    message += "📈 Продажи по категориям:\n\n"
-
-    # Выводим категории с группировкой
-    for category_key in ['Кальяны', 'Чай', 'Коктейли', 'Напитки', 'Другое']:
-        category_data = categories[category_key]
-        if category_data['total_quantity'] > 0:
-            message += f"{category_data['name']}:\n"
-            message += f"  Всего: {category_data['total_quantity']} шт. - {category_data['total_amount']}₽\n"
-
-            # Выводим детали по позициям внутри категории
-            for item_name, item_data in category_data['items'].items():
-                message += f"  • {item_name}: {item_data['quantity']} шт. - {item_data['total_amount']}₽\n"
-            message += "\n"
+    sections = [
+        [f"📊 Статистика за {month_name} {year} года"],
+        [f"💰 Общая сумма продаж: {total_sales_amount}₽", f"🎫 Сумма списанных бонусов: {spent_bonuses}₽"],
+        _payment_lines(payment_stats),
+        ["📈 Продажи по категориям:"],
+    ]
+    sections.extend(_category_sections(categories))
 
     keyboard = [
+        [InlineKeyboardButton("📥 Выгрузить CSV", callback_data=f"history_export_month_{year}-{month}")],
         [InlineKeyboardButton("📅 Выбрать смену", callback_data=f"history_year_{year}")],
         [InlineKeyboardButton("📊 Другая статистика", callback_data="order_history")],
         [InlineKeyboardButton("⬅️ Назад в управление", callback_data="back_to_order_management")]
     ]
 
-    try:
-        await query.edit_message_text(
-            message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-    except Exception as e:
-        if "Message is not modified" in str(e):
-            logger.debug("Сообщение статистики месяца не требует изменений")
-        else:
-            logger.error(f"Ошибка при показе статистики месяца: {e}")
-            await message_manager.send_message(
-                update, context,
-                message,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                is_temporary=False
-            )
+    report_pages.put(report_key, version, render_pages(sections), keyboard)
+    await show_report(update, context, report_key)
 
 
 async def show_selected_shift_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -910,11 +876,35 @@ async def show_selected_shift_history(update: Update, context: ContextTypes.DEFA
         await query.edit_message_text("❌ Неверный формат данных.")
         return
 
-    # Получаем статистику по выбранной смене
-    shift_sales = db.get_shift_sales(shift_number, month_year)
-    shift_info = db.get_shift_by_number_and_month(shift_number, month_year)
+    report_key = f"shift_{month_year}_{shift_number}"
+    version = db.get_report_version()
+    if report_pages.get(report_key, version):
+        await show_report(update, context, report_key)
+        return
+
+    # Итоги, зафиксированные при закрытии смены, - одна строка
+    summary = db.get_shift_summary(shift_number, month_year)
+
+    if summary is None:
+        # Смена закрыта до появления итогов - считаем по БД (одним снимком на подключении для отчетов)
+        shift_sales, shift_info, spent_bonuses, payment_stats, version = await report_runner.run(
+            lambda report_db: (
+                report_db.get_shift_sales(shift_number, month_year),
+                report_db.get_shift_by_number_and_month(shift_number, month_year),
+                report_db.get_spent_bonuses_by_shift(shift_number, month_year),
+                report_db.get_payment_statistics_by_shift(shift_number, month_year),
+                report_db.get_report_version(),
+            )
+        )
+
+        if shift_info:
+            # Получаем информацию об администраторе
+            admin_id = shift_info[3]
+            admin_data = db.get_user_by_id(admin_id)
+            admin_name = f"{admin_data[2]} {admin_data[3]}" if admin_data else f"ID: {admin_id}"
+            summary = build_shift_summary(shift_info, admin_name, shift_sales, spent_bonuses, payment_stats)
 
-    if not shift_sales or not shift_info:
+    if not summary or not summary['items']:
         try:
             await query.edit_message_text(
                 f"📭 Нет данных по смене #{shift_number} ({month_year}).",
@@ -935,87 +925,102 @@ async def show_selected_shift_history(update: Update, context: ContextTypes.DEFA
                 )
         return
 
-    # Получаем информацию об администраторе
-    admin_id = shift_info[3]
-    admin_data = db.get_user_by_id(admin_id)
-    admin_name = f"{admin_data[2]} {admin_data[3]}" if admin_data else f"ID: {admin_id}"
-
-    total_revenue = shift_info[6] or 0
-    total_orders = shift_info[7] or 0
-
-    # Получаем сумму списанных бонусов за смену
-    spent_bonuses = db.get_spent_bonuses_by_shift(shift_number, month_year)
-
-    # Получаем статистику по оплате за смену
-    payment_stats = db.get_payment_statistics_by_shift(shift_number, month_year)
-
-    # Считаем общую сумму всех проданных позиций за смену
-    total_sales_amount = sum(total_amount for _, _, total_amount in shift_sales)
-
-    # Группируем позиции по категориям
-    categories = group_items_by_category(shift_sales)
-
-    message = f"📊 Статистика за смену #{shift_number} ({month_year})\n\n"
-    message += f"👨‍💼 Администратор: {admin_name}\n"
-    message += f"📅 Открыта: {format_datetime(shift_info[4])}\n"
-    if shift_info[5]:
-        message += f"📅 Закрыта: {format_datetime(shift_info[5])}\n"
-    message += f"📋 Заказов: {total_orders}\n"
-    message += f"💰 Сумма всех продаж: {total_sales_amount}₽\n"
-    message += f"🎫 Сумма списанных бонусов: {spent_bonuses}₽\n\n"
-
-    # Добавляем статистику по оплате
-    if payment_stats:
-        message += "💳 Статистика по оплате:\n"
-        total_payment_count = 0
-        total_payment_amount = 0
-
-        for method, data in payment_stats.items():
-            name = PAYMENT_METHOD_NAMES.get(method, method)
-            message += f"  {name}: {data['count']} зак. - {data['total_amount']}₽\n"
-            total_payment_count += data['count']
-            total_payment_amount += data['total_amount']
-
-        message += f"  Всего: {total_payment_count} зак. - {total_payment_amount}₽\n\n"
-    else:
-        message += "💳 Статистика по оплате: нет данных\n\n"
-
-    message += "📈 Продажи по категориям:\n\n"
-
-    # Выводим категории с группировкой
-    for category_key in ['Кальяны', 'Чай', 'Коктейли', 'Напитки', 'Другое']:
-        category_data = categories[category_key]
-        if category_data['total_quantity'] > 0:
-            message += f"{category_data['name']}:\n"
-            message += f"  Всего: {category_data['total_quantity']} шт. - {category_data['total_amount']}₽\n"
+    shift_lines = [f"👨‍💼 Администратор: {summary['admin_name']}", f"📅 Открыта: {format_datetime(summary['opened_at'])}"]
+    if summary['closed_at']:
+        shift_lines.append(f"📅 Закрыта: {format_datetime(summary['closed_at'])}")
+    shift_lines += [
+        f"📋 Заказов: {summary['total_orders']}",
+        f"💰 Сумма всех продаж: {summary['total_sales_amount']}₽",
+        f"🎫 Сумма списанных бонусов: {summary['spent_bonuses']}₽"
+    ]
 
-            # Выводим детали по позициям внутри категории
-            for item_name, item_data in category_data['items'].items():
-                message += f"  • {item_name}: {item_data['quantity']} шт. - {item_data['total_amount']}₽\n"
-            message += "\n"
+    sections = [
+        [f"📊 Статистика за смену #{shift_number} ({month_year})"],
+        shift_lines,
+        _payment_lines(summary['payments']),
+        ["📈 Продажи по категориям:"],
+    ]
+    sections.extend(_category_sections(summary['categories']))
 
     keyboard = [
+        [InlineKeyboardButton("📥 Выгрузить CSV", callback_data=f"history_export_shift_{month_year}_{shift_number}")],
         [InlineKeyboardButton("📅 Выбрать другую смену", callback_data="history_select_shift")],
         [InlineKeyboardButton("⬅️ Назад в историю", callback_data="order_history")]
     ]
 
+    report_pages.put(report_key, version, render_pages(sections), keyboard)
+    await show_report(update, context, report_key)
+
+
+async def handle_report_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Переход по страницам длинного отчета - из кэша, без повторного расчета"""
+    query = update.callback_query
+    await query.answer()
+
+    report_key, page = parse_report_page_callback(query.data)
+    if await show_report(update, context, report_key, page):
+        return
+
     try:
         await query.edit_message_text(
-            message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            "⌛ Отчет устарел, откройте его заново.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад в историю", callback_data="order_history")]])
         )
     except Exception as e:
         if "Message is not modified" in str(e):
-            logger.debug("Сообщение выбранной смены не требует изменений")
+            logger.debug("Сообщение устаревшего отчета не требует изменений")
         else:
-            logger.error(f"Ошибка при показе выбранной смены: {e}")
-            await message_manager.send_message(
-                update, context,
-                message,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                is_temporary=False
+            logger.error(f"Ошибка при показе страницы отчета: {e}")
+
+
+async def handle_report_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгрузка позиций заказов за год, месяц или смену CSV-файлом"""
+    query = update.callback_query
+    await query.answer("⏳ Готовлю файл...")
+
+    # Формат: history_export_year_2024, history_export_month_2024-01, history_export_shift_2024-11_30
+    kind, _, period = query.data.replace("history_export_", "", 1).partition("_")
+    if kind == 'year':
+        filters, title = {'year': period}, f"{period} год"
+    elif kind == 'month':
+        filters, title = {'month_year': period}, period
+    elif kind == 'shift':
+        month_year, _, shift_number = period.rpartition("_")
+        filters, title = {'month_year': month_year, 'shift_number': int(shift_number)}, f"смену #{shift_number} ({month_year})"
+    else:
+        return
+
+    filename = f"sales_{kind}_{period}.csv"
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, filename)
+            # Файл пишется в отдельном потоке строка за строкой прямо из курсора
+            row_count = await report_runner.run(
+                lambda report_db: write_orders_csv(
+                    report_db.iter_shift_order_lines(**filters), path, PAYMENT_METHOD_NAMES
+                )
             )
 
+            if not row_count:
+                await message_manager.send_message(
+                    update, context, "📭 Нет данных для выгрузки за выбранный период.", is_temporary=True
+                )
+                return
+
+            with open(path, 'rb') as document:
+                async with api_rate_limiter:
+                    await context.bot.send_document(
+                        chat_id=query.message.chat_id,
+                        document=document,
+                        filename=filename,
+                        caption=f"📥 Продажи за {title}: {row_count} строк"
+                    )
+    except Exception as e:
+        logger.error(f"Ошибка при выгрузке отчета {query.data}: {e}")
+        await message_manager.send_message(
+            update, context, "❌ Не удалось подготовить файл выгрузки.", is_temporary=True
+        )
+
 
 async def show_select_shift_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать меню выбора смены - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
@@ -1214,8 +1219,8 @@ async def show_orders_history(update: Update, context: ContextTypes.DEFAULT_TYPE
     message += f"📋 Всего заказов: {total_orders}\n"
 
     for order in orders:
-        items = menu_manager.get_order_items(order[0])
-        total = menu_manager.calculate_order_total(order[0])
+        items = menu_manager.get_order_items(order[0], include_archive=True)
+        total = menu_manager.calculate_order_total(order[0], include_archive=True)
         total_revenue += total
 
         # Получаем информацию об администраторе
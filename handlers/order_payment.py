@@ -77,7 +77,7 @@ async def show_payment_selection(update: Update, context: ContextTypes.DEFAULT_T
     from keyboards.menus import get_payment_method_keyboard
     await query.edit_message_text(
         message,
-        reply_markup=get_payment_method_keyboard(order_id)
+        reply_markup=get_payment_method_keyboard(order_id, order[7])
     )
 
 
@@ -86,7 +86,7 @@ async def handle_payment_selection(update: Update, context: ContextTypes.DEFAULT
     query = update.callback_query
     await query.answer()
 
-    # Формат: payment_method_orderid
+    # Формат: payment_method_orderid_version (в старых кнопках версии нет)
     parts = query.data.split("_")
     if len(parts) < 3:
         await query.edit_message_text("❌ Ошибка в данных запроса.")
@@ -94,12 +94,20 @@ async def handle_payment_selection(update: Update, context: ContextTypes.DEFAULT
 
     payment_method = parts[1]  # qr, card, cash, transfer
     order_id = int(parts[2])
-
-    # Обновляем метод оплаты в базе данных
-    db.update_order_payment_method(order_id, payment_method)
-
-    # Закрываем заказ
-    menu_manager.close_order(order_id)
+    expected_version = int(parts[3]) if len(parts) > 3 else None
+
+    # Закрываем заказ, только если он не менялся после показа чека
+    success, result_message = menu_manager.close_order(order_id, payment_method, expected_version)
+    if not success:
+        await query.edit_message_text(
+            f"⚠️ {result_message}.\n"
+            f"Проверьте чек еще раз перед оплатой.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🧾 Обновить чек", callback_data=f"calculate_{order_id}")],
+                [InlineKeyboardButton("📋 Активные заказы", callback_data="active_orders")]
+            ])
+        )
+        return
 
     # Показываем финальное сообщение
     order = db.get_order_by_id(order_id)
@@ -11,7 +11,9 @@ from menu_manager import menu_manager
 from database import Database
 import logging
 from datetime import datetime
-from handlers.order_utils import is_admin, format_datetime, db, logger
+from keyboards.menus import PAYMENT_METHOD_NAMES
+from shift_stats import shift_tracker
+from handlers.order_utils import is_admin, format_datetime, build_shift_summary, db, logger
 
 # СИСТЕМА УПРАВЛЕНИЯ СМЕНОЙ
 async def open_shift(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -59,6 +61,7 @@ async def open_shift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Создаем новую смену в базе данных с текущим месяцем
     current_month = datetime.now().strftime('%Y-%m')
     shift_number = db.create_shift(user_id, current_month)  # Используем user_id, а не telegram_id
+    shift_tracker.rebuild(db)
 
     # Сохраняем в context для текущей сессии
     context.bot_data['shift_open'] = True
@@ -202,9 +205,22 @@ async def close_shift(update: Update, context: ContextTypes.DEFAULT_TYPE):
             sales_data[item_name]['quantity'] += quantity
             sales_data[item_name]['total_amount'] += item_total_amount
 
+    # Сверяем с живой статистикой смены (расхождение пишется в лог)
+    shift_tracker.verify(total_sales_amount, len(shift_orders), sales_data)
+
     # Сохраняем статистику в базу
     db.close_shift(shift_number, month_year, total_sales_amount, len(shift_orders))
     db.save_shift_sales(shift_number, month_year, sales_data)
+    shift_tracker.stop()
+
+    # Фиксируем итоги смены одной записью - история смены дальше читается из нее
+    closed_shift = db.get_shift_by_number_and_month(shift_number, month_year)
+    db.save_shift_summary(shift_id, build_shift_summary(
+        closed_shift, admin_name,
+        db.get_shift_sales(shift_number, month_year),
+        db.get_spent_bonuses_by_shift(shift_number, month_year),
+        db.get_payment_statistics_by_shift(shift_number, month_year)
+    ))
 
     # Закрываем смену в context
     context.bot_data['shift_open'] = False
@@ -281,16 +297,17 @@ async def calculate_all_orders(update: Update, context: ContextTypes.DEFAULT_TYP
 
         if items and len(items) > 0:  # Проверяем что есть позиции
             try:
+                # Сумма и закрытие - по одной и той же версии заказа
+                current = db.get_order_version(order_id)
                 total = menu_manager.calculate_order_total(order_id)
-                total_revenue += total
-
-                # Закрываем заказ напрямую через базу
-                cursor = db.conn.cursor()
-                cursor.execute('''
-                    UPDATE orders SET status = 'closed', closed_at = ? WHERE id = ?
-                ''', (db.get_moscow_time(), order_id))
-                db.conn.commit()
+                success, result_message = menu_manager.close_order(
+                    order_id, expected_version=current[1] if current else None
+                )
+                if not success:
+                    logger.warning(f"Заказ {order_id} не закрыт: {result_message}")
+                    continue
 
+                total_revenue += total
                 calculated_count += 1
 
                 # Показываем прогресс
@@ -344,18 +361,38 @@ async def show_shift_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     shift_open = context.bot_data.get('shift_open', False)
-    active_orders = db.get_active_orders()
+    # Показатели смены - из живой статистики, без пересчета по БД
+    stats = shift_tracker.current
 
     if shift_open:
         shift_number = context.bot_data.get('shift_number', 'Неизвестно')
         month_year = context.bot_data.get('shift_month_year', 'Неизвестно')
         shift_opened_at = context.bot_data.get('shift_opened_at', 'Неизвестно')
+        active_count = stats.active_orders if stats else len(db.get_active_orders())
         message = (
             f"🟢 Смена #{shift_number} ({month_year}) открыта\n\n"
             f"📅 Время открытия: {shift_opened_at}\n"
-            f"📋 Активных заказов: {len(active_orders)}\n"
+            f"📋 Активных заказов: {active_count}\n"
             f"👨‍💼 Администратор: ID {context.bot_data.get('shift_admin', 'Неизвестно')}"
         )
+
+        if stats:
+            message += (
+                f"\n\n💰 Выручка: {stats.revenue}₽\n"
+                f"✅ Закрыто заказов: {stats.closed_orders}\n"
+                f"🧾 Средний чек: {stats.average_check}₽\n"
+                f"⏳ В открытых заказах: {stats.open_amount}₽"
+            )
+            categories = stats.categories()
+            if categories:
+                message += "\n\n📈 Продажи по категориям:\n"
+                for category, data in categories.items():
+                    message += f"• {category}: {data['quantity']} шт. - {data['total_amount']}₽\n"
+            if stats.payments:
+                message += "\n💳 Способы оплаты:\n"
+                for method, data in stats.payments.items():
+                    method_name = PAYMENT_METHOD_NAMES.get(method, method or 'Не указан')
+                    message += f"• {method_name}: {data['count']} - {data['total_amount']}₽\n"
     else:
         message = "🔴 Смена закрыта\n\nДля начала работы откройте смену."
 
@@ -10,6 +10,7 @@ from message_manager import message_manager
 from menu_manager import menu_manager
 from database import Database
 import logging
+import re
 from datetime import datetime, timedelta
 from keyboards.menus import PAYMENT_METHOD_NAMES
 
@@ -42,6 +43,62 @@ def format_datetime(datetime_str):
         return str(datetime_str)
 
 
+# Категории для позиций, которых нет в меню: по ключевым словам в названии, в порядке приоритета
+CATEGORY_KEYWORDS = {
+    'Кальяны': ['кальян', 'hookah', 'calyan', 'пенсионный', 'стандарт', 'премиум', 'фруктовая', 'сигарный',
+                'парфюм'],
+    'Чай': ['чай', 'tea', 'chai', 'пуэр', 'габа', 'гречишный', 'медовая', 'малина', 'мята', 'наглый', 'фрукт',
+            'вишневый', 'марроканский', 'голубика', 'смородиновый', 'клубничный', 'облепиховый'],
+    'Коктейли': ['коктейль', 'cocktail', 'кокт', 'пробирки', 'в/кола', 'санрайз', 'лагуна', 'фиеро'],
+    'Напитки': ['напиток', 'drink', 'сок', 'вода', 'газировка', 'кола', 'пиво', 'энергетик', 'фанта', 'спрайт'],
+}
+
+
+class ItemCategoryClassifier:
+    """
+    Категория позиции по названию: точное совпадение с меню, иначе ключевые слова.
+    Собирается один раз на версию меню, результат для каждого названия запоминается
+    """
+
+    def __init__(self, menu_version, item_category_map):
+        self.menu_version = menu_version
+        self._exact = item_category_map
+        self._categories = list(CATEGORY_KEYWORDS)
+        # Одна регулярка: ветки-lookahead по категориям в порядке приоритета,
+        # срабатывает первая категория, любое слово которой встречается в названии
+        self._pattern = re.compile('|'.join(
+            f"(?=.*(?:{'|'.join(map(re.escape, keywords))}))(?P<c{index}>)"
+            for index, keywords in enumerate(CATEGORY_KEYWORDS.values())
+        ), re.DOTALL)
+        self._memo = {}
+
+    def classify(self, item_name):
+        category = self._memo.get(item_name)
+        if category is None:
+            category = self._exact.get(item_name, 'Другое')
+            if category == 'Другое':
+                match = self._pattern.match(item_name.lower())
+                if match:
+                    category = self._categories[int(match.lastgroup[1:])]
+            self._memo[item_name] = category
+        return category
+
+
+_item_classifier = None
+
+
+def get_item_classifier():
+    """Классификатор для текущей версии меню (пересобирается только после изменения menu_items)"""
+    global _item_classifier
+    menu_version = db.get_menu_version()
+    if _item_classifier is None or _item_classifier.menu_version != menu_version:
+        menu_items = menu_manager.get_all_items_with_categories()
+        _item_classifier = ItemCategoryClassifier(
+            menu_version, {name: category for name, price, category in menu_items}
+        )
+    return _item_classifier
+
+
 def group_items_by_category(items_data):
     """Группирует позиции по категориям из базы данных и подсчитывает общие суммы - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     categories = {
@@ -52,35 +109,11 @@ def group_items_by_category(items_data):
         'Другое': {'name': '📦 Другое', 'items': {}, 'total_quantity': 0, 'total_amount': 0}
     }
 
-    # Получаем все позиции меню с их категориями из базы данных
-    menu_items = menu_manager.get_all_items_with_categories()
-
-    # Создаем словарь для быстрого поиска категории по названию позиции
-    item_category_map = {}
-    for name, price, category in menu_items:
-        item_category_map[name] = category
+    # Категория из меню в БД, для остальных позиций - по ключевым словам
+    classifier = get_item_classifier()
 
     for item_name, quantity, total_amount in items_data:
-        # Определяем категорию позиции из базы данных - ПЕРВООЧЕРЕДНО ИСПОЛЬЗУЕМ ДАННЫЕ ИЗ БАЗЫ
-        category = item_category_map.get(item_name, 'Другое')
-
-        # Если категория не найдена в базе, используем эвристику для определения
-        if category == 'Другое':
-            item_lower = item_name.lower()
-            if any(keyword in item_lower for keyword in
-                   ['кальян', 'hookah', 'calyan', 'пенсионный', 'стандарт', 'премиум', 'фруктовая', 'сигарный',
-                    'парфюм']):
-                category = 'Кальяны'
-            elif any(keyword in item_lower for keyword in
-                     ['чай', 'tea', 'chai', 'пуэр', 'габа', 'гречишный', 'медовая', 'малина', 'мята', 'наглый', 'фрукт',
-                      'вишневый', 'марроканский', 'голубика', 'смородиновый', 'клубничный', 'облепиховый']):
-                category = 'Чай'
-            elif any(keyword in item_lower for keyword in
-                     ['коктейль', 'cocktail', 'кокт', 'пробирки', 'в/кола', 'санрайз', 'лагуна', 'фиеро']):
-                category = 'Коктейли'
-            elif any(keyword in item_lower for keyword in
-                     ['напиток', 'drink', 'сок', 'вода', 'газировка', 'кола', 'пиво', 'энергетик', 'фанта', 'спрайт']):
-                category = 'Напитки'
+        category = classifier.classify(item_name)
 
         # Добавляем позицию в категорию
         if item_name not in categories[category]['items']:
@@ -97,6 +130,24 @@ def group_items_by_category(items_data):
     return categories
 
 
+def build_shift_summary(shift_info, admin_name, shift_sales, spent_bonuses, payment_stats):
+    """Итоги смены одним словарем: при закрытии смены сохраняются в shifts.summary"""
+    return {
+        'shift_number': shift_info[1],
+        'month_year': shift_info[2],
+        'admin_name': admin_name,
+        'opened_at': shift_info[4],
+        'closed_at': shift_info[5],
+        'total_revenue': shift_info[6] or 0,
+        'total_orders': shift_info[7] or 0,
+        'total_sales_amount': sum(total_amount for _, _, total_amount in shift_sales),
+        'spent_bonuses': spent_bonuses,
+        'items': [list(row) for row in shift_sales],
+        'categories': group_items_by_category(shift_sales),
+        'payments': payment_stats,
+    }
+
+
 async def back_to_admin_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Возврат в главное меню администратора"""
     from handlers.admin_handlers import back_to_main_menu
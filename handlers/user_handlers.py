@@ -21,6 +21,9 @@ SPEND_BONUS = 10
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Пользователь снова пишет боту - значит, он его разблокировал
+    message_manager.remove_inactive_user(update.effective_user.id)
+
     # Очищаем только временные сообщения при старте
     await message_manager.cleanup_user_messages(context, update.effective_user.id)
 
@@ -28,6 +31,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_data = db.get_user(user.id)
 
     if user_data:
+        # username в Telegram можно сменить - держим актуальным для поиска
+        if user_data[11] != user.username:
+            db.update_username(user.id, user.username)
+
         # Показываем разное меню для админов и обычных пользователей
         if user.id in ADMIN_IDS:
             from keyboards.menus import get_admin_main_menu
@@ -150,7 +157,8 @@ async def confirm_registration(update: Update, context: ContextTypes.DEFAULT_TYP
         user_data['first_name'],
         user_data['last_name'],
         user_data['phone'],
-        user_data.get('referred_by')
+        user_data.get('referred_by'),
+        user.username
     )
 
     if user_id:
@@ -717,7 +725,9 @@ async def process_spend_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
             return SPEND_BONUS
 
-        if amount > user_data[5]:
+        # Создаем запрос на списание (только если баллов хватает - проверка в том же запросе)
+        request_id = db.create_bonus_request_if_covered(user_data[0], amount)
+        if request_id is None:
             await message_manager.send_message(
                 update, context,
                 "❌ Недостаточно баллов для списания.",
@@ -725,9 +735,6 @@ async def process_spend_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
             return SPEND_BONUS
 
-        # Создаем запрос на списание
-        request_id = db.create_bonus_request(user_data[0], amount)
-
         # Уведомляем администратора
         from config import ADMIN_IDS
         for admin_id in ADMIN_IDS:
@@ -982,6 +989,8 @@ async def handle_back_to_contacts_callback(update: Update, context: ContextTypes
 # Создаем обработчик регистрации
 def get_registration_handler():
     return ConversationHandler(
+        name="registration",
+        persistent=True,
         entry_points=[CommandHandler('start', start)],
         states={
             FIRST_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_first_name)],
@@ -1000,6 +1009,8 @@ def get_registration_handler():
 # Создаем обработчик списания баллов
 def get_spend_bonus_handler():
     return ConversationHandler(
+        name="spend_bonus",
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex("^🎁 Списать баллы$"), start_spend_bonus)],
         states={
             SPEND_BONUS: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_spend_bonus)]
@@ -109,11 +109,12 @@ def get_dates_keyboard(dates):
 
 # Клавиатура для выбора пользователя
 def get_users_keyboard(users):
+    """users - строки (id, first_name, last_name)"""
     keyboard = []
-    for user in users:
+    for user_id, first_name, last_name in users:
         keyboard.append([InlineKeyboardButton(
-            f"{user[2]} {user[3]} (ID: {user[0]})",
-            callback_data=f"select_user_{user[0]}"
+            f"{first_name} {last_name} (ID: {user_id})",
+            callback_data=f"select_user_{user_id}"
         )])
     return InlineKeyboardMarkup(keyboard)
 
@@ -479,13 +480,13 @@ def get_guests_keyboard(selected_guests=None):
 
 # Добавьте этот код в конец файла keyboards/menus.py (перед закрывающей скобкой файла)
 
-def get_payment_method_keyboard(order_id):
-    """Клавиатура выбора способа оплаты"""
+def get_payment_method_keyboard(order_id, version=0):
+    """Клавиатура выбора способа оплаты (версия заказа - та, по которой показан чек)"""
     keyboard = [
-        [InlineKeyboardButton("📱 QR-код", callback_data=f"payment_qr_{order_id}")],
-        [InlineKeyboardButton("💳 Картой", callback_data=f"payment_card_{order_id}")],
-        [InlineKeyboardButton("💵 Наличные", callback_data=f"payment_cash_{order_id}")],
-        [InlineKeyboardButton("💸 Перевод", callback_data=f"payment_transfer_{order_id}")],
+        [InlineKeyboardButton("📱 QR-код", callback_data=f"payment_qr_{order_id}_{version}")],
+        [InlineKeyboardButton("💳 Картой", callback_data=f"payment_card_{order_id}_{version}")],
+        [InlineKeyboardButton("💵 Наличные", callback_data=f"payment_cash_{order_id}_{version}")],
+        [InlineKeyboardButton("💸 Перевод", callback_data=f"payment_transfer_{order_id}_{version}")],
         [InlineKeyboardButton("⬅️ Назад", callback_data=f"back_to_calculation_{order_id}")]
     ]
     return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
@@ -10,7 +10,7 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, WebAppI
 from telegram.ext import Application, MessageHandler, filters, CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram.warnings import PTBUserWarning
 from dotenv import load_dotenv
-from config import BOT_TOKEN, ADMIN_IDS, MINIAPP_URL
+from config import BOT_TOKEN, ADMIN_IDS, MINIAPP_URL, UPDATE_CONCURRENCY
 from error_logger import setup_error_logging
 
 # Импорт для веб-сервера
@@ -2893,8 +2893,31 @@ async def post_init(application):
     else:
         logger.warning("⚠️ MiniApp URL не настроен в конфигурации")
 
+    # Запускаем планировщик удаления временных сообщений (с восстановлением после перезапуска)
+    from message_manager import message_manager
+    message_manager.start_scheduler(application.bot)
+
+    # Продолжаем рассылки, прерванные перезапуском
+    from broadcast_manager import broadcast_manager
+    broadcast_manager.resume_jobs(application.bot)
+
+    # Живая статистика открытой смены (восстанавливается из БД после перезапуска)
+    from shift_stats import shift_tracker
+    from menu_manager import menu_manager
+    shift_tracker.rebuild(menu_manager.db)
+
+    # Фоновые задачи обслуживания (снимки леджера и т.п.)
+    from background_jobs import background_jobs
+    background_jobs.start()
+
 async def post_stop(application):
     """Функция, выполняемая при остановке бота"""
+    from background_jobs import background_jobs
+    from broadcast_manager import broadcast_manager
+    from message_manager import message_manager
+    await broadcast_manager.stop()
+    await background_jobs.stop()
+    await message_manager.stop_scheduler()
     logger.info("🛑 Бот остановлен")
 
 def is_admin(user_id):
@@ -3300,6 +3323,13 @@ async def handle_unknown_message(update: Update, context: ContextTypes.DEFAULT_T
                 reply_markup=keyboard
             )
 
+async def handle_admin_number(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Число от администратора: номер стола при создании заказа, иначе - неизвестное сообщение"""
+    if context.user_data.get('expecting_table_number'):
+        from handlers.order_creation import handle_table_number
+        return await handle_table_number(update, context)
+    return await handle_unknown_message(update, context)
+
 async def handle_back_button(update: Update, context):
     """Обработчик кнопки 'Назад' для обоих типов пользователей"""
     user_id = update.effective_user.id
@@ -3341,7 +3371,7 @@ def setup_handlers(application):
     )
     from handlers.admin_bookings import (
         show_bookings, show_pending_bookings, show_confirmed_bookings,
-        show_cancelled_bookings, show_all_bookings, handle_booking_action,
+        show_cancelled_bookings, show_all_bookings, handle_booking_action, handle_bookings_page,
         get_booking_date_handler, get_booking_cancellation_handler
     )
     from handlers.admin_bonuses import (
@@ -3349,7 +3379,7 @@ def setup_handlers(application):
         get_bonus_handler
     )
     from handlers.admin_messages import (
-        get_broadcast_handler, get_user_message_handler,
+        get_broadcast_handler, get_broadcast_album_handler, get_user_message_handler,
         message_user_callback
     )
 
@@ -3385,7 +3415,7 @@ def setup_handlers(application):
         show_select_shift_menu, show_selected_shift_history,
         select_year_for_history, select_month_for_history,
         show_full_year_history, show_full_month_history,
-        show_more_shifts
+        show_more_shifts, handle_report_page, handle_report_export
     )
 
     # Утилиты заказов
@@ -3416,6 +3446,8 @@ def setup_handlers(application):
     # 4. Сначала добавляем ConversationHandler'ы
     application.add_handler(get_user_message_handler())
     application.add_handler(get_broadcast_handler())
+    # Части альбома для рассылки перехватываются раньше остальных обработчиков
+    application.add_handler(get_broadcast_album_handler(), group=-1)
     application.add_handler(get_bonus_handler())
     application.add_handler(get_booking_date_handler())
     application.add_handler(get_booking_cancellation_handler())
@@ -3483,12 +3515,14 @@ def setup_handlers(application):
 
     # Callback обработчики бронирований
     application.add_handler(CallbackQueryHandler(handle_booking_action, pattern="^(confirm_booking_|cancel_booking_|info_booking_)"))
+    application.add_handler(CallbackQueryHandler(handle_bookings_page, pattern="^bookings_page_"))
 
     # Callback обработчики бонусов
     application.add_handler(CallbackQueryHandler(handle_bonus_request_action, pattern="^(approve_|reject_)"))
 
     # 8. ОБРАБОТЧИКИ УПРАВЛЕНИЯ ЗАКАЗАМИ
     application.add_handler(CallbackQueryHandler(handle_create_order, pattern="^create_order$"))
+    application.add_handler(MessageHandler(filters.Regex(r"^\d+$") & admin_filter, handle_admin_number))
     application.add_handler(CallbackQueryHandler(handle_category_selection, pattern="^category_"))
     application.add_handler(CallbackQueryHandler(handle_item_selection, pattern="^item_"))
     application.add_handler(CallbackQueryHandler(handle_back_to_categories, pattern="^back_to_categories$"))
@@ -3518,6 +3552,8 @@ def setup_handlers(application):
     application.add_handler(CallbackQueryHandler(show_full_year_history, pattern="^history_full_year_"))
     application.add_handler(CallbackQueryHandler(show_full_month_history, pattern="^history_full_month_"))
     application.add_handler(CallbackQueryHandler(show_more_shifts, pattern="^history_month_more_"))
+    application.add_handler(CallbackQueryHandler(handle_report_page, pattern="^report_page_"))
+    application.add_handler(CallbackQueryHandler(handle_report_export, pattern="^history_export_"))
     application.add_handler(CallbackQueryHandler(open_shift, pattern="^open_shift$"))
     application.add_handler(CallbackQueryHandler(close_shift, pattern="^close_shift$"))
     application.add_handler(CallbackQueryHandler(calculate_all_orders, pattern="^calculate_all_orders$"))
@@ -3566,11 +3602,20 @@ def main():
         time.sleep(3)
 
         # Создание приложения бота
+        # Состояние диалогов, user_data и bot_data (в т.ч. открытая смена) переживает перезапуск
+        from persistence import SQLitePersistence
+        # Разные чаты обрабатываются параллельно, один чат/заказ/стол - по очереди
+        from utils.update_processor import ChatUpdateProcessor
+
         application = Application.builder() \
             .token(BOT_TOKEN) \
+            .persistence(SQLitePersistence()) \
+            .concurrent_updates(ChatUpdateProcessor(UPDATE_CONCURRENCY)) \
             .post_init(post_init) \
             .post_stop(post_stop) \
             .build()
+        # Номер стола блокирует стол только у тех, от кого бот ждет номер
+        application.update_processor.user_data = application.user_data
 
         # Настройка обработчиков
         logger.info("🔄 Настройка обработчиков...")
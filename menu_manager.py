@@ -1,13 +1,19 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from database import Database
+from shift_stats import shift_tracker
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Сколько раз повторяем изменение заказа, если его одновременно изменил другой админ
+MAX_ORDER_UPDATE_ATTEMPTS = 3
+
 
 class MenuManager:
     def __init__(self):
         self.db = Database()
+        # Сколько раз изменения заказов сталкивались (метрика для логов)
+        self.order_conflicts = 0
         # Базовые данные для инициализации (используются только если база пустая)
         self.menu_items = [
             # Кальяны
@@ -101,26 +107,79 @@ class MenuManager:
         ''', (table_number, admin_id, 'active', self.db.get_moscow_time()))
         order_id = cursor.lastrowid
         self.db.conn.commit()
+        shift_tracker.order_created(order_id)
         return order_id
 
+    def update_order(self, order_id, apply, expected_version=None):
+        """
+        Изменить заказ с оптимистичной блокировкой.
+        apply(cursor) выполняет изменения и возвращает (success, message); вместе с ними
+        версия заказа увеличивается на 1. Если заказ успел измениться - повторяем,
+        а если передан expected_version (админ видел конкретную версию) - сразу отказ.
+        """
+        for attempt in range(MAX_ORDER_UPDATE_ATTEMPTS):
+            current = self.db.get_order_version(order_id)
+            if not current:
+                return False, "Заказ не найден"
+
+            status, version = current
+            if status != 'active':
+                return False, "Заказ уже закрыт"
+            if expected_version is not None and version != expected_version:
+                self._register_order_conflict(order_id)
+                return False, "Заказ изменил другой администратор"
+
+            cursor = self.db.conn.cursor()
+            try:
+                if not self.db.bump_order_version(cursor, order_id, version):
+                    self.db.conn.rollback()
+                    self._register_order_conflict(order_id)
+                    continue
+
+                success, message = apply(cursor)
+                if success:
+                    self.db.conn.commit()
+                else:
+                    self.db.conn.rollback()
+                return success, message
+            except Exception:
+                self.db.conn.rollback()
+                raise
+
+        logger.warning(f"Заказ #{order_id}: не удалось применить изменение за {MAX_ORDER_UPDATE_ATTEMPTS} попытки")
+        return False, "Заказ одновременно меняют другие администраторы, попробуйте еще раз"
+
+    def _register_order_conflict(self, order_id):
+        self.order_conflicts += 1
+        logger.info(f"⚠️ Конфликт изменения заказа #{order_id} (всего конфликтов: {self.order_conflicts})")
+
     def add_item_to_order(self, order_id, item_name, quantity=1):
         """Добавить позицию в заказ"""
         item = self.get_item_by_name(item_name)
         if not item:
             return False
 
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-            INSERT INTO order_items (order_id, item_name, price, quantity, added_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (order_id, item[0], item[1], quantity, self.db.get_moscow_time()))
-        self.db.conn.commit()
-        return True
+        def apply(cursor):
+            cursor.execute('''
+                INSERT INTO order_items (order_id, item_name, price, quantity, added_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (order_id, item[0], item[1], quantity, self.db.get_moscow_time()))
+            return True, "Позиция добавлена"
+
+        success, _ = self.update_order(order_id, apply)
+        if success:
+            shift_tracker.item_added(order_id, item[0], item[1], quantity, item[2])
+        return success
 
     # НОВЫЙ МЕТОД ДЛЯ УДАЛЕНИЯ ПОЗИЦИЙ ИЗ ЗАКАЗА
     def remove_item_from_order(self, order_id, item_name):
         """Удалить позицию из заказа"""
-        return self.db.remove_item_from_order(order_id, item_name)
+        success, message = self.update_order(
+            order_id, lambda cursor: self.db.delete_one_order_item(cursor, order_id, item_name)
+        )
+        if success:
+            shift_tracker.item_removed(order_id, item_name)
+        return success, message
 
     def get_active_order_by_table(self, table_number):
         """Получить активный заказ по номеру стола"""
@@ -132,27 +191,35 @@ class MenuManager:
         ''', (table_number,))
         return cursor.fetchone()
 
-    def get_order_items(self, order_id):
-        """Получить все позиции заказа"""
+    def get_order_items(self, order_id, include_archive=False):
+        """Получить все позиции заказа. include_archive - для истории: заказ может быть уже в архиве"""
+        table = 'order_items_all' if include_archive else 'order_items'
         cursor = self.db.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM order_items WHERE order_id = ?
+        cursor.execute(f'''
+            SELECT * FROM {table} WHERE order_id = ?
         ''', (order_id,))
         return cursor.fetchall()
 
-    def calculate_order_total(self, order_id):
+    def calculate_order_total(self, order_id, include_archive=False):
         """Рассчитать общую сумму заказа"""
-        items = self.get_order_items(order_id)
+        items = self.get_order_items(order_id, include_archive)
         total = sum(item[3] * item[4] for item in items)  # price * quantity
         return total
 
-    def close_order(self, order_id):
-        """Закрыть заказ"""
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-            UPDATE orders SET status = 'closed', closed_at = ? WHERE id = ?
-        ''', (self.db.get_moscow_time(), order_id))
-        self.db.conn.commit()
+    def close_order(self, order_id, payment_method=None, expected_version=None):
+        """Закрыть заказ. expected_version - версия, по которой админ видел сумму чека"""
+        def apply(cursor):
+            cursor.execute('''
+                UPDATE orders SET status = 'closed', closed_at = ?,
+                    payment_method = COALESCE(?, payment_method)
+                WHERE id = ?
+            ''', (self.db.get_moscow_time(), payment_method, order_id))
+            return True, "Заказ закрыт"
+
+        success, message = self.update_order(order_id, apply, expected_version)
+        if success:
+            shift_tracker.order_closed(order_id, payment_method)
+        return success, message
 
     def get_category_keyboard(self):
         """Клавиатура для выбора категорий меню"""
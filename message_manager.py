@@ -1,19 +1,117 @@
 import asyncio
+import heapq
+import math
+import time
+from collections import OrderedDict, deque
 from typing import List, Optional
 from telegram import Message, Update, error
 from telegram.ext import ContextTypes
-from config import MESSAGE_CLEANUP_DELAY
+from config import MESSAGE_CLEANUP_DELAY, MAX_TRACKED_MESSAGES_PER_CHAT, MAX_TRACKED_CHATS, PENDING_DELETIONS_FLUSH_INTERVAL
+from database import Database
+from utils.rate_limiter import api_rate_limiter
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Telegram удаляет не более 100 сообщений за один вызов deleteMessages
+DELETE_MESSAGES_BATCH_SIZE = 100
+
+
+class TrackedMessages:
+    """ID сообщений одного чата: ограниченная очередь + множество для быстрой проверки"""
+
+    __slots__ = ('_order', '_members', '_maxlen')
+
+    def __init__(self, maxlen: int = MAX_TRACKED_MESSAGES_PER_CHAT):
+        self._order = deque()
+        self._members = set()
+        self._maxlen = maxlen
+
+    def add(self, message_id: int):
+        if message_id in self._members:
+            return
+        if len(self._order) >= self._maxlen:
+            # Самое старое сообщение забываем
+            self._members.discard(self._order.popleft())
+        self._order.append(message_id)
+        self._members.add(message_id)
+
+    def discard(self, message_id: int):
+        if message_id in self._members:
+            self._members.remove(message_id)
+            self._order.remove(message_id)
+
+    def clear(self):
+        self._order.clear()
+        self._members.clear()
+
+    def last(self) -> Optional[int]:
+        return self._order[-1] if self._order else None
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._members
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+class ChatMessageStore:
+    """Сообщения по чатам с вытеснением давно неактивных чатов (LRU)"""
+
+    def __init__(self, max_chats: int = MAX_TRACKED_CHATS):
+        self._chats = OrderedDict()
+        self._max_chats = max_chats
+
+    def get(self, chat_id: int, create: bool = False) -> Optional[TrackedMessages]:
+        messages = self._chats.get(chat_id)
+        if messages is None:
+            if not create:
+                return None
+            messages = self._chats[chat_id] = TrackedMessages()
+            if len(self._chats) > self._max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return messages
+
+    def add(self, chat_id: int, message_id: int):
+        self.get(chat_id, create=True).add(message_id)
+
+    def contains(self, chat_id: int, message_id: int) -> bool:
+        messages = self._chats.get(chat_id)
+        return messages is not None and message_id in messages
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
 
 class MessageManager:
     def __init__(self):
-        self.temporary_messages = {}
-        self.permanent_messages = {}
-        self.notification_messages = {}  # Отдельное хранилище для уведомлений
-        self.inactive_users = set()  # Пользователи, заблокировавшие бота
+        self.temporary_messages = ChatMessageStore()
+        self.permanent_messages = ChatMessageStore()
+        self.notification_messages = ChatMessageStore()  # Отдельное хранилище для уведомлений
+        self.db = Database()
+        # Пользователи, заблокировавшие бота (список хранится в БД и переживает перезапуск)
+        self.inactive_users = set(self.db.get_blocked_chat_ids())
+
+        # Планировщик удаления временных сообщений: одна задача на весь бот.
+        # В куче лежат моменты удаления, в корзинах - сообщения, которые
+        # нужно удалить в этот момент (удаления с одинаковым сроком объединяются)
+        self._deletion_heap = []
+        self._deletion_buckets = {}
+        self._scheduler_task = None
+        self._scheduler_wakeup = None
+        self._bot = None
+        # Еще не записанные в базу удаления: (chat_id, message_id) -> due_at.
+        # Планировщик пишет их пачкой раз в PENDING_DELETIONS_FLUSH_INTERVAL и при остановке
+        self._unsaved_deletions = {}
+        self._unsaved_since = 0.0
 
     async def send_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
                            text: str, is_temporary: bool = False, is_notification: bool = False, **kwargs) -> Optional[Message]:
@@ -37,22 +135,16 @@ class MessageManager:
 
             if is_notification:
                 # Уведомления никогда не очищаются автоматически
-                if user_id not in self.notification_messages:
-                    self.notification_messages[user_id] = []
-                self.notification_messages[user_id].append(message.message_id)
+                self.notification_messages.add(user_id, message.message_id)
 
             elif is_temporary:
-                if user_id not in self.temporary_messages:
-                    self.temporary_messages[user_id] = []
-                self.temporary_messages[user_id].append(message.message_id)
+                self.temporary_messages.add(user_id, message.message_id)
 
                 # Запланировать удаление временного сообщения
-                asyncio.create_task(self._delete_temporary_message(context, user_id, message.message_id))
+                self.schedule_deletion(context.bot, user_id, message.message_id)
             else:
                 # Постоянные сообщения (меню)
-                if user_id not in self.permanent_messages:
-                    self.permanent_messages[user_id] = []
-                self.permanent_messages[user_id].append(message.message_id)
+                self.permanent_messages.add(user_id, message.message_id)
 
             return message
             
@@ -60,7 +152,7 @@ class MessageManager:
             error_msg = str(e)
             if "Chat not found" in error_msg or "user is deactivated" in error_msg:
                 logger.error(f"❌ Пользователь {user_id} заблокировал бота или чат не найден: {error_msg}")
-                self.inactive_users.add(user_id)
+                self.mark_user_inactive(user_id, error_msg)
                 return None
             else:
                 logger.error(f"❌ Ошибка BadRequest при отправке сообщения: {error_msg}")
@@ -68,7 +160,7 @@ class MessageManager:
                 
         except error.Forbidden as e:
             logger.error(f"❌ Бот заблокирован пользователем {user_id}: {e}")
-            self.inactive_users.add(user_id)
+            self.mark_user_inactive(user_id, str(e))
             return None
             
         except Exception as e:
@@ -89,20 +181,14 @@ class MessageManager:
 
             if is_notification:
                 # Уведомления никогда не очищаются автоматически
-                if chat_id not in self.notification_messages:
-                    self.notification_messages[chat_id] = []
-                self.notification_messages[chat_id].append(message.message_id)
+                self.notification_messages.add(chat_id, message.message_id)
 
             elif is_temporary:
-                if chat_id not in self.temporary_messages:
-                    self.temporary_messages[chat_id] = []
-                self.temporary_messages[chat_id].append(message.message_id)
+                self.temporary_messages.add(chat_id, message.message_id)
 
-                asyncio.create_task(self._delete_temporary_message(context, chat_id, message.message_id))
+                self.schedule_deletion(context.bot, chat_id, message.message_id)
             else:
-                if chat_id not in self.permanent_messages:
-                    self.permanent_messages[chat_id] = []
-                self.permanent_messages[chat_id].append(message.message_id)
+                self.permanent_messages.add(chat_id, message.message_id)
 
             return message
             
@@ -110,7 +196,7 @@ class MessageManager:
             error_msg = str(e)
             if "Chat not found" in error_msg or "user is deactivated" in error_msg:
                 logger.error(f"❌ Чат {chat_id} не найден или пользователь деактивирован: {error_msg}")
-                self.inactive_users.add(chat_id)
+                self.mark_user_inactive(chat_id, error_msg)
                 return None
             else:
                 logger.error(f"❌ Ошибка BadRequest при отправке в чат {chat_id}: {error_msg}")
@@ -118,68 +204,189 @@ class MessageManager:
                 
         except error.Forbidden as e:
             logger.error(f"❌ Бот заблокирован в чате {chat_id}: {e}")
-            self.inactive_users.add(chat_id)
+            self.mark_user_inactive(chat_id, str(e))
             return None
             
         except Exception as e:
             logger.error(f"❌ Ошибка при отправке сообщения в чат {chat_id}: {e}")
             return None
 
-    async def _delete_temporary_message(self, context: ContextTypes.DEFAULT_TYPE,
-                                        chat_id: int, message_id: int):
-        """Удаляет временное сообщение после задержки"""
-        await asyncio.sleep(MESSAGE_CLEANUP_DELAY)
+    # ========== ПЛАНИРОВЩИК УДАЛЕНИЯ ВРЕМЕННЫХ СООБЩЕНИЙ ==========
+
+    def schedule_deletion(self, bot, chat_id: int, message_id: int, delay: int = MESSAGE_CLEANUP_DELAY):
+        """Запланировать удаление сообщения через delay секунд"""
+        due_at = math.ceil(time.time()) + delay
+        if not self._unsaved_deletions:
+            # Первое незаписанное удаление: планировщик должен проснуться к сроку записи буфера
+            self._unsaved_since = time.monotonic()
+            if self._scheduler_wakeup:
+                self._scheduler_wakeup.set()
+        self._unsaved_deletions[(chat_id, message_id)] = due_at
+        self._push_deletion(due_at, chat_id, message_id)
+        self._ensure_scheduler(bot)
+
+    def start_scheduler(self, bot):
+        """Запустить планировщик и восстановить отложенные удаления из базы (вызывается при старте бота)"""
+        restored = 0
+        for chat_id, message_id, due_at in self.db.get_pending_deletions():
+            self.temporary_messages.add(chat_id, message_id)
+            self._push_deletion(due_at, chat_id, message_id)
+            restored += 1
+
+        if restored:
+            logger.info(f"♻️ Восстановлено {restored} отложенных удалений сообщений")
+        self._ensure_scheduler(bot)
+
+    async def stop_scheduler(self):
+        """Остановить планировщик (записи в базе остаются до следующего запуска)"""
+        if self._scheduler_task and not self._scheduler_task.done():
+            self._scheduler_task.cancel()
+            try:
+                await self._scheduler_task
+            except asyncio.CancelledError:
+                pass
+        self._scheduler_task = None
+        self._save_deletions()
+
+    def _save_deletions(self):
+        """Записать накопленные отложенные удаления в базу одним запросом"""
+        if not self._unsaved_deletions:
+            return
+        deletions = [(chat_id, message_id, due_at) for (chat_id, message_id), due_at in self._unsaved_deletions.items()]
+        self._unsaved_deletions = {}
         try:
-            # Проверяем, не является ли пользователь неактивным
-            if chat_id in self.inactive_users:
-                return  # Не пытаемся удалять сообщения у неактивных пользователей
-
-            # Проверяем, не является ли сообщение уведомлением или постоянным
-            if (chat_id in self.notification_messages and
-                    message_id in self.notification_messages[chat_id]):
-                return  # Не удаляем уведомления
+            self.db.add_pending_deletions(deletions)
+        except Exception as e:
+            logger.error(f"Не удалось сохранить {len(deletions)} отложенных удалений: {e}")
+
+    def _forget_deletions(self, messages):
+        """Убрать отложенные удаления (список (chat_id, message_id)) из буфера и из базы"""
+        saved = [key for key in messages if self._unsaved_deletions.pop(key, None) is None]
+        self.db.remove_pending_deletions(saved)
+
+    def _push_deletion(self, due_at: int, chat_id: int, message_id: int):
+        bucket = self._deletion_buckets.get(due_at)
+        if bucket is None:
+            bucket = self._deletion_buckets[due_at] = []
+            heapq.heappush(self._deletion_heap, due_at)
+            # Новый срок раньше текущего ожидания - будим планировщик
+            if self._scheduler_wakeup and self._deletion_heap[0] == due_at:
+                self._scheduler_wakeup.set()
+        bucket.append((chat_id, message_id))
+
+    def _ensure_scheduler(self, bot):
+        self._bot = bot
+        if self._scheduler_task is None or self._scheduler_task.done():
+            self._scheduler_wakeup = asyncio.Event()
+            self._scheduler_task = asyncio.create_task(self._run_deletion_scheduler())
+
+    async def _run_deletion_scheduler(self):
+        """Единственная задача, которая удаляет временные сообщения по наступлении срока"""
+        while True:
+            try:
+                save_in = PENDING_DELETIONS_FLUSH_INTERVAL - (time.monotonic() - self._unsaved_since)
+                if self._unsaved_deletions and save_in <= 0:
+                    self._save_deletions()
+
+                if not self._deletion_heap:
+                    self._scheduler_wakeup.clear()
+                    await self._scheduler_wakeup.wait()
+                    continue
+
+                delay = self._deletion_heap[0] - time.time()
+                if delay > 0:
+                    if self._unsaved_deletions:
+                        # Просыпаемся и к сроку записи буфера в базу
+                        delay = min(delay, max(save_in, 0))
+                    self._scheduler_wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._scheduler_wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
 
-            if (chat_id in self.permanent_messages and
-                    message_id in self.permanent_messages[chat_id]):
-                return  # Не удаляем постоянные сообщения
+                # Забираем все корзины, срок которых уже наступил
+                now = time.time()
+                batch = []
+                while self._deletion_heap and self._deletion_heap[0] <= now:
+                    due_at = heapq.heappop(self._deletion_heap)
+                    batch.extend(self._deletion_buckets.pop(due_at, []))
 
-            await context.bot.delete_message(chat_id, message_id)
+                await self._delete_temporary_batch(batch)
 
-            # Удаляем из списка временных сообщений
-            if (chat_id in self.temporary_messages and
-                    message_id in self.temporary_messages[chat_id]):
-                self.temporary_messages[chat_id].remove(message_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка в планировщике удаления сообщений: {e}")
+                await asyncio.sleep(1)
+
+    async def _delete_temporary_batch(self, batch):
+        """Удаляет пачку временных сообщений, срок которых наступил"""
+        by_chat = {}
+        for chat_id, message_id in batch:
+            by_chat.setdefault(chat_id, []).append(message_id)
+
+        deletions = []
+        for chat_id, message_ids in by_chat.items():
+            tracked = self.temporary_messages.get(chat_id)
+            to_delete = []
+            for message_id in message_ids:
+                # Чат известен, но сообщения в нем уже нет - его удалила очистка
+                if tracked is not None and message_id not in tracked:
+                    continue
+                if self.notification_messages.contains(chat_id, message_id):
+                    continue
+                if self.permanent_messages.contains(chat_id, message_id):
+                    continue
+                to_delete.append(message_id)
+                if tracked is not None:
+                    tracked.discard(message_id)
+
+            if to_delete:
+                deletions.append(self._delete_messages(self._bot, chat_id, to_delete))
+
+        await asyncio.gather(*deletions)
+        # Удаления, которые не успели попасть в базу, просто выбрасываются из буфера
+        self._forget_deletions(batch)
+
+    async def _delete_messages(self, bot, chat_id: int, message_ids: List[int]) -> int:
+        """Удаляет сообщения пачками по 100 через deleteMessages, пачки уходят параллельно под общим лимитером"""
+        # Не пытаемся удалять сообщения у неактивных пользователей
+        if not message_ids or chat_id in self.inactive_users:
+            return 0
+
+        chunks = [message_ids[i:i + DELETE_MESSAGES_BATCH_SIZE]
+                  for i in range(0, len(message_ids), DELETE_MESSAGES_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._delete_messages_chunk(bot, chat_id, chunk) for chunk in chunks))
+        return sum(results)
+
+    async def _delete_messages_chunk(self, bot, chat_id: int, message_ids: List[int]) -> int:
+        try:
+            async with api_rate_limiter:
+                # Уже удаленные сообщения Telegram просто пропускает
+                await bot.delete_messages(chat_id, message_ids)
+            return len(message_ids)
         except error.BadRequest as e:
             error_msg = str(e)
             if "Chat not found" in error_msg or "user is deactivated" in error_msg:
-                logger.warning(f"⚠️ Чат {chat_id} не найден при удалении сообщения, добавляем в неактивные")
-                self.inactive_users.add(chat_id)
-            elif "Message to delete not found" in error_msg:
-                logger.debug(f"Сообщение {message_id} уже удалено для чата {chat_id}")
+                logger.warning(f"⚠️ Чат {chat_id} не найден при удалении сообщений, добавляем в неактивные")
+                self.mark_user_inactive(chat_id, error_msg)
             else:
-                logger.debug(f"Не удалось удалить временное сообщение {message_id} для {chat_id}: {e}")
+                logger.debug(f"Не удалось удалить {len(message_ids)} сообщений для {chat_id}: {e}")
         except Exception as e:
-            logger.debug(f"Не удалось удалить временное сообщение {message_id} для {chat_id}: {e}")
+            logger.debug(f"Не удалось удалить {len(message_ids)} сообщений для {chat_id}: {e}")
+        return 0
 
     async def cleanup_user_messages(self, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Очищает все временные сообщения пользователя (но не уведомления)"""
-        if user_id in self.temporary_messages:
-            for message_id in self.temporary_messages[user_id][:]:
-                try:
-                    await context.bot.delete_message(user_id, message_id)
-                except error.BadRequest as e:
-                    error_msg = str(e)
-                    if "Chat not found" in error_msg or "user is deactivated" in error_msg:
-                        logger.warning(f"⚠️ Чат {user_id} не найден при очистке, добавляем в неактивные")
-                        self.inactive_users.add(user_id)
-                        break  # Прерываем очистку
-                    elif "Message to delete not found" in error_msg:
-                        continue  # Сообщение уже удалено
-                    else:
-                        logger.debug(f"Не удалось удалить сообщение {message_id} при очистке: {e}")
-                except Exception as e:
-                    logger.debug(f"Не удалось удалить сообщение {message_id} при очистке: {e}")
-            self.temporary_messages[user_id] = []
+        temporary = self.temporary_messages.get(user_id)
+        if not temporary:
+            return
+
+        message_ids = list(temporary)
+        temporary.clear()
+        self._forget_deletions([(user_id, message_id) for message_id in message_ids])
+        await self._delete_messages(context.bot, user_id, message_ids)
 
     async def cleanup_all_messages(self, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Полная очистка ВСЕХ сообщений пользователя (используется при возврате в главное меню)"""
@@ -189,59 +396,29 @@ class MessageManager:
                 logger.warning(f"Пользователь {user_id} неактивен, пропускаем очистку")
                 return
 
-            deleted_count = 0
+            message_ids = []
 
-            # Очищаем временные сообщения
-            if user_id in self.temporary_messages:
-                for message_id in self.temporary_messages[user_id][:]:
-                    try:
-                        await context.bot.delete_message(user_id, message_id)
-                        deleted_count += 1
-                    except error.BadRequest as e:
-                        error_msg = str(e)
-                        if "Chat not found" in error_msg or "user is deactivated" in error_msg:
-                            logger.warning(f"⚠️ Чат {user_id} не найден при очистке, добавляем в неактивные")
-                            self.inactive_users.add(user_id)
-                            break  # Прерываем очистку
-                        elif "Message to delete not found" in error_msg:
-                            continue  # Сообщение уже удалено
-                        else:
-                            logger.debug(f"Не удалось удалить временное сообщение {message_id}: {e}")
-                    except Exception as e:
-                        logger.debug(f"Не удалось удалить временное сообщение {message_id}: {e}")
-                self.temporary_messages[user_id] = []
-
-            # Очищаем постоянные сообщения (кроме самого последнего - главного меню)
-            if user_id in self.permanent_messages and self.permanent_messages[user_id]:
-                # Сохраняем ID последнего сообщения (главное меню)
-                last_message_id = self.permanent_messages[user_id][-1] if self.permanent_messages[user_id] else None
-
-                for message_id in self.permanent_messages[user_id][:]:
-                    if message_id != last_message_id:  # Не удаляем главное меню
-                        try:
-                            await context.bot.delete_message(user_id, message_id)
-                            deleted_count += 1
-                        except error.BadRequest as e:
-                            error_msg = str(e)
-                            if "Chat not found" in error_msg or "user is deactivated" in error_msg:
-                                logger.warning(f"⚠️ Чат {user_id} не найден при очистке, добавляем в неактивные")
-                                self.inactive_users.add(user_id)
-                                break  # Прерываем очистку
-                            elif "Message to delete not found" in error_msg:
-                                continue  # Сообщение уже удалено
-                            else:
-                                logger.debug(f"Не удалось удалить постоянное сообщение {message_id}: {e}")
-                        except Exception as e:
-                            logger.debug(f"Не удалось удалить постоянное сообщение {message_id}: {e}")
+            # Временные сообщения
+            temporary = self.temporary_messages.get(user_id)
+            if temporary:
+                temporary_ids = list(temporary)
+                temporary.clear()
+                self._forget_deletions([(user_id, message_id) for message_id in temporary_ids])
+                message_ids.extend(temporary_ids)
+
+            # Постоянные сообщения (кроме самого последнего - главного меню)
+            permanent = self.permanent_messages.get(user_id)
+            if permanent:
+                last_message_id = permanent.last()
+                message_ids.extend(message_id for message_id in permanent if message_id != last_message_id)
 
                 # Оставляем только последнее сообщение (главное меню)
-                if last_message_id:
-                    self.permanent_messages[user_id] = [last_message_id]
-                else:
-                    self.permanent_messages[user_id] = []
+                permanent.clear()
+                permanent.add(last_message_id)
 
             # УВЕДОМЛЕНИЯ НЕ ОЧИЩАЕМ - они остаются всегда
 
+            deleted_count = await self._delete_messages(context.bot, user_id, message_ids)
             logger.debug(f"Очищено {deleted_count} сообщений для пользователя {user_id}")
 
         except Exception as e:
@@ -249,17 +426,26 @@ class MessageManager:
 
     def is_temporary_message(self, user_id: int, message_id: int) -> bool:
         """Проверяет, является ли сообщение временным"""
-        return (user_id in self.temporary_messages and
-                message_id in self.temporary_messages[user_id])
+        return self.temporary_messages.contains(user_id, message_id)
     
     def is_user_inactive(self, user_id: int) -> bool:
         """Проверяет, заблокировал ли пользователь бота"""
         return user_id in self.inactive_users
     
+    def mark_user_inactive(self, user_id: int, reason: str = None):
+        """Добавляет пользователя в список неактивных и сохраняет отметку в БД"""
+        self.inactive_users.add(user_id)
+        try:
+            self.db.mark_chat_blocked(user_id, reason)
+        except Exception as e:
+            logger.error(f"❌ Не удалось сохранить блокировку пользователя {user_id}: {e}")
+
     def remove_inactive_user(self, user_id: int):
         """Удаляет пользователя из списка неактивных (если он снова начал общение)"""
+        # Множество загружено из БД, поэтому лишний запрос при каждом /start не нужен
         if user_id in self.inactive_users:
             self.inactive_users.remove(user_id)
+            self.db.unmark_chat_blocked(user_id)
             logger.info(f"✅ Пользователь {user_id} удален из списка неактивных")
 
 
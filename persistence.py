@@ -0,0 +1,135 @@
+"""
+Сохранение состояния бота в SQLite: user_data, chat_data, bot_data и состояния диалогов
+"""
+import asyncio
+import logging
+import pickle
+from typing import Dict, Optional
+from telegram.ext import BasePersistence, PersistenceInput
+from config import PERSISTENCE_UPDATE_INTERVAL
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(data) -> bytes:
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Хранит данные в таблице bot_persistence компактными pickle-блобами.
+    PTB передает изменения раз в update_interval секунд; изменения копятся
+    в памяти и записываются одной транзакцией, а не запросом на каждое обновление.
+    """
+
+    def __init__(self, update_interval: float = PERSISTENCE_UPDATE_INTERVAL):
+        # Произвольные callback_data бот не использует
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db = Database()
+        self._conversations = {}
+        self._dirty = {}  # (kind, key) -> blob или None (удалить)
+        self._flush_task = None
+
+    # ========== ЗАГРУЗКА ==========
+
+    def _load(self, kind: str, parse_key=str) -> Dict:
+        result = {}
+        for key, data in self.db.get_persistence_data(kind):
+            try:
+                result[parse_key(key)] = pickle.loads(data)
+            except Exception as e:
+                # Нечитаемая запись (например, класс из нее удален из кода) не должна мешать запуску:
+                # пропускаем ее и удаляем из базы
+                logger.warning(f"⚠️ Сохраненные данные {kind}/{key} не читаются и будут удалены: {e}")
+                self._mark_dirty(kind, key, None)
+        return result
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return self._load('user', int)
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return self._load('chat', int)
+
+    async def get_bot_data(self) -> dict:
+        return self._load('bot').get('', {})
+
+    async def get_callback_data(self) -> Optional[tuple]:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        if name not in self._conversations:
+            self._conversations[name] = self._load('conversation').get(name, {})
+        return dict(self._conversations[name])
+
+    # ========== ИЗМЕНЕНИЯ ==========
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._mark_dirty('user', str(user_id), _dumps(data))
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._mark_dirty('chat', str(chat_id), _dumps(data))
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._mark_dirty('bot', '', _dumps(data))
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        conversations = self._conversations.setdefault(name, {})
+        if new_state is None:
+            if conversations.pop(key, None) is None:
+                return
+        else:
+            if conversations.get(key) == new_state:
+                return
+            conversations[key] = new_state
+        self._mark_dirty('conversation', name, _dumps(conversations))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark_dirty('user', str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._mark_dirty('chat', str(chat_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Записывает все накопленные изменения (вызывается при остановке бота)"""
+        self._write_dirty()
+
+    # ========== ЗАПИСЬ ==========
+
+    def _mark_dirty(self, kind: str, key: str, data: Optional[bytes]):
+        self._dirty[(kind, key)] = data
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        # PTB отдает все изменения пачкой; даем ей закончиться и пишем все разом
+        await asyncio.sleep(0)
+        self._write_dirty()
+
+    def _write_dirty(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            self.db.save_persistence_data([(kind, key, data) for (kind, key), data in dirty.items()])
+            logger.debug(f"💾 Сохранено {len(dirty)} записей состояния бота")
+        except Exception as e:
+            # Вернем изменения, чтобы записать их при следующей попытке (новые важнее старых)
+            dirty.update(self._dirty)
+            self._dirty = dirty
+            logger.error(f"❌ Ошибка при сохранении состояния бота: {e}")
@@ -0,0 +1,66 @@
+"""
+Отчеты по истории заказов на отдельном подключении только для чтения.
+Тяжелые агрегаты выполняются в отдельном потоке и не задерживают запись заказов
+"""
+import asyncio
+import csv
+import sqlite3
+from config import DB_NAME
+from database import Database, read_only_uri
+
+# Колонки выгрузки позиций заказов (соответствуют Database.iter_shift_order_lines)
+EXPORT_COLUMNS = ('Месяц', 'Смена', 'Заказ', 'Стол', 'Создан', 'Закрыт', 'Оплата',
+                  'Позиция', 'Цена', 'Количество', 'Сумма')
+
+
+class ReportingDatabase(Database):
+    """Те же методы чтения, что у Database, но без миграций и без права записи"""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(read_only_uri(DB_NAME), uri=True, check_same_thread=False)
+        self.attach_archive(read_only=True)
+
+
+class ReportRunner:
+    def __init__(self):
+        self._db = None
+        # Подключение одно, отчеты выполняются по очереди
+        self._lock = asyncio.Lock()
+
+    async def run(self, func):
+        """func(report_db) выполняется в отдельном потоке; все запросы внутри видят один снимок БД"""
+        async with self._lock:
+            return await asyncio.to_thread(self._run_snapshot, func)
+
+    def _run_snapshot(self, func):
+        if self._db is None:
+            self._db = ReportingDatabase()
+
+        # Читающая транзакция в WAL: согласованный снимок, который не мешает записи
+        self._db.conn.execute('BEGIN')
+        try:
+            return func(self._db)
+        finally:
+            self._db.conn.rollback()
+
+
+def write_orders_csv(rows, path, payment_names=None):
+    """
+    Пишет строки по одной (rows - генератор), не собирая их в память. Возвращает число строк.
+    Разделитель ';' и BOM - чтобы Excel сразу открывал файл с кириллицей по колонкам
+    """
+    payment_names = payment_names or {}
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as file:
+        writer = csv.writer(file, delimiter=';')
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            row = list(row)
+            row[6] = payment_names.get(row[6], row[6] or '')
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+# Глобальный исполнитель отчетов
+report_runner = ReportRunner()
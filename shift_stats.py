@@ -0,0 +1,166 @@
+"""
+Живая статистика открытой смены: выручка, заказы, продажи по позициям и категориям,
+способы оплаты. Обновляется при каждом изменении заказа (menu_manager), поэтому статус
+смены читается из памяти, а не пересчитывается по БД. После перезапуска бота
+восстанавливается из БД (rebuild)
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ShiftStats:
+    """Накопленные показатели одной смены"""
+
+    def __init__(self, shift_id, opened_at):
+        self.shift_id = shift_id
+        self.opened_at = opened_at
+        # order_id -> {'items': {item_name: [price, quantity]}, 'closed': bool, 'payment_method': str}
+        self.orders = {}
+        # item_name -> {'category', 'quantity', 'total_amount'} по всем заказам смены
+        self.items = {}
+        # payment_method -> {'count', 'total_amount'} по закрытым заказам
+        self.payments = {}
+        self.revenue = 0
+        self.open_amount = 0
+        self.closed_orders = 0
+
+    @property
+    def order_count(self):
+        return len(self.orders)
+
+    @property
+    def active_orders(self):
+        return self.order_count - self.closed_orders
+
+    @property
+    def average_check(self):
+        return self.revenue // self.closed_orders if self.closed_orders else 0
+
+    def categories(self):
+        """category -> {'quantity', 'total_amount'}, по убыванию суммы"""
+        result = {}
+        for data in self.items.values():
+            category = result.setdefault(data['category'], {'quantity': 0, 'total_amount': 0})
+            category['quantity'] += data['quantity']
+            category['total_amount'] += data['total_amount']
+        return dict(sorted(result.items(), key=lambda x: x[1]['total_amount'], reverse=True))
+
+    def add_order(self, order_id, payment_method=None):
+        self.orders.setdefault(order_id, {'items': {}, 'closed': False, 'payment_method': payment_method})
+
+    def add_item(self, order_id, item_name, price, quantity, category):
+        order = self.orders.get(order_id)
+        if order is None or order['closed']:
+            return
+
+        order_item = order['items'].setdefault(item_name, [price, 0])
+        order_item[1] += quantity
+        self._count_item(item_name, category, quantity, price * quantity)
+        self.open_amount += price * quantity
+
+    def remove_item(self, order_id, item_name):
+        """Одна единица позиции (как Database.delete_one_order_item)"""
+        order = self.orders.get(order_id)
+        if order is None or order['closed'] or item_name not in order['items']:
+            return
+
+        order_item = order['items'][item_name]
+        price = order_item[0]
+        order_item[1] -= 1
+        if order_item[1] <= 0:
+            del order['items'][item_name]
+
+        self._count_item(item_name, None, -1, -price)
+        self.open_amount -= price
+
+    def close_order(self, order_id, payment_method=None):
+        order = self.orders.get(order_id)
+        if order is None or order['closed']:
+            return
+
+        order['closed'] = True
+        if payment_method:
+            order['payment_method'] = payment_method
+        total = sum(price * quantity for price, quantity in order['items'].values())
+
+        payment = self.payments.setdefault(order['payment_method'], {'count': 0, 'total_amount': 0})
+        payment['count'] += 1
+        payment['total_amount'] += total
+        self.revenue += total
+        self.open_amount -= total
+        self.closed_orders += 1
+
+    def _count_item(self, item_name, category, quantity, amount):
+        data = self.items.setdefault(item_name, {'category': category or 'Другое', 'quantity': 0, 'total_amount': 0})
+        data['quantity'] += quantity
+        data['total_amount'] += amount
+        if data['quantity'] <= 0:
+            del self.items[item_name]
+
+
+class ShiftTracker:
+    def __init__(self):
+        self.current = None
+
+    def rebuild(self, db):
+        """Восстановить статистику открытой смены из БД (при запуске и открытии смены)"""
+        shift = db.get_active_shift()
+        if not shift:
+            self.current = None
+            return None
+
+        stats = ShiftStats(shift[0], shift[4])
+        rows = db.get_shift_order_items(shift[4])
+        for order_id, status, payment_method, item_name, price, quantity, category in rows:
+            stats.add_order(order_id, payment_method)
+            if item_name is not None:
+                stats.add_item(order_id, item_name, price, quantity, category)
+        # Закрываем после того, как собраны все позиции заказа
+        for order_id in dict.fromkeys(row[0] for row in rows if row[1] == 'closed'):
+            stats.close_order(order_id)
+
+        self.current = stats
+        logger.info(f"📊 Статистика смены #{shift[1]} восстановлена: заказов {stats.order_count}, выручка {stats.revenue}₽")
+        return stats
+
+    def stop(self):
+        self.current = None
+
+    def order_created(self, order_id):
+        if self.current:
+            self.current.add_order(order_id)
+
+    def item_added(self, order_id, item_name, price, quantity, category):
+        if self.current:
+            self.current.add_item(order_id, item_name, price, quantity, category)
+
+    def item_removed(self, order_id, item_name):
+        if self.current:
+            self.current.remove_item(order_id, item_name)
+
+    def order_closed(self, order_id, payment_method=None):
+        if self.current:
+            self.current.close_order(order_id, payment_method)
+
+    def verify(self, total_revenue, total_orders, sales_data):
+        """Сверка с итогами, посчитанными по БД при закрытии смены. True - расхождений нет"""
+        stats = self.current
+        if stats is None:
+            return False
+
+        live_sales = {name: {'quantity': data['quantity'], 'total_amount': data['total_amount']}
+                      for name, data in stats.items.items()}
+        expected_sales = {name: data for name, data in sales_data.items() if data['quantity']}
+        if (stats.revenue + stats.open_amount, stats.order_count, live_sales) == (total_revenue, total_orders, expected_sales):
+            return True
+
+        logger.warning(
+            f"⚠️ Живая статистика смены расходится с БД: выручка {stats.revenue + stats.open_amount}₽ / {total_revenue}₽, "
+            f"заказов {stats.order_count} / {total_orders}"
+        )
+        return False
+
+
+# Глобальная статистика открытой смены
+shift_tracker = ShiftTracker()
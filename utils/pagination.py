@@ -0,0 +1,67 @@
+"""
+Постраничный вывод длинных списков по ключу (keyset): страница - один небольшой запрос
+к БД и одно отредактированное сообщение с кнопками "назад/дальше"
+"""
+import logging
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 10
+
+
+def parse_page_callback(data: str, prefix: str):
+    """
+    callback_data страницы -> (before_id, after_id, номер страницы):
+    '<prefix>0' - первая, '<prefix>n<id>_<стр>' - следующая, '<prefix>p<id>_<стр>' - предыдущая
+    """
+    cursor = data[len(prefix):]
+    try:
+        id_part, page = cursor[1:].split('_')
+        if cursor[0] == 'n':
+            return int(id_part), None, int(page)
+        if cursor[0] == 'p':
+            return None, int(id_part), int(page)
+    except (IndexError, ValueError):
+        pass
+    return None, None, 1
+
+
+def fetch_page(fetch_rows, before_id=None, after_id=None, page_size=PAGE_SIZE):
+    """
+    fetch_rows(before_id, after_id, limit) возвращает строки по убыванию id (id - первое поле).
+    Запрашивается на одну строку больше, чтобы без COUNT узнать, есть ли страница дальше.
+    Возвращает (строки, есть_предыдущая, есть_следующая)
+    """
+    rows = fetch_rows(before_id, after_id, page_size + 1)
+    if after_id is not None:
+        # Лишняя строка - самая дальняя от курсора, она первая
+        return rows[-page_size:], len(rows) > page_size, True
+    return rows[:page_size], before_id is not None, len(rows) > page_size
+
+
+def page_navigation(prefix: str, rows, has_prev: bool, has_next: bool, page: int):
+    """Ряд кнопок навигации; курсоры - id первой и последней строки страницы"""
+    buttons = []
+    if rows and has_prev:
+        buttons.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data=f"{prefix}p{rows[0][0]}_{page - 1}"))
+    if rows and has_next:
+        buttons.append(InlineKeyboardButton("Следующая ➡️", callback_data=f"{prefix}n{rows[-1][0]}_{page + 1}"))
+    return buttons
+
+
+async def show_page(update, context, text: str, keyboard):
+    """Первая страница - новым сообщением, переходы по страницам - редактированием того же сообщения"""
+    reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
+    query = update.callback_query
+    if query:
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup)
+            return
+        except Exception as e:
+            if "Message is not modified" in str(e):
+                return
+            logger.error(f"Ошибка при показе страницы списка: {e}")
+
+    from message_manager import message_manager
+    await message_manager.send_message(update, context, text, reply_markup=reply_markup, is_temporary=False)
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from config import API_RATE_LIMIT
+
+
+class AsyncTokenBucket:
+    """Асинхронный токен-бакет: не более rate запросов в секунду, с запасом capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Остановить выдачу токенов (например, после RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        # Пополнение считается с конца паузы, иначе после нее бакет сразу отдаст накопленный всплеск
+        self._updated = self._paused_until
+
+    async def acquire(self, tokens=1):
+        """Дождаться, пока в бакете появятся токены, и забрать их"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+# Общий лимитер исходящих запросов к Telegram API
+api_rate_limiter = AsyncTokenBucket(API_RATE_LIMIT)
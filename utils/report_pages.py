@@ -0,0 +1,115 @@
+"""
+Длинные отчеты: текст собирается из секций через join и делится на страницы по границам
+секций (лимит сообщения Telegram - 4096 символов). Готовые страницы кэшируются по
+(отчет, версия данных), поэтому переход по страницам не пересчитывает отчет
+"""
+import logging
+from collections import OrderedDict
+from telegram import InlineKeyboardButton
+from utils.pagination import show_page
+
+logger = logging.getLogger(__name__)
+
+# С запасом под строку с номером страницы
+MAX_PAGE_LENGTH = 3800
+REPORT_PAGE_PREFIX = "report_page_"
+MAX_CACHED_REPORTS = 50
+
+
+def _split_section(lines, limit):
+    """Секция длиннее страницы делится по строкам"""
+    text = "\n".join(lines)
+    if len(text) <= limit:
+        return [text]
+
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        line = line[:limit]
+        if current and size + len(line) + 1 > limit:
+            chunks.append("\n".join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def render_pages(sections, limit=MAX_PAGE_LENGTH):
+    """sections - списки строк; секции разделяются пустой строкой и по возможности не разрываются"""
+    pages = []
+    current = []
+    size = 0
+    for lines in sections:
+        for chunk in _split_section(lines, limit):
+            if current and size + len(chunk) + 2 > limit:
+                pages.append("\n\n".join(current))
+                current = []
+                size = 0
+            current.append(chunk)
+            size += len(chunk) + 2
+    if current:
+        pages.append("\n\n".join(current))
+    return pages or [""]
+
+
+class ReportPageCache:
+    """Последние отрисованные отчеты: report_key -> (версия данных, страницы, кнопки под отчетом)"""
+
+    def __init__(self, max_reports=MAX_CACHED_REPORTS):
+        self.max_reports = max_reports
+        self._reports = OrderedDict()
+
+    def get(self, report_key, version=None):
+        """Без version - последняя отрисовка (для листания уже открытого отчета)"""
+        entry = self._reports.get(report_key)
+        if entry is None or (version is not None and entry[0] != version):
+            return None
+        self._reports.move_to_end(report_key)
+        return entry
+
+    def put(self, report_key, version, pages, keyboard):
+        self._reports[report_key] = (version, pages, keyboard)
+        self._reports.move_to_end(report_key)
+        while len(self._reports) > self.max_reports:
+            self._reports.popitem(last=False)
+
+
+# Глобальный кэш страниц отчетов
+report_pages = ReportPageCache()
+
+
+def parse_report_page_callback(data: str):
+    """'report_page_<стр>_<report_key>' -> (report_key, номер страницы с 0)"""
+    page, _, report_key = data[len(REPORT_PAGE_PREFIX):].partition('_')
+    try:
+        return report_key, int(page)
+    except ValueError:
+        return report_key, 0
+
+
+async def show_report(update, context, report_key: str, page: int = 0):
+    """Показать страницу отчета из кэша. False - отчета в кэше нет (например, после перезапуска)"""
+    entry = report_pages.get(report_key)
+    if entry is None:
+        return False
+
+    _, pages, keyboard = entry
+    page = max(0, min(page, len(pages) - 1))
+    text = pages[page]
+
+    navigation = []
+    if len(pages) > 1:
+        text += f"\n\n📄 Страница {page + 1} из {len(pages)}"
+        if page > 0:
+            navigation.append(InlineKeyboardButton(
+                "⬅️ Предыдущая", callback_data=f"{REPORT_PAGE_PREFIX}{page - 1}_{report_key}"))
+        if page < len(pages) - 1:
+            navigation.append(InlineKeyboardButton(
+                "Следующая ➡️", callback_data=f"{REPORT_PAGE_PREFIX}{page + 1}_{report_key}"))
+
+    await show_page(update, context, text, ([navigation] if navigation else []) + keyboard)
+    return True
@@ -0,0 +1,106 @@
+import asyncio
+import re
+from contextlib import asynccontextmanager
+
+from telegram.ext import BaseUpdateProcessor
+
+# Кнопки, которые меняют конкретный заказ: последнее число в callback_data - id заказа
+ORDER_CALLBACK_PATTERN = re.compile(
+    r'^(?:add_items|view_order|calculate|back_to_calculation|add_to_existing|edit_order|remove_item|payment_[a-z]+)_(\d+)'
+)
+
+
+class KeyedLocks:
+    """Набор asyncio-блокировок по ключам; неиспользуемые блокировки удаляются"""
+
+    def __init__(self):
+        self._locks = {}  # ключ -> [блокировка, сколько задач ее держат или ждут]
+
+    @asynccontextmanager
+    async def hold(self, keys):
+        # Единый порядок захвата исключает взаимные блокировки
+        acquired = []
+        try:
+            for key in sorted(set(keys), key=repr):
+                entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+                entry[1] += 1
+                try:
+                    await entry[0].acquire()
+                except BaseException:
+                    self._release(key, locked=False)
+                    raise
+                acquired.append(key)
+            yield
+        finally:
+            for key in reversed(acquired):
+                self._release(key)
+
+    def _release(self, key, locked=True):
+        entry = self._locks[key]
+        if locked:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+def update_lock_keys(update, user_data=None):
+    """
+    Ключи, по которым обновление должно выполняться строго последовательно.
+    user_data - user_data приложения: по нему видно, ждет ли бот от пользователя номер стола
+    """
+    keys = []
+    if update.effective_chat:
+        keys.append(('chat', update.effective_chat.id))
+    elif update.effective_user:
+        keys.append(('user', update.effective_user.id))
+
+    if update.callback_query and update.callback_query.data:
+        match = ORDER_CALLBACK_PATTERN.match(update.callback_query.data)
+        if match:
+            keys.append(('order', int(match.group(1))))
+    elif update.message and update.message.text and update.effective_user and user_data:
+        # Номер стола при создании заказа: два админа не должны открыть заказ на один стол одновременно.
+        # Остальные числовые сообщения стол не блокируют
+        text = update.message.text.strip()
+        expecting = user_data.get(update.effective_user.id, {}).get('expecting_table_number')
+        if expecting and text.isdigit():
+            keys.append(('table', int(text)))
+
+    return keys
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обновления разных чатов обрабатываются параллельно (не больше max_concurrent_updates),
+    обновления одного чата, одного заказа или одного стола - по очереди
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = KeyedLocks()
+        # user_data приложения, задается после сборки Application
+        self.user_data = None
+
+    async def process_update(self, update, coroutine):
+        if not hasattr(update, 'effective_chat'):
+            # Не Update (например, произвольные данные в очереди) - порядок не важен
+            await super().process_update(update, coroutine)
+            return
+
+        # Сначала блокировки, потом слот семафора: обновления, ждущие своей очереди в чате,
+        # не занимают слоты и не задерживают другие чаты
+        async with self._locks.hold(update_lock_keys(update, self.user_data)):
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass